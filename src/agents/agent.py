@@ -363,6 +363,15 @@ class Agent:
             pushover_feedback = str(metadata["feedback"]) + " --- " + "task_completion_accuracy=%r" % task_completion_accuracy
             pushover_logger.log(pushover_feedback)
 
+    def _enable_instruction_cache(self, instructions):
+        """ Cache the embeddings of instructions while testing, starting with the given instructions """
+        if isinstance(self.model, AbstractIncrementalModel):
+            self.model.enable_instruction_cache(instructions)
+
+    def _disable_instruction_cache(self):
+        if isinstance(self.model, AbstractIncrementalModel):
+            self.model.disable_instruction_cache()
+
     def _test(self, data_point, tensorboard=None):
 
         image, metadata = self.server.reset_receive_feedback(data_point)
@@ -454,40 +463,46 @@ class Agent:
         single_completion_accuracy = 0
         single_distance_regression = 0
 
+        self._enable_instruction_cache([data_point.instruction for tup_data_point in test_dataset
+                                        for data_point in tup_data_point[:2]])
+
         metadata = {"feedback": ""}
         data_point_ix = 0
-        for data_point_ix, tup_data_point in enumerate(test_dataset):
-
-            # The two minimal linguistic pairs
-            data_point1 = tup_data_point[0]
-            data_point2 = tup_data_point[1]
-
-            metadata1, _ = self._test(data_point1, tensorboard)
-            metadata2, _ = self._test(data_point2, tensorboard)
-            metadata = metadata2  # Last metadata
-
-            if metadata1["stop_dist_error"] < 5.0:
-                single_completion_accuracy += 1
-            if metadata2["stop_dist_error"] < 5.0:
-                single_completion_accuracy += 1
-
-            if metadata1["stop_dist_error"] < 5.0 and metadata2["stop_dist_error"] < 5.0:
-                task_completion_accuracy += 1
-            task_bennett_metric += self.bennett_metric(data_point1, data_point2, metadata1, metadata2)
-
-            single_distance_regression += metadata1["stop_dist_error"] + metadata2["stop_dist_error"]
-
-            if (data_point_ix + 1) % 100 == 0:  # print intermediate results
-                self.log("Results after %r " % (data_point_ix + 1), logger)
-                temp_task_completion_accuracy = (task_completion_accuracy * 100.0) / float(data_point_ix + 1)
-                temp_task_bennett_metric = (task_bennett_metric * 100.0) / float(data_point_ix + 1)
-                temp_single_completion_accuracy = (single_completion_accuracy * 100.0) / (2.0 * float(data_point_ix + 1))
-                temp_single_distance_regression = single_distance_regression / (2.0 * float(data_point_ix + 1))
-                self.log("Testing: Minimal Linguistic Pair Task completion accuracy is: %r"
-                         % temp_task_completion_accuracy, logger)
-                self.log("Testing: Minimal Linguistic Pair Bennett Metric is: %r" % temp_task_bennett_metric, logger)
-                self.log("Testing: Single completion accuracy is: %r" % temp_single_completion_accuracy, logger)
-                self.log("Testing: Single distance regression accuracy is: %r" % temp_single_distance_regression, logger)
+        try:
+            for data_point_ix, tup_data_point in enumerate(test_dataset):
+
+                # The two minimal linguistic pairs
+                data_point1 = tup_data_point[0]
+                data_point2 = tup_data_point[1]
+
+                metadata1, _ = self._test(data_point1, tensorboard)
+                metadata2, _ = self._test(data_point2, tensorboard)
+                metadata = metadata2  # Last metadata
+
+                if metadata1["stop_dist_error"] < 5.0:
+                    single_completion_accuracy += 1
+                if metadata2["stop_dist_error"] < 5.0:
+                    single_completion_accuracy += 1
+
+                if metadata1["stop_dist_error"] < 5.0 and metadata2["stop_dist_error"] < 5.0:
+                    task_completion_accuracy += 1
+                task_bennett_metric += self.bennett_metric(data_point1, data_point2, metadata1, metadata2)
+
+                single_distance_regression += metadata1["stop_dist_error"] + metadata2["stop_dist_error"]
+
+                if (data_point_ix + 1) % 100 == 0:  # print intermediate results
+                    self.log("Results after %r " % (data_point_ix + 1), logger)
+                    temp_task_completion_accuracy = (task_completion_accuracy * 100.0) / float(data_point_ix + 1)
+                    temp_task_bennett_metric = (task_bennett_metric * 100.0) / float(data_point_ix + 1)
+                    temp_single_completion_accuracy = (single_completion_accuracy * 100.0) / (2.0 * float(data_point_ix + 1))
+                    temp_single_distance_regression = single_distance_regression / (2.0 * float(data_point_ix + 1))
+                    self.log("Testing: Minimal Linguistic Pair Task completion accuracy is: %r"
+                             % temp_task_completion_accuracy, logger)
+                    self.log("Testing: Minimal Linguistic Pair Bennett Metric is: %r" % temp_task_bennett_metric, logger)
+                    self.log("Testing: Single completion accuracy is: %r" % temp_single_completion_accuracy, logger)
+                    self.log("Testing: Single distance regression accuracy is: %r" % temp_single_distance_regression, logger)
+        finally:
+            self._disable_instruction_cache()
 
         dataset_size = data_point_ix + 1
         task_completion_accuracy = (task_completion_accuracy * 100.0) / float(max(dataset_size, 1))
@@ -514,17 +529,20 @@ class Agent:
         self.server.clear_metadata()
         action_counts = [0] * self.action_space.num_actions()
         task_completion_accuracy = 0
+        self._enable_instruction_cache([data_point.instruction for data_point in test_dataset])
 
         metadata = {"feedback": ""}
-        for data_point_ix, data_point in enumerate(test_dataset):
-            metadata, actions_taken = self._test(data_point, tensorboard)
+        try:
+            for data_point_ix, data_point in enumerate(test_dataset):
+                metadata, actions_taken = self._test(data_point, tensorboard)
 
-            if metadata["stop_dist_error"] < 5.0:
-                task_completion_accuracy += 1
-
-            for action in actions_taken:
-                action_counts[action] += 1
+                if metadata["stop_dist_error"] < 5.0:
+                    task_completion_accuracy += 1
 
+                for action in actions_taken:
+                    action_counts[action] += 1
+        finally:
+            self._disable_instruction_cache()
         task_completion_accuracy = (task_completion_accuracy * 100.0) / float(max(len(test_dataset), 1))
         self.log("Overall test results:", logger)
         self.log("Testing: Task completion accuracy is: %r" % task_completion_accuracy, logger)
@@ -549,88 +567,97 @@ class Agent:
 
         task_completion_accuracy = 0
 
-        for data_point in test_dataset:
-            if segmenting_type == "auto":
-                segmented_instruction = data_point.get_instruction_auto_segmented()
-            else:
-                segmented_instruction = data_point.get_instruction_oracle_segmented()
+        if segmenting_type == "auto":
+            segmented_instructions = [data_point.get_instruction_auto_segmented() for data_point in test_dataset]
+        else:
+            segmented_instructions = [data_point.get_instruction_oracle_segmented() for data_point in test_dataset]
+        self._enable_instruction_cache([instruction for segmented_instruction in segmented_instructions
+                                        for instruction in segmented_instruction])
+
+        try:
+            for data_point in test_dataset:
+                if segmenting_type == "auto":
+                    segmented_instruction = data_point.get_instruction_auto_segmented()
+                else:
+                    segmented_instruction = data_point.get_instruction_oracle_segmented()
 
-            max_num_actions = self.constants["horizon"]
-            image, metadata = self.server.reset_receive_feedback(data_point)
+                max_num_actions = self.constants["horizon"]
+                image, metadata = self.server.reset_receive_feedback(data_point)
 
-            for instruction_i, instruction in enumerate(segmented_instruction):
+                for instruction_i, instruction in enumerate(segmented_instruction):
 
-                pose = int(metadata["y_angle"] / 15.0)
-                position_orientation = (metadata["x_pos"], metadata["z_pos"],
-                                        metadata["y_angle"])
-                state = AgentObservedState(instruction=instruction,
-                                           config=self.config,
-                                           constants=self.constants,
-                                           start_image=image,
-                                           previous_action=None,
-                                           pose=pose,
-                                           position_orientation=position_orientation,
-                                           data_point=data_point,
-                                           prev_instruction=data_point.get_prev_instruction(),
-                                           next_instruction=data_point.get_next_instruction())
-
-                # Reset the actions taken and model state
-                num_actions = 0
-                model_state = None
-
-                while True:
-
-                    # Generate probabilities over actions
-                    if isinstance(self.model, AbstractModel):
-                        probabilities = list(torch.exp(self.model.get_probs(state).data))
-                    elif isinstance(self.model, AbstractIncrementalModel):
-                        log_probabilities, model_state, _, _ = self.model.get_probs(state, model_state, volatile=True)
-                        probabilities = list(torch.exp(log_probabilities.data))[0]
-                    else:
-                        raise AssertionError("Unhandled Model type.")
-
-                    # Use test policy to get the action
-                    action = self.test_policy(probabilities)
-                    action_counts[action] += 1
+                    pose = int(metadata["y_angle"] / 15.0)
+                    position_orientation = (metadata["x_pos"], metadata["z_pos"],
+                                            metadata["y_angle"])
+                    state = AgentObservedState(instruction=instruction,
+                                               config=self.config,
+                                               constants=self.constants,
+                                               start_image=image,
+                                               previous_action=None,
+                                               pose=pose,
+                                               position_orientation=position_orientation,
+                                               data_point=data_point,
+                                               prev_instruction=data_point.get_prev_instruction(),
+                                               next_instruction=data_point.get_next_instruction())
+
+                    # Reset the actions taken and model state
+                    num_actions = 0
+                    model_state = None
+
+                    while True:
+
+                        # Generate probabilities over actions
+                        if isinstance(self.model, AbstractModel):
+                            probabilities = list(torch.exp(self.model.get_probs(state).data))
+                        elif isinstance(self.model, AbstractIncrementalModel):
+                            log_probabilities, model_state, _, _ = self.model.get_probs(state, model_state, volatile=True)
+                            probabilities = list(torch.exp(log_probabilities.data))[0]
+                        else:
+                            raise AssertionError("Unhandled Model type.")
+
+                        # Use test policy to get the action
+                        action = self.test_policy(probabilities)
+                        action_counts[action] += 1
+
+                        if action == self.action_space.get_stop_action_index() or num_actions >= max_num_actions:
+                            # Compute the l2 distance
+
+                            intermediate_goal = data_point.get_destination_list()[instruction_i]
+                            agent_position = metadata["x_pos"], metadata["z_pos"]
+                            distance = self._l2_distance(agent_position, intermediate_goal)
+                            # logging.info("Agent: Position %r got Distance %r " % (instruction_i + 1, distance))
+                            # self.log("Agent: Position %r got Distance %r " % (instruction_i + 1, distance), logger)
+                            break
+
+                        else:
+                            # Send the action and get feedback
+                            image, reward, metadata = self.server.send_action_receive_feedback(action)
+
+                            # Update the agent state
+                            pose = int(metadata["y_angle"] / 15.0)
+                            position_orientation = (metadata["x_pos"],
+                                                    metadata["z_pos"],
+                                                    metadata["y_angle"])
+                            state = state.update(
+                                image, action, pose=pose,
+                                position_orientation=position_orientation,
+                                data_point=data_point)
+                            num_actions += 1
 
-                    if action == self.action_space.get_stop_action_index() or num_actions >= max_num_actions:
-                        # Compute the l2 distance
-
-                        intermediate_goal = data_point.get_destination_list()[instruction_i]
-                        agent_position = metadata["x_pos"], metadata["z_pos"]
-                        distance = self._l2_distance(agent_position, intermediate_goal)
-                        # logging.info("Agent: Position %r got Distance %r " % (instruction_i + 1, distance))
-                        # self.log("Agent: Position %r got Distance %r " % (instruction_i + 1, distance), logger)
-                        break
-
-                    else:
-                        # Send the action and get feedback
-                        image, reward, metadata = self.server.send_action_receive_feedback(action)
-
-                        # Update the agent state
-                        pose = int(metadata["y_angle"] / 15.0)
-                        position_orientation = (metadata["x_pos"],
-                                                metadata["z_pos"],
-                                                metadata["y_angle"])
-                        state = state.update(
-                            image, action, pose=pose,
-                            position_orientation=position_orientation,
-                            data_point=data_point)
-                        num_actions += 1
-
-            image, reward, metadata = self.server.halt_and_receive_feedback()
-            if tensorboard is not None:
-                tensorboard.log_all_test_errors(
-                    metadata["edit_dist_error"],
-                    metadata["closest_dist_error"],
-                    metadata["stop_dist_error"])
-
-            # Update the scores based on meta_data
-            self.meta_data_util.log_results(metadata)
-
-            if metadata["stop_dist_error"] < 5.0:
-                task_completion_accuracy += 1
+                image, reward, metadata = self.server.halt_and_receive_feedback()
+                if tensorboard is not None:
+                    tensorboard.log_all_test_errors(
+                        metadata["edit_dist_error"],
+                        metadata["closest_dist_error"],
+                        metadata["stop_dist_error"])
+
+                # Update the scores based on meta_data
+                self.meta_data_util.log_results(metadata)
 
+                if metadata["stop_dist_error"] < 5.0:
+                    task_completion_accuracy += 1
+        finally:
+            self._disable_instruction_cache()
         logging.info("Testing data action counts %r", action_counts)
         task_completion_accuracy = (task_completion_accuracy * 100.0) / float(max(len(test_dataset), 1))
         self.log("Overall test results:", logger)
@@ -1,7 +1,47 @@
-import collections
+import copy
 import numpy as np
 
 
+class EpisodeImageBuffer:
+    """ Preallocated array of all the images seen in an episode. Successive agent observed states share
+    the buffer and only store the number of images that had been appended when they were created.
+    Appending from a state which is not the latest one copies its last max_num_images images into a
+    new buffer (copy-on-write) so that states already created are never modified. """
+
+    def __init__(self, max_num_images, image_shape, dtype):
+        self.max_num_images = max_num_images
+        # The first max_num_images entries are zero images used for padding
+        self.images = np.zeros((2 * max_num_images,) + tuple(image_shape), dtype=dtype)
+        self.size = 0
+
+    def append(self, end, image):
+        """ Append image after the first end images. Returns the buffer holding the result and its new end. """
+
+        if end != self.size:
+            # Branching from an older state. Copy its window into a new buffer.
+            buffer = EpisodeImageBuffer(self.max_num_images, self.images.shape[1:], self.images.dtype)
+            buffer.images[:self.max_num_images] = self.window(end)
+            return buffer.append(0, image)
+
+        ix = self.max_num_images + self.size
+        if ix == self.images.shape[0]:
+            # Double the capacity
+            images = np.zeros((2 * self.images.shape[0],) + self.images.shape[1:], dtype=self.images.dtype)
+            images[:ix] = self.images
+            self.images = images
+        self.images[ix] = image
+        self.size += 1
+
+        return self, self.size
+
+    def window(self, end):
+        """ View over the last max_num_images images (including padding) before end """
+        return self.images[end: end + self.max_num_images]
+
+    def last(self, end):
+        return self.images[end + self.max_num_images - 1]
+
+
 class AgentObservedState:
     """ Observed state used by the agent to make decisions """
 
@@ -16,10 +56,14 @@ class AgentObservedState:
         self.goal_image = goal_image
         self.max_num_images = constants["max_num_images"]
 
-        empty_image = np.zeros((3, config["image_height"], config["image_width"]))
-        padding_images = [empty_image] * constants["max_num_images"]
-
-        self.image_memory = collections.deque(padding_images, constants["max_num_images"])
+        # Images are stored in a buffer shared by all the states of the episode. The state
+        # only remembers how many images of the buffer it has seen.
+        if start_image is not None:
+            image_shape, image_dtype = start_image.shape, start_image.dtype
+        else:
+            image_shape, image_dtype = (3, config["image_height"], config["image_width"]), np.float64
+        self.image_buffer = EpisodeImageBuffer(self.max_num_images, image_shape, image_dtype)
+        self.image_buffer_end = 0
         self.num_images = 0
 
         # Read pointer points to the next token to be read
@@ -32,17 +76,21 @@ class AgentObservedState:
         self.goal = None
         ##################################
         if start_image is not None:
-            self.image_memory.append(start_image)
+            self.image_buffer, self.image_buffer_end = self.image_buffer.append(self.image_buffer_end, start_image)
             self.num_images += 1
 
+    def _clone(self):
+        # Shallow copy shares the image buffer, which is never modified for existing states
+        cloned_state = copy.copy(self)
+        cloned_state.symbolic_instruction = None
+        cloned_state.goal = None
+        return cloned_state
+
     def update(self, new_image, new_action, pose=None,
                position_orientation=None, data_point=None):
-        cloned_state = AgentObservedState(self.instruction,
-                                          self.config,
-                                          self.constants)
-        cloned_state.image_memory = collections.deque(list(self.image_memory),
-                                                      self.max_num_images)
-        cloned_state.image_memory.append(new_image)
+        cloned_state = self._clone()
+        cloned_state.image_buffer, cloned_state.image_buffer_end = \
+            self.image_buffer.append(self.image_buffer_end, new_image)
 
         cloned_state.previous_action = new_action
         cloned_state.num_images = min(self.num_images + 1, self.max_num_images)
@@ -55,11 +103,7 @@ class AgentObservedState:
         return cloned_state
 
     def update_on_read(self):
-        cloned_state = AgentObservedState(self.instruction,
-                                          self.config,
-                                          self.constants)
-        cloned_state.image_memory = collections.deque(list(self.image_memory),
-                                                      self.max_num_images)
+        cloned_state = self._clone()
         cloned_state.previous_action = self.previous_action
         cloned_state.num_images = min(self.num_images + 1, self.max_num_images)
         cloned_state.pose = self.pose
@@ -71,11 +115,7 @@ class AgentObservedState:
         return cloned_state
 
     def update_on_act_halt(self):
-        cloned_state = AgentObservedState(self.instruction,
-                                          self.config,
-                                          self.constants)
-        cloned_state.image_memory = collections.deque(list(self.image_memory),
-                                                      self.max_num_images)
+        cloned_state = self._clone()
         cloned_state.previous_action = self.previous_action
         cloned_state.num_images = min(self.num_images + 1, self.max_num_images)
         cloned_state.pose = self.pose
@@ -89,17 +129,24 @@ class AgentObservedState:
     def get_instruction(self):
         return self.instruction
 
+    def get_read_pointers(self):
+        # The agent always reads the entire instruction
+        return 0, len(self.instruction)
+
     def get_previous_action(self):
         return self.previous_action
 
     def get_image(self):
+        """ Returns the last num_images images followed by padding. Once max_num_images images
+        have been seen this is a view of the episode buffer and must not be modified. """
+        window = self.image_buffer.window(self.image_buffer_end)
         num_zeros = self.max_num_images - self.num_images
-        image_list = list(self.image_memory)[-self.num_images:]
-        image_list.extend(list(self.image_memory)[:num_zeros])
-        return np.array(image_list)
+        if num_zeros == 0:
+            return window
+        return np.concatenate([window[num_zeros:], window[:num_zeros]])
 
     def get_last_image(self):
-        return self.image_memory[-1]
+        return self.image_buffer.last(self.image_buffer_end)
 
     def get_num_images(self):
         return self.num_images
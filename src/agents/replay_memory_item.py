@@ -1,6 +1,16 @@
+import numpy as np
+import torch
+
+from utils.cuda import cuda_var
+
+
 class ReplayMemoryItem:
     """ Contains the state, the action that was taken in that state and the feedback that the agent gave """
 
+    __slots__ = ("agent_observed_state", "action", "reward", "q_val", "mode", "distance", "all_rewards",
+                 "log_prob", "image_emb_seq", "next_image_emb_seq", "factor_entropy", "text_emb",
+                 "symbolic_text", "goal", "state_feature", "volatile_features")
+
     def __init__(self, agent_observed_state, action, reward,
                  mode=None, distance=None, all_rewards=None,
                  log_prob=None, image_emb_seq=None, factor_entropy=None, text_emb=None,
@@ -72,3 +82,79 @@ class ReplayMemoryItem:
 
     def get_volatile_features(self):
         return self.volatile_features
+
+
+class ReplayBatch:
+    """ List of replay memory items which also stores the actions, rewards and log-probabilities
+    column-wise as items are appended, so that a learner can get them as tensors without
+    looping over the items. Iterating over the batch gives the replay memory items.
+
+    Items without an action (e.g., for goal prediction) are stored with the action NO_ACTION, and the
+    action batch can only be taken when every item has an action. """
+
+    NO_ACTION = -1
+
+    def __init__(self, capacity=32):
+        self.items = []
+        self.actions = np.full(capacity, ReplayBatch.NO_ACTION, dtype=np.int64)
+        self.num_no_action = 0
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.log_probs = []
+        self.log_prob_batch = None
+
+    @staticmethod
+    def from_items(batch_replay_items):
+        """ Returns a replay batch for the given list of replay memory items (or the batch itself) """
+        if isinstance(batch_replay_items, ReplayBatch):
+            return batch_replay_items
+        batch = ReplayBatch(max(len(batch_replay_items), 1))
+        for replay_item in batch_replay_items:
+            batch.append(replay_item)
+        return batch
+
+    def append(self, replay_item):
+        size = len(self.items)
+        if size == self.actions.shape[0]:
+            self.actions = np.concatenate([self.actions, np.full_like(self.actions, ReplayBatch.NO_ACTION)])
+            self.rewards = np.concatenate([self.rewards, np.zeros_like(self.rewards)])
+
+        if replay_item.action is None:
+            self.num_no_action += 1
+        else:
+            self.actions[size] = replay_item.action
+        self.rewards[size] = replay_item.reward
+        self.log_probs.append(replay_item.log_prob)
+        self.log_prob_batch = None
+        self.items.append(replay_item)
+
+    def extend(self, batch_replay_items):
+        for replay_item in batch_replay_items:
+            self.append(replay_item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, ix):
+        return self.items[ix]
+
+    def get_agent_observed_states(self):
+        return [replay_item.agent_observed_state for replay_item in self.items]
+
+    def get_action_batch(self):
+        """ PyTorch Variable of shape "BatchSize" containing the actions """
+        if self.num_no_action > 0:
+            raise AssertionError("%d of the %d replay items have no action" % (self.num_no_action, len(self.items)))
+        return cuda_var(torch.from_numpy(self.actions[:len(self.items)]))
+
+    def get_reward_batch(self):
+        """ PyTorch Variable of shape "BatchSize" containing the rewards """
+        return cuda_var(torch.from_numpy(self.rewards[:len(self.items)]))
+
+    def get_log_prob_batch(self):
+        """ Log-probabilities of all items concatenated into shape "BatchSize x NumActions" """
+        if self.log_prob_batch is None:
+            self.log_prob_batch = torch.cat(self.log_probs)
+        return self.log_prob_batch
@@ -0,0 +1,47 @@
+import numpy as np
+import scipy.signal
+import torch
+
+from torch.autograd import Variable
+
+
+def discount(x, gamma):
+    """ Discounted sums y[t] = x[t] + gamma * y[t + 1] of a 1D array, computed by running a linear filter
+    backwards over the array """
+    return scipy.signal.lfilter([1], [1, -gamma], x[::-1])[::-1]
+
+
+def get_returns_and_advantages(rewards, values, bootstrap_value, gamma, tau):
+    """ Discounted returns and generalized advantage estimates of the steps of a rollout. values[t] is the
+    value of the state of step t and bootstrap_value the value of the state following the rollout, which is
+    0 if the episode is over. """
+
+    rewards = np.asarray(rewards, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    returns = discount(np.append(rewards, bootstrap_value), gamma)[:-1]
+    next_values = np.append(values[1:], bootstrap_value)
+    advantages = discount(rewards + gamma * next_values - values, gamma * tau)
+    return returns, advantages
+
+
+def calc_a3c_loss(values, log_probs, entropies, rewards, bootstrap_value, gamma, tau, entropy_coeff,
+                  contextual_bandit=False):
+    """ Policy and value loss of a rollout given the value, the log-probability of the action taken and the
+    entropy of the policy at every step. Both losses are computed with a single batched op over the steps.
+    With contextual_bandit the advantage of an action is its immediate reward. """
+
+    values = torch.cat(values).view(-1)
+    log_probs = torch.cat(log_probs).view(-1)
+    entropies = torch.cat(entropies).view(-1)
+
+    returns, advantages = get_returns_and_advantages(
+        rewards, values.data.cpu().numpy(), bootstrap_value, gamma, tau)
+    if contextual_bandit:
+        # Just focus on immediate reward
+        advantages = np.asarray(rewards, dtype=np.float64)
+    returns = Variable(torch.from_numpy(returns.copy()).type_as(values.data))
+    advantages = Variable(torch.from_numpy(advantages.copy()).type_as(values.data))
+
+    value_loss = 0.5 * (returns - values).pow(2).sum()
+    policy_loss = -(log_probs * advantages).sum() - entropy_coeff * entropies.sum()
+    return policy_loss, value_loss
@@ -0,0 +1,108 @@
+import multiprocessing
+import numpy as np
+import torch
+
+from torch.autograd import Variable
+
+
+class BaselineDevice:
+    """ Device on which a Chaplot baseline runs. The models, the hidden states and the inputs live on the GPU
+    if use_cuda and on the CPU otherwise, so the baselines also run on nodes without a GPU.
+
+    On the CPU every worker process runs its operators with num_threads threads. By default the cores of
+    the node are split evenly between the worker processes so that they do not oversubscribe the node. """
+
+    CUDA, CPU = "cuda", "cpu"
+
+    def __init__(self, use_cuda, num_threads=1):
+        self.use_cuda = use_cuda
+        self.num_threads = num_threads
+
+    @staticmethod
+    def from_args(args, num_workers=None):
+        """ Device given by the --device and --num-threads arguments. A device of None uses the GPU if
+        there is one and a num_threads of None splits the cores between the workers, of which there are
+        args.num_processes unless num_workers is given. """
+
+        if args.device is None:
+            use_cuda = torch.cuda.is_available()
+        else:
+            use_cuda = args.device == BaselineDevice.CUDA
+            assert not use_cuda or torch.cuda.is_available(), "CUDA is not available"
+        if num_workers is None:
+            num_workers = args.num_processes
+        if args.num_threads is None:
+            num_threads = max(1, multiprocessing.cpu_count() // max(1, num_workers))
+        else:
+            num_threads = args.num_threads
+        return BaselineDevice(use_cuda, num_threads)
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument('--device', type=str, default=None, choices=[BaselineDevice.CUDA, BaselineDevice.CPU],
+                            help='device to run the baseline on (default: cuda if available)')
+        parser.add_argument('--num-threads', type=int, default=None,
+                            help='threads of every worker process on the cpu (default: cores / num-processes)')
+
+    def init_worker(self):
+        """ Must be called at the start of every worker process """
+        if not self.use_cuda:
+            torch.set_num_threads(self.num_threads)
+
+    def model(self, model):
+        if self.use_cuda:
+            model.cuda()
+        return model
+
+    def tensor(self, t):
+        if self.use_cuda:
+            return t.cuda()
+        return t
+
+    def var(self, t, volatile=False):
+        return Variable(self.tensor(t), volatile=volatile)
+
+    def zeros(self, *size):
+        return self.tensor(torch.zeros(*size))
+
+    def load(self, file_name):
+        if self.use_cuda:
+            return torch.load(file_name)
+        return torch.load(file_name, map_location=lambda storage, loc: storage)
+
+
+class StepInputs:
+    """ Inputs of the steps of an agent, kept on the device in preallocated tensors. The image and the time
+    step are copied into the same tensors at every step and an instruction is only moved to the device
+    when it changes.
+
+    Since the tensors are overwritten at every step, they must only be used for inference: training must
+    create new inputs at every step, as autograd keeps the inputs of the steps until backward. """
+
+    def __init__(self, device):
+        self.device = device
+        self.image = None
+        self.time = device.tensor(torch.LongTensor(1))
+        self.instructions = dict()
+
+    def image_var(self, image):
+        """ Volatile variable of the image with a batch dimension """
+        image = torch.from_numpy(np.ascontiguousarray(image))
+        if self.image is None or self.image.size() != image.size():
+            self.image = self.device.tensor(torch.FloatTensor(*image.size()))
+        self.image.copy_(image)
+        return Variable(self.image.unsqueeze(0), volatile=True)
+
+    def time_var(self, episode_length):
+        self.time.fill_(episode_length)
+        return Variable(self.time, volatile=True)
+
+    def instruction_var(self, name, instruction):
+        """ Volatile variable of the tokens of the instruction, of shape 1 x length. Name tells the
+        instructions given at the same time apart, e.g. current, previous and next instruction. """
+        cached = self.instructions.get(name)
+        if cached is None or cached[0] != instruction:
+            tensor = self.device.tensor(torch.from_numpy(np.array(instruction)).view(1, -1))
+            cached = (list(instruction), tensor)
+            self.instructions[name] = cached
+        return Variable(cached[1], volatile=True)
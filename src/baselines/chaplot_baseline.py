@@ -16,6 +16,8 @@ from models.incremental_model.abstract_incremental_model import AbstractIncremen
 
 
 from models import *
+from baselines.a3c_loss import calc_a3c_loss
+from baselines.baseline_device import BaselineDevice, StepInputs
 from torch.autograd import Variable
 
 
@@ -33,9 +35,11 @@ class ChaplotBaseline(object):
         # args = self.gather_args(config)
         self.args = args
 
-        if torch.cuda.is_available():
-            local_model.cuda()
-        self.local_model = local_model
+        self.device = BaselineDevice.from_args(args, num_workers=1)
+        self.device.init_worker()
+        self.local_model = self.device.model(local_model)
+        # Inputs of get_probs
+        self.step_inputs = StepInputs(self.device)
 
         self.config = config
         self.constants = constants
@@ -77,7 +81,6 @@ class ChaplotBaseline(object):
 
         # self.shared_model.eval()
 
-        image = torch.from_numpy(state.get_last_image()).float()
         curr_instr = state.get_instruction()
         prev_instr = state.get_prev_instruction()
         if prev_instr is None:
@@ -86,28 +89,22 @@ class ChaplotBaseline(object):
         if next_instr is None:
             next_instr = [self.config["vocab_size"] + 1]
 
-        curr_instruction_idx = torch.from_numpy(np.array(curr_instr)).view(1,-1)
-        prev_instruction_idx = torch.from_numpy(np.array(prev_instr)).view(1,-1)
-        next_instruction_idx = torch.from_numpy(np.array(next_instr)).view(1,-1)
-
         if model_state is None:
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
+            cx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
+            hx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
             cached_computation = None
             episode_length = 1
         else:
+            # Hidden states stay on the device between steps
             (hx, cx, episode_length, cached_computation) = model_state
-            hx = Variable(hx.data.cuda(), volatile=True)
-            cx = Variable(cx.data.cuda(), volatile=True)
 
-        tx = Variable(torch.from_numpy(np.array([episode_length])).long(),
-                      volatile=True).cuda()
+        tx = self.step_inputs.time_var(episode_length)
 
         value, logit, (hx, cx), cached_computation = self.local_model(
-            (Variable(image.unsqueeze(0).cuda(), volatile=True),
-             Variable(curr_instruction_idx.cuda(), volatile=True),
-             Variable(prev_instruction_idx.cuda(), volatile=True),
-             Variable(next_instruction_idx.cuda(), volatile=True),
+            (self.step_inputs.image_var(state.get_last_image()),
+             self.step_inputs.instruction_var("curr", curr_instr),
+             self.step_inputs.instruction_var("prev", prev_instr),
+             self.step_inputs.instruction_var("next", next_instr),
              (tx, hx, cx)), cached_computation)
 
         log_prob = F.log_softmax(logit)[0]
@@ -117,6 +114,7 @@ class ChaplotBaseline(object):
     def do_train(self, agent, train_dataset, tune_dataset, experiment_name):
 
         # torch.manual_seed(args.seed + rank)
+        device = self.device
 
         # env = grounding_env.GroundingEnv(args)
         # env.game_init()
@@ -150,9 +148,9 @@ class ChaplotBaseline(object):
         next_instruction_idx = np.array(next_instr)
 
         image = torch.from_numpy(image).float()
-        curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-        prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-        next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+        curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+        prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+        next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
         done = True
 
@@ -163,13 +161,13 @@ class ChaplotBaseline(object):
             # model.load_state_dict(shared_model.state_dict())
             if done:
                 episode_length = 0
-                cx = Variable(torch.zeros(1, self.lstm_size).cuda())
-                hx = Variable(torch.zeros(1, self.lstm_size).cuda())
+                cx = device.var(torch.zeros(1, self.lstm_size))
+                hx = device.var(torch.zeros(1, self.lstm_size))
 
             else:
                 # assert False, "Assertion put by Max and Dipendra. Code shouldn't reach here."
-                cx = Variable(cx.data.cuda())
-                hx = Variable(hx.data.cuda())
+                cx = Variable(cx.data)
+                hx = Variable(hx.data)
 
             values = []
             log_probs = []
@@ -178,13 +176,13 @@ class ChaplotBaseline(object):
 
             for step in range(self.args.num_steps):
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
-                value, logit, (hx, cx) = self.local_model((Variable(
-                                                image.unsqueeze(0).cuda()),
-                                                Variable(curr_instruction_idx.cuda()),
-                                                Variable(prev_instruction_idx.cuda()),
-                                                Variable(next_instruction_idx.cuda()),
+                value, logit, (hx, cx) = self.local_model((device.var(
+                                                image.unsqueeze(0)),
+                                                Variable(curr_instruction_idx),
+                                                Variable(prev_instruction_idx),
+                                                Variable(next_instruction_idx),
                                                 (tx, hx, cx)))
 
                 prob = F.softmax(logit)
@@ -193,7 +191,7 @@ class ChaplotBaseline(object):
                 entropies.append(entropy)
 
                 action = prob.multinomial().data
-                log_prob = log_prob.gather(1, Variable(action.cuda()))
+                log_prob = log_prob.gather(1, Variable(action))
                 action = action.cpu().numpy()[0, 0]
 
                 (image, _), reward, done, _ = env.step(action)
@@ -213,9 +211,9 @@ class ChaplotBaseline(object):
                     curr_instruction_idx = np.array(curr_instr)
                     prev_instruction_idx = np.array(prev_instr)
                     next_instruction_idx = np.array(next_instr)
-                    curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-                    prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-                    next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+                    curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+                    prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+                    next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
                 image = torch.from_numpy(image).float()
 
@@ -232,44 +230,24 @@ class ChaplotBaseline(object):
             mean_entropy = sum(entropies).data[0]/float(max(episode_length, 1))
             self.tensorboard.log_scalar("Chaplot_Baseline_Entropy", mean_entropy)
 
-            R = torch.zeros(1, 1)
+            bootstrap_value = 0.0
             if not done:
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
                 value, _, _ = self.local_model((
-                    Variable(image.unsqueeze(0).cuda()),
-                    Variable(curr_instruction_idx.cuda()),
-                    Variable(prev_instruction_idx.cuda()),
-                    Variable(next_instruction_idx.cuda()),
+                    device.var(image.unsqueeze(0)),
+                    Variable(curr_instruction_idx),
+                    Variable(prev_instruction_idx),
+                    Variable(next_instruction_idx),
                     (tx, hx, cx)))
-                R = value.data
+                bootstrap_value = value.data[0, 0]
 
-            values.append(Variable(R.cuda()))
-            policy_loss = 0
-            value_loss = 0
-            R = Variable(R.cuda())
-
-            gae = torch.zeros(1, 1).cuda()
-            for i in reversed(range(len(rewards))):
-                R = self.args.gamma * R + rewards[i]
-                advantage = R - values[i]
-                value_loss = value_loss + 0.5 * advantage.pow(2)
-
-                if self.contextual_bandit:
-                    # Just focus on immediate reward
-                    gae = torch.from_numpy(np.array([[rewards[i]]])).float()
-                else:
-                    # Generalized Advantage Estimataion
-                    delta_t = rewards[i] + self.args.gamma * \
-                              values[i + 1].data - values[i].data
-                    gae = gae * self.args.gamma * self.args.tau + delta_t
-
-                policy_loss = policy_loss - \
-                              log_probs[i] * Variable(gae.cuda()) - 0.01 * entropies[i]
+            policy_loss, value_loss = calc_a3c_loss(values, log_probs, entropies, rewards, bootstrap_value,
+                                                    self.args.gamma, self.args.tau, 0.01, self.contextual_bandit)
 
             optimizer.zero_grad()
 
-            p_losses.append(policy_loss.data[0, 0])
-            v_losses.append(value_loss.data[0, 0])
+            p_losses.append(policy_loss.data[0])
+            v_losses.append(value_loss.data[0])
 
             if (len(p_losses) > 1000):
                 num_iters += 1
@@ -295,6 +273,7 @@ class ChaplotBaseline(object):
     def do_supervised_train(self, agent, train_dataset, tune_dataset, experiment_name):
 
         # torch.manual_seed(args.seed + rank)
+        device = self.device
 
         # env = grounding_env.GroundingEnv(args)
         # env.game_init()
@@ -332,16 +311,16 @@ class ChaplotBaseline(object):
             next_instruction_idx = np.array(next_instr)
 
             image = torch.from_numpy(image).float()
-            curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-            prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-            next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+            curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+            prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+            next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
 
             # Sync with the shared model
             # model.load_state_dict(shared_model.state_dict())
             episode_length = 0
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda())
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda())
+            cx = device.var(torch.zeros(1, self.lstm_size))
+            hx = device.var(torch.zeros(1, self.lstm_size))
 
             log_probs = []
             rewards = []
@@ -353,12 +332,12 @@ class ChaplotBaseline(object):
 
             for action in trajectory:
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
-                value, logit, (hx, cx) = self.local_model((Variable(image.unsqueeze(0).cuda()),
-                                                            Variable(curr_instruction_idx.cuda()),
-                                                            Variable(prev_instruction_idx.cuda()),
-                                                            Variable(next_instruction_idx.cuda()),
+                value, logit, (hx, cx) = self.local_model((device.var(image.unsqueeze(0)),
+                                                            Variable(curr_instruction_idx),
+                                                            Variable(prev_instruction_idx),
+                                                            Variable(next_instruction_idx),
                                                             (tx, hx, cx)))
 
                 prob = F.softmax(logit)
@@ -367,7 +346,7 @@ class ChaplotBaseline(object):
                 entropies.append(entropy)
 
                 action_tensor = torch.from_numpy(np.array([[action]]))
-                log_prob = log_prob.gather(1, Variable(action_tensor.cuda()))
+                log_prob = log_prob.gather(1, device.var(action_tensor))
                 (image, _), reward, done, _ = env.step(action)
                 image = torch.from_numpy(image).float()
                 # logging.info("Train: Took action %r, with prob %r, got reward %r",
@@ -415,12 +394,8 @@ class ChaplotBaseline(object):
             optimizer.step()
 
     def load_saved_model(self, load_dir):
-        if torch.cuda.is_available():
-            torch_load = torch.load
-        else:
-            torch_load = lambda f_: torch.load(f_, map_location=lambda s_, l_: s_)
         chaplot_module_path = os.path.join(load_dir, "chaplot_model.bin")
-        self.local_model.load_state_dict(torch_load(chaplot_module_path))
+        self.local_model.load_state_dict(self.device.load(chaplot_module_path))
 
 #####################################################################################################################
 #####################################################################################################################
@@ -11,6 +11,8 @@ from utils.tensorboard import Tensorboard
 from agents.replay_memory_item import ReplayMemoryItem
 from agents.agent_observed_state import AgentObservedState
 from agents.tmp_house_agent import TmpHouseAgent
+from baselines.a3c_loss import calc_a3c_loss
+from baselines.baseline_device import BaselineDevice, StepInputs
 from torch.autograd import Variable
 
 
@@ -20,8 +22,10 @@ class ChaplotBaselineHouse(object):
     def __init__(self, args, shared_model, config, constants, tensorboard, use_contextual_bandit=False, lstm_size=256):
         self.args = args
         self.shared_model = shared_model
-        if torch.cuda.is_available():
-            shared_model.cuda()
+        self.device = BaselineDevice.from_args(args)
+        self.device.model(shared_model)
+        # Inputs of get_probs, created in the process which runs the agent
+        self.step_inputs = None
 
         self.config = config
         self.constants = constants
@@ -31,7 +35,9 @@ class ChaplotBaselineHouse(object):
 
     def get_probs(self, state, model_state):
 
-        image = torch.from_numpy(state.get_last_image().copy()).float()
+        if self.step_inputs is None:
+            self.step_inputs = StepInputs(self.device)
+
         curr_instr = state.get_instruction()
         # prev_instr = state.get_prev_instruction()
         # if prev_instr is None:
@@ -40,28 +46,22 @@ class ChaplotBaselineHouse(object):
         # if next_instr is None:
         #     next_instr = [self.config["vocab_size"] + 1]
 
-        curr_instruction_idx = torch.from_numpy(np.array(curr_instr)).view(1,-1)
-        # prev_instruction_idx = torch.from_numpy(np.array(prev_instr)).view(1,-1)
-        # next_instruction_idx = torch.from_numpy(np.array(next_instr)).view(1,-1)
-
         if model_state is None:
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
+            cx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
+            hx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
             cached_computation = None
             episode_length = 1
         else:
+            # Hidden states stay on the device between steps
             (hx, cx, episode_length, cached_computation) = model_state
-            hx = Variable(hx.data.cuda(), volatile=True)
-            cx = Variable(cx.data.cuda(), volatile=True)
 
-        tx = Variable(torch.from_numpy(np.array([episode_length])).long(),
-                      volatile=True).cuda()
+        tx = self.step_inputs.time_var(episode_length)
 
         value, logit, (hx, cx), cached_computation = self.shared_model(
-            (Variable(image.unsqueeze(0).cuda(), volatile=True),
-             Variable(curr_instruction_idx.cuda(), volatile=True),
-             # Variable(prev_instruction_idx.cuda(), volatile=True),
-             # Variable(next_instruction_idx.cuda(), volatile=True),
+            (self.step_inputs.image_var(state.get_last_image()),
+             self.step_inputs.instruction_var("curr", curr_instr),
+             # self.step_inputs.instruction_var("prev", prev_instr),
+             # self.step_inputs.instruction_var("next", next_instr),
              (tx, hx, cx)), cached_computation)
 
         log_prob = F.log_softmax(logit)[0]
@@ -73,6 +73,8 @@ class ChaplotBaselineHouse(object):
                 test_dataset, experiment_name, rank, server, logger):
 
         # torch.manual_seed(args.seed + rank)
+        device = chaplot_baseline.device
+        device.init_worker()
 
         # Launch the Unity Build
         launch_k_unity_builds([config["port"]], "./house_" + str(house_id) + "_elmer.x86_64",
@@ -111,6 +113,8 @@ class ChaplotBaselineHouse(object):
                  logger, model_type, vocab, args, contextual_bandit, lstm_size):
 
         # torch.manual_seed(args.seed + rank)
+        device = chaplot_baseline.device
+        device.init_worker()
 
         # Launch the Unity Build
         launch_k_unity_builds([config["port"]], "./house_" + str(house_id) + "_elmer.x86_64",
@@ -123,9 +127,7 @@ class ChaplotBaselineHouse(object):
         logger.log("Server Initialized")
 
         # Create a local model for rollouts
-        local_model = model_type(args, action_space=action_space, config=config)
-        if torch.cuda.is_available():
-            local_model.cuda()
+        local_model = device.model(model_type(args, action_space=action_space, config=config))
         chaplot_baseline.shared_model = local_model
         local_model.train()
 
@@ -167,10 +169,10 @@ class ChaplotBaselineHouse(object):
         # prev_instruction_idx = np.array(prev_instr)
         # next_instruction_idx = np.array(next_instr)
 
-        image = torch.from_numpy(image.copy()).float().cuda()
-        curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-        # prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-        # next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+        image = torch.from_numpy(image.copy()).float()
+        curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+        # prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+        # next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
         done = True
         episode_length = 0
@@ -181,13 +183,13 @@ class ChaplotBaselineHouse(object):
             local_model.load_state_dict(shared_model.state_dict())
             if done:
                 episode_length = 0
-                cx = Variable(torch.zeros(1, lstm_size).cuda())
-                hx = Variable(torch.zeros(1, lstm_size).cuda())
+                cx = device.var(torch.zeros(1, lstm_size))
+                hx = device.var(torch.zeros(1, lstm_size))
 
             else:
                 # assert False, "Assertion put by Max and Dipendra. Code shouldn't reach here."
-                cx = Variable(cx.data.cuda())
-                hx = Variable(hx.data.cuda())
+                cx = Variable(cx.data)
+                hx = Variable(hx.data)
 
             values = []
             log_probs = []
@@ -196,12 +198,12 @@ class ChaplotBaselineHouse(object):
 
             for step in range(args.num_steps):
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
-                value, logit, (hx, cx), _ = local_model((Variable(image.unsqueeze(0).cuda()),
-                                                         Variable(curr_instruction_idx.cuda()),
-                                                         # Variable(prev_instruction_idx.cuda()),
-                                                         #  Variable(next_instruction_idx.cuda()),
+                value, logit, (hx, cx), _ = local_model((device.var(image.unsqueeze(0)),
+                                                         Variable(curr_instruction_idx),
+                                                         # Variable(prev_instruction_idx),
+                                                         #  Variable(next_instruction_idx),
                                                          (tx, hx, cx)))
 
                 prob = F.softmax(logit)
@@ -210,7 +212,7 @@ class ChaplotBaselineHouse(object):
                 entropies.append(entropy)
 
                 action = prob.multinomial().data
-                log_prob = log_prob.gather(1, Variable(action.cuda()))
+                log_prob = log_prob.gather(1, Variable(action))
                 action = action.cpu().numpy()[0, 0]
 
                 (image, _), reward, done, _ = env.step(action)
@@ -229,9 +231,9 @@ class ChaplotBaselineHouse(object):
                     curr_instruction_idx = np.array(curr_instr)
                     # prev_instruction_idx = np.array(prev_instr)
                     # next_instruction_idx = np.array(next_instr)
-                    curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-                    # prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-                    # next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+                    curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+                    # prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+                    # next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
                 image = torch.from_numpy(image.copy()).float()
 
@@ -248,44 +250,24 @@ class ChaplotBaselineHouse(object):
                 mean_entropy = sum(entropies).data[0] / float(max(episode_length, 1))
                 tensorboard.log_scalar("Chaplot_Baseline_Entropy", mean_entropy)
 
-            R = torch.zeros(1, 1)
+            bootstrap_value = 0.0
             if not done:
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
                 value, _, _, _ = local_model((
-                    Variable(image.unsqueeze(0).cuda()),
-                    Variable(curr_instruction_idx.cuda()),
-                    # Variable(prev_instruction_idx.cuda()),
-                    # Variable(next_instruction_idx.cuda()),
+                    device.var(image.unsqueeze(0)),
+                    Variable(curr_instruction_idx),
+                    # Variable(prev_instruction_idx),
+                    # Variable(next_instruction_idx),
                     (tx, hx, cx)))
-                R = value.data
-
-            values.append(Variable(R.cuda()))
-            policy_loss = 0
-            value_loss = 0
-            R = Variable(R.cuda())
-
-            gae = torch.zeros(1, 1).cuda()
-            for i in reversed(range(len(rewards))):
-                R = args.gamma * R + rewards[i]
-                advantage = R - values[i]
-                value_loss = value_loss + 0.5 * advantage.pow(2)
-
-                if contextual_bandit:
-                    # Just focus on immediate reward
-                    gae = torch.from_numpy(np.array([[rewards[i]]])).float()
-                else:
-                    # Generalized Advantage Estimataion
-                    delta_t = rewards[i] + args.gamma * \
-                              values[i + 1].data - values[i].data
-                    gae = gae * args.gamma * args.tau + delta_t
+                bootstrap_value = value.data[0, 0]
 
-                policy_loss = policy_loss - \
-                              log_probs[i] * Variable(gae.cuda()) - 0.01 * entropies[i]
+            policy_loss, value_loss = calc_a3c_loss(values, log_probs, entropies, rewards, bootstrap_value,
+                                                    args.gamma, args.tau, 0.01, contextual_bandit)
 
             optimizer.zero_grad()
 
-            p_losses.append(policy_loss.data[0, 0])
-            v_losses.append(value_loss.data[0, 0])
+            p_losses.append(policy_loss.data[0])
+            v_losses.append(value_loss.data[0])
 
             if len(p_losses) > 1000:
                 num_iters += 1
@@ -317,12 +299,8 @@ class ChaplotBaselineHouse(object):
             shared_param._grad = param.grad
 
     def load_saved_model(self, load_dir):
-        if torch.cuda.is_available():
-            torch_load = torch.load
-        else:
-            torch_load = lambda f_: torch.load(f_, map_location=lambda s_, l_: s_)
         chaplot_module_path = os.path.join(load_dir, "chaplot_model.bin")
-        self.shared_model.load_state_dict(torch_load(chaplot_module_path))
+        self.shared_model.load_state_dict(self.device.load(chaplot_module_path))
 
 
 class Client:
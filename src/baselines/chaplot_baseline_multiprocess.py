@@ -8,6 +8,8 @@ import torch.optim as optim
 import utils.generic_policy as gp
 
 from agents.agent import Agent
+from baselines.a3c_loss import calc_a3c_loss
+from baselines.baseline_device import BaselineDevice, StepInputs
 from torch.autograd import Variable
 from utils.launch_unity import launch_k_unity_builds
 from utils.pushover_logger import PushoverLogger
@@ -19,8 +21,10 @@ class ChaplotBaseline(object):
                  use_contextual_bandit=False, lstm_size=256):
         self.args = args
         self.shared_model = shared_model
-        if torch.cuda.is_available():
-            shared_model.cuda()
+        self.device = BaselineDevice.from_args(args)
+        self.device.model(shared_model)
+        # Inputs of get_probs, created in the process which runs the agent
+        self.step_inputs = None
 
         self.config = config
         self.constants = constants
@@ -31,7 +35,9 @@ class ChaplotBaseline(object):
 
     def get_probs(self, state, model_state):
 
-        image = torch.from_numpy(state.get_last_image()).float()
+        if self.step_inputs is None:
+            self.step_inputs = StepInputs(self.device)
+
         curr_instr = state.get_instruction()
         prev_instr = state.get_prev_instruction()
         if prev_instr is None:
@@ -40,27 +46,22 @@ class ChaplotBaseline(object):
         if next_instr is None:
             next_instr = [self.config["vocab_size"] + 1]
 
-        curr_instruction_idx = torch.from_numpy(np.array(curr_instr)).view(1,-1)
-        prev_instruction_idx = torch.from_numpy(np.array(prev_instr)).view(1,-1)
-        next_instruction_idx = torch.from_numpy(np.array(next_instr)).view(1,-1)
-
         if model_state is None:
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
+            cx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
+            hx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
             episode_length = 1
             cached_computation = None
         else:
+            # Hidden states stay on the device between steps
             (hx, cx, episode_length, cached_computation) = model_state
-            hx = Variable(hx.data.cuda(), volatile=True)
-            cx = Variable(cx.data.cuda(), volatile=True)
 
-        tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda(), volatile=True)
+        tx = self.step_inputs.time_var(episode_length)
 
         value, logit, (hx, cx), cached_computation = self.shared_model(
-            (Variable(image.unsqueeze(0).cuda(), volatile=True),
-             Variable(curr_instruction_idx.cuda(), volatile=True),
-             Variable(prev_instruction_idx.cuda(), volatile=True),
-             Variable(next_instruction_idx.cuda(), volatile=True),
+            (self.step_inputs.image_var(state.get_last_image()),
+             self.step_inputs.instruction_var("curr", curr_instr),
+             self.step_inputs.instruction_var("prev", prev_instr),
+             self.step_inputs.instruction_var("next", next_instr),
              (tx, hx, cx)), cached_computation)
 
         log_prob = F.log_softmax(logit, dim=1)[0]
@@ -73,6 +74,8 @@ class ChaplotBaseline(object):
                  experiment_name, rank, server, logger, model_type, contextual_bandit, use_pushover=False):
 
         sys.stderr = sys.stdout
+        device = chaplot_baseline.device
+        device.init_worker()
         server.initialize_server()
         # Local Config Variables
         lstm_size = 256
@@ -99,9 +102,7 @@ class ChaplotBaseline(object):
         logger.log("Created Agent...")
 
         # Create a local model for rollouts
-        local_model = model_type(args, config=config)
-        if torch.cuda.is_available():
-            local_model.cuda()
+        local_model = device.model(model_type(args, config=config))
         chaplot_baseline.shared_model = local_model
         local_model.train()
 
@@ -126,9 +127,9 @@ class ChaplotBaseline(object):
         next_instruction_idx = np.array(next_instr)
 
         image = torch.from_numpy(image).float()
-        curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-        prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-        next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+        curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+        prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+        next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
         done = True
 
@@ -140,13 +141,13 @@ class ChaplotBaseline(object):
             local_model.load_state_dict(shared_model.state_dict())
             if done:
                 episode_length = 0
-                cx = Variable(torch.zeros(1, lstm_size).cuda())
-                hx = Variable(torch.zeros(1, lstm_size).cuda())
+                cx = device.var(torch.zeros(1, lstm_size))
+                hx = device.var(torch.zeros(1, lstm_size))
 
             else:
                 # assert False, "Assertion put by Max and Dipendra. Code shouldn't reach here."
-                cx = Variable(cx.data.cuda())
-                hx = Variable(hx.data.cuda())
+                cx = Variable(cx.data)
+                hx = Variable(hx.data)
 
             values = []
             log_probs = []
@@ -156,13 +157,13 @@ class ChaplotBaseline(object):
 
             for step in range(args.num_steps):
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
                 value, logit, (hx, cx), cached_information = local_model((
-                                                Variable(image.unsqueeze(0).cuda()),
-                                                Variable(curr_instruction_idx.cuda()),
-                                                Variable(prev_instruction_idx.cuda()),
-                                                Variable(next_instruction_idx.cuda()),
+                                                device.var(image.unsqueeze(0)),
+                                                Variable(curr_instruction_idx),
+                                                Variable(prev_instruction_idx),
+                                                Variable(next_instruction_idx),
                                                 (tx, hx, cx)), cached_information)
 
                 prob = F.softmax(logit, dim=1)
@@ -171,7 +172,7 @@ class ChaplotBaseline(object):
                 entropies.append(entropy)
 
                 action = prob.multinomial().data
-                log_prob = log_prob.gather(1, Variable(action.cuda()))
+                log_prob = log_prob.gather(1, Variable(action))
                 action = action.cpu().numpy()[0, 0]
 
                 (image, _), reward, done, _ = env.step(action)
@@ -188,9 +189,9 @@ class ChaplotBaseline(object):
                     curr_instruction_idx = np.array(curr_instr)
                     prev_instruction_idx = np.array(prev_instr)
                     next_instruction_idx = np.array(next_instr)
-                    curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-                    prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-                    next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+                    curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+                    prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+                    next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
                 image = torch.from_numpy(image).float()
 
@@ -207,44 +208,24 @@ class ChaplotBaseline(object):
                 mean_entropy = sum(entropies).data[0]/float(max(episode_length, 1))
                 tensorboard.log_scalar("Chaplot_Baseline_Entropy", mean_entropy)
 
-            R = torch.zeros(1, 1)
+            bootstrap_value = 0.0
             if not done:
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
                 value, _, _, _ = local_model((
-                    Variable(image.unsqueeze(0).cuda()),
-                    Variable(curr_instruction_idx.cuda()),
-                    Variable(prev_instruction_idx.cuda()),
-                    Variable(next_instruction_idx.cuda()),
+                    device.var(image.unsqueeze(0)),
+                    Variable(curr_instruction_idx),
+                    Variable(prev_instruction_idx),
+                    Variable(next_instruction_idx),
                     (tx, hx, cx)))
-                R = value.data
+                bootstrap_value = value.data[0, 0]
 
-            values.append(Variable(R.cuda()))
-            policy_loss = 0
-            value_loss = 0
-            R = Variable(R.cuda())
-
-            gae = torch.zeros(1, 1).cuda()
-            for i in reversed(range(len(rewards))):
-                R = args.gamma * R + rewards[i]
-                advantage = R - values[i]
-                value_loss = value_loss + 0.5 * advantage.pow(2)
-
-                if contextual_bandit:
-                    # Just focus on immediate reward
-                    gae = torch.from_numpy(np.array([[rewards[i]]])).float()
-                else:
-                    # Generalized Advantage Estimataion
-                    delta_t = rewards[i] + args.gamma * \
-                              values[i + 1].data - values[i].data
-                    gae = gae * args.gamma * args.tau + delta_t
-
-                policy_loss = policy_loss - \
-                              log_probs[i] * Variable(gae.cuda()) - 0.02 * entropies[i]
+            policy_loss, value_loss = calc_a3c_loss(values, log_probs, entropies, rewards, bootstrap_value,
+                                                    args.gamma, args.tau, 0.02, contextual_bandit)
 
             optimizer.zero_grad()
 
-            p_losses.append(policy_loss.data[0, 0])
-            v_losses.append(value_loss.data[0, 0])
+            p_losses.append(policy_loss.data[0])
+            v_losses.append(value_loss.data[0])
 
             if len(p_losses) > 1000:
                 num_iters += 1
@@ -313,8 +294,8 @@ class ChaplotBaseline(object):
             # Sync with the shared model
             # model.load_state_dict(shared_model.state_dict())
             episode_length = 0
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda())
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda())
+            cx = self.device.var(torch.zeros(1, self.lstm_size))
+            hx = self.device.var(torch.zeros(1, self.lstm_size))
 
             log_probs = []
             rewards = []
@@ -326,12 +307,12 @@ class ChaplotBaseline(object):
 
             for action in trajectory:
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = self.device.var(torch.from_numpy(np.array([episode_length])).long())
 
-                value, logit, (hx, cx) = self.shared_model((Variable(image.unsqueeze(0).cuda()),
-                                                            Variable(curr_instruction_idx.cuda()),
-                                                            Variable(prev_instruction_idx.cuda()),
-                                                            Variable(next_instruction_idx.cuda()),
+                value, logit, (hx, cx) = self.shared_model((self.device.var(image.unsqueeze(0)),
+                                                            self.device.var(curr_instruction_idx),
+                                                            self.device.var(prev_instruction_idx),
+                                                            self.device.var(next_instruction_idx),
                                                             (tx, hx, cx)))
 
                 prob = F.softmax(logit)
@@ -340,7 +321,7 @@ class ChaplotBaseline(object):
                 entropies.append(entropy)
 
                 action_tensor = torch.from_numpy(np.array([[action]]))
-                log_prob = log_prob.gather(1, Variable(action_tensor.cuda()))
+                log_prob = log_prob.gather(1, self.device.var(action_tensor))
                 (image, _), reward, done, _ = env.step(action)
                 image = torch.from_numpy(image).float()
                 # logging.info("Train: Took action %r, with prob %r, got reward %r",
@@ -383,12 +364,8 @@ class ChaplotBaseline(object):
             optimizer.step()
 
     def load_saved_model(self, load_dir):
-        if torch.cuda.is_available():
-            torch_load = torch.load
-        else:
-            torch_load = lambda f_: torch.load(f_, map_location=lambda s_, l_: s_)
         chaplot_module_path = os.path.join(load_dir, "chaplot_model.bin")
-        self.shared_model.load_state_dict(torch_load(chaplot_module_path))
+        self.shared_model.load_state_dict(self.device.load(chaplot_module_path))
 
 
 class Client:
@@ -7,6 +7,8 @@ import torch.optim as optim
 import utils.generic_policy as gp
 
 from agents.tmp_streetview_agent import Agent
+from baselines.a3c_loss import calc_a3c_loss
+from baselines.baseline_device import BaselineDevice, StepInputs
 from torch.autograd import Variable
 from utils.pushover_logger import PushoverLogger
 from utils.tensorboard import Tensorboard
@@ -17,8 +19,10 @@ class ChaplotBaselineStreetView(object):
                  use_contextual_bandit=False, lstm_size=256):
         self.args = args
         self.shared_model = shared_model
-        if torch.cuda.is_available():
-            shared_model.cuda()
+        self.device = BaselineDevice.from_args(args)
+        self.device.model(shared_model)
+        # Inputs of get_probs, created in the process which runs the agent
+        self.step_inputs = None
 
         self.config = config
         self.constants = constants
@@ -28,26 +32,25 @@ class ChaplotBaselineStreetView(object):
 
     def get_probs(self, state, model_state):
 
-        image = torch.from_numpy(state.get_last_image()).float()
-        curr_instr = state.get_instruction()
+        if self.step_inputs is None:
+            self.step_inputs = StepInputs(self.device)
 
-        curr_instruction_idx = torch.from_numpy(np.array(curr_instr)).view(1,-1)
+        curr_instr = state.get_instruction()
 
         if model_state is None:
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
+            cx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
+            hx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
             episode_length = 1
             cached_computation = None
         else:
+            # Hidden states stay on the device between steps
             (hx, cx, episode_length, cached_computation) = model_state
-            hx = Variable(hx.data.cuda(), volatile=True)
-            cx = Variable(cx.data.cuda(), volatile=True)
 
-        tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda(), volatile=True)
+        tx = self.step_inputs.time_var(episode_length)
 
         value, logit, (hx, cx), cached_computation = self.shared_model(
-            (Variable(image.unsqueeze(0).cuda(), volatile=True),
-             Variable(curr_instruction_idx.cuda(), volatile=True), None, None,
+            (self.step_inputs.image_var(state.get_last_image()),
+             self.step_inputs.instruction_var("curr", curr_instr), None, None,
              (tx, hx, cx)), cached_computation)
 
         log_prob = F.log_softmax(logit, dim=1)[0]
@@ -60,6 +63,8 @@ class ChaplotBaselineStreetView(object):
                  experiment_name, rank, server, logger, model_type, contextual_bandit, use_pushover=False):
 
         sys.stderr = sys.stdout
+        device = chaplot_baseline.device
+        device.init_worker()
         server.initialize_server()
         # Local Config Variables
         lstm_size = 256
@@ -86,9 +91,7 @@ class ChaplotBaselineStreetView(object):
         logger.log("Created Agent...")
 
         # Create a local model for rollouts
-        local_model = model_type(args, config=config, final_image_height=3, final_image_width=3)
-        if torch.cuda.is_available():
-            local_model.cuda()
+        local_model = device.model(model_type(args, config=config, final_image_height=3, final_image_width=3))
         chaplot_baseline.shared_model = local_model
         local_model.train()
 
@@ -109,7 +112,7 @@ class ChaplotBaselineStreetView(object):
         curr_instruction_idx = np.array(instr)
 
         image = torch.from_numpy(image).float()
-        curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
+        curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
 
         done = True
 
@@ -121,13 +124,13 @@ class ChaplotBaselineStreetView(object):
             local_model.load_state_dict(shared_model.state_dict())
             if done:
                 episode_length = 0
-                cx = Variable(torch.zeros(1, lstm_size).cuda())
-                hx = Variable(torch.zeros(1, lstm_size).cuda())
+                cx = device.var(torch.zeros(1, lstm_size))
+                hx = device.var(torch.zeros(1, lstm_size))
 
             else:
                 # assert False, "Assertion put by Max and Dipendra. Code shouldn't reach here."
-                cx = Variable(cx.data.cuda())
-                hx = Variable(hx.data.cuda())
+                cx = Variable(cx.data)
+                hx = Variable(hx.data)
 
             values = []
             log_probs = []
@@ -137,11 +140,11 @@ class ChaplotBaselineStreetView(object):
 
             for step in range(args.num_steps):
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
                 value, logit, (hx, cx), cached_information = local_model((
-                                                Variable(image.unsqueeze(0).cuda()),
-                                                Variable(curr_instruction_idx.cuda()),
+                                                device.var(image.unsqueeze(0)),
+                                                Variable(curr_instruction_idx),
                                                 None, None, (tx, hx, cx)), cached_information)
 
                 prob = F.softmax(logit, dim=1)
@@ -150,7 +153,7 @@ class ChaplotBaselineStreetView(object):
                 entropies.append(entropy)
 
                 action = prob.multinomial().data
-                log_prob = log_prob.gather(1, Variable(action.cuda()))
+                log_prob = log_prob.gather(1, Variable(action))
                 action = action.cpu().numpy()[0, 0]
 
                 (image, _), reward, done, _ = env.step(action)
@@ -164,7 +167,7 @@ class ChaplotBaselineStreetView(object):
                 if done:
                     (image, instr), _, _ = env.reset()
                     curr_instruction_idx = np.array(instr)
-                    curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
+                    curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
 
                 image = torch.from_numpy(image).float()
 
@@ -181,42 +184,22 @@ class ChaplotBaselineStreetView(object):
                 mean_entropy = sum(entropies).data[0]/float(max(episode_length, 1))
                 tensorboard.log_scalar("Chaplot_Baseline_Entropy", mean_entropy)
 
-            R = torch.zeros(1, 1)
+            bootstrap_value = 0.0
             if not done:
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
                 value, _, _, _ = local_model((
-                    Variable(image.unsqueeze(0).cuda()),
-                    Variable(curr_instruction_idx.cuda()),
+                    device.var(image.unsqueeze(0)),
+                    Variable(curr_instruction_idx),
                     None, None, (tx, hx, cx)))
-                R = value.data
+                bootstrap_value = value.data[0, 0]
 
-            values.append(Variable(R.cuda()))
-            policy_loss = 0
-            value_loss = 0
-            R = Variable(R.cuda())
-
-            gae = torch.zeros(1, 1).cuda()
-            for i in reversed(range(len(rewards))):
-                R = args.gamma * R + rewards[i]
-                advantage = R - values[i]
-                value_loss = value_loss + 0.5 * advantage.pow(2)
-
-                if contextual_bandit:
-                    # Just focus on immediate reward
-                    gae = torch.from_numpy(np.array([[rewards[i]]])).float()
-                else:
-                    # Generalized Advantage Estimataion
-                    delta_t = rewards[i] + args.gamma * \
-                              values[i + 1].data - values[i].data
-                    gae = gae * args.gamma * args.tau + delta_t
-
-                policy_loss = policy_loss - \
-                              log_probs[i] * Variable(gae.cuda()) - 0.02 * entropies[i]
+            policy_loss, value_loss = calc_a3c_loss(values, log_probs, entropies, rewards, bootstrap_value,
+                                                    args.gamma, args.tau, 0.02, contextual_bandit)
 
             optimizer.zero_grad()
 
-            p_losses.append(policy_loss.data[0, 0])
-            v_losses.append(value_loss.data[0, 0])
+            p_losses.append(policy_loss.data[0])
+            v_losses.append(value_loss.data[0])
 
             if len(p_losses) > 1000:
                 num_iters += 1
@@ -248,6 +231,8 @@ class ChaplotBaselineStreetView(object):
                            experiment_name, rank, server, logger, model_type, use_pushover=False):
         raise NotImplementedError()
         sys.stderr = sys.stdout
+        device = chaplot_baseline.device
+        device.init_worker()
         server.initialize_server()
         # Local Config Variables
         lstm_size = 256
@@ -274,9 +259,7 @@ class ChaplotBaselineStreetView(object):
         logger.log("Created Agent...")
 
         # Create a local model for rollouts
-        local_model = model_type(args, config=config)
-        if torch.cuda.is_available():
-            local_model.cuda()
+        local_model = device.model(model_type(args, config=config))
         chaplot_baseline.shared_model = local_model
         local_model.train()
 
@@ -302,13 +285,13 @@ class ChaplotBaselineStreetView(object):
             instruction_idx = np.array(instr)
 
             image = torch.from_numpy(image).float()
-            instruction_idx = torch.from_numpy(instruction_idx).view(1, -1)
+            instruction_idx = device.tensor(torch.from_numpy(instruction_idx).view(1, -1))
 
             # Sync with the shared model
             # model.load_state_dict(shared_model.state_dict())
             episode_length = 0
-            cx = Variable(torch.zeros(1, lstm_size).cuda())
-            hx = Variable(torch.zeros(1, lstm_size).cuda())
+            cx = device.var(torch.zeros(1, lstm_size))
+            hx = device.var(torch.zeros(1, lstm_size))
 
             log_probs = []
             rewards = []
@@ -320,10 +303,10 @@ class ChaplotBaselineStreetView(object):
 
             for action in trajectory:
                 episode_length += 1
-                tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
-                value, logit, (hx, cx) = shared_model((Variable(image.unsqueeze(0).cuda()),
-                                                       Variable(instruction_idx.cuda()),
+                value, logit, (hx, cx) = shared_model((device.var(image.unsqueeze(0)),
+                                                       Variable(instruction_idx),
                                                        None, None, (tx, hx, cx)))
 
                 prob = F.softmax(logit)
@@ -332,7 +315,7 @@ class ChaplotBaselineStreetView(object):
                 entropies.append(entropy)
 
                 action_tensor = torch.from_numpy(np.array([[action]]))
-                log_prob = log_prob.gather(1, Variable(action_tensor.cuda()))
+                log_prob = log_prob.gather(1, device.var(action_tensor))
                 (image, _), reward, done, _ = env.step(action)
                 image = torch.from_numpy(image).float()
 
@@ -373,12 +356,8 @@ class ChaplotBaselineStreetView(object):
             optimizer.step()
 
     def load_saved_model(self, load_dir):
-        if torch.cuda.is_available():
-            torch_load = torch.load
-        else:
-            torch_load = lambda f_: torch.load(f_, map_location=lambda s_, l_: s_)
         chaplot_module_path = os.path.join(load_dir, "chaplot_model.bin")
-        self.shared_model.load_state_dict(torch_load(chaplot_module_path))
+        self.shared_model.load_state_dict(self.device.load(chaplot_module_path))
 
 
 class Client:
@@ -13,6 +13,8 @@ import utils.generic_policy as gp
 import scipy.misc
 import matplotlib.pyplot as plt
 from agents.agent import Agent
+from baselines.a3c_loss import calc_a3c_loss
+from baselines.baseline_device import BaselineDevice, StepInputs
 from torch.autograd import Variable
 
 from utils.geometry import get_turn_angle_from_metadata_datapoint, get_distance_from_metadata_datapoint
@@ -27,8 +29,10 @@ class ChaplotBaselineWithAuxiliary(object):
                  use_contextual_bandit=False, lstm_size=256):
         self.args = args
         self.shared_model = shared_model
-        if torch.cuda.is_available():
-            shared_model.cuda()
+        self.device = BaselineDevice.from_args(args)
+        self.device.model(shared_model)
+        # Inputs of get_probs, created in the process which runs the agent
+        self.step_inputs = None
 
         self.config = config
         self.constants = constants
@@ -38,7 +42,9 @@ class ChaplotBaselineWithAuxiliary(object):
 
     def get_probs(self, state, model_state):
 
-        image = torch.from_numpy(state.get_last_image()).float()
+        if self.step_inputs is None:
+            self.step_inputs = StepInputs(self.device)
+
         curr_instr = state.get_instruction()
         prev_instr = state.get_prev_instruction()
         if prev_instr is None:
@@ -47,27 +53,22 @@ class ChaplotBaselineWithAuxiliary(object):
         if next_instr is None:
             next_instr = [self.config["vocab_size"] + 1]
 
-        curr_instruction_idx = torch.from_numpy(np.array(curr_instr)).view(1, -1)
-        prev_instruction_idx = torch.from_numpy(np.array(prev_instr)).view(1, -1)
-        next_instruction_idx = torch.from_numpy(np.array(next_instr)).view(1, -1)
-
         if model_state is None:
-            cx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
-            hx = Variable(torch.zeros(1, self.lstm_size).cuda(), volatile=True)
+            cx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
+            hx = self.device.var(torch.zeros(1, self.lstm_size), volatile=True)
             episode_length = 1
             cached_computation = None
         else:
+            # Hidden states stay on the device between steps
             (hx, cx, episode_length, cached_computation) = model_state
-            hx = Variable(hx.data.cuda(), volatile=True)
-            cx = Variable(cx.data.cuda(), volatile=True)
 
-        tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda(), volatile=True)
+        tx = self.step_inputs.time_var(episode_length)
 
         value, logit, (hx, cx), cached_computation = self.shared_model(
-            (Variable(image.unsqueeze(0).cuda(), volatile=True),
-             Variable(curr_instruction_idx.cuda(), volatile=True),
-             Variable(prev_instruction_idx.cuda(), volatile=True),
-             Variable(next_instruction_idx.cuda(), volatile=True),
+            (self.step_inputs.image_var(state.get_last_image()),
+             self.step_inputs.instruction_var("curr", curr_instr),
+             self.step_inputs.instruction_var("prev", prev_instr),
+             self.step_inputs.instruction_var("next", next_instr),
              (tx, hx, cx)), cached_computation)
 
         log_prob = F.log_softmax(logit, dim=1)[0]
@@ -130,6 +131,8 @@ class ChaplotBaselineWithAuxiliary(object):
 
         try:
             sys.stderr = sys.stdout
+            device = chaplot_baseline.device
+            device.init_worker()
             server.initialize_server()
             # Local Config Variables
             lstm_size = 256
@@ -155,9 +158,7 @@ class ChaplotBaselineWithAuxiliary(object):
             logger.log("Created Agent...")
 
             # Create a local model for rollouts
-            local_model = model_type(args, config=config)
-            if torch.cuda.is_available():
-                local_model.cuda()
+            local_model = device.model(model_type(args, config=config))
             chaplot_baseline.shared_model = local_model
             local_model.train()
 
@@ -181,9 +182,9 @@ class ChaplotBaselineWithAuxiliary(object):
             next_instruction_idx = np.array(next_instr)
 
             image = torch.from_numpy(image).float()
-            curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-            prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-            next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+            curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+            prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+            next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
             done = True
 
@@ -197,12 +198,12 @@ class ChaplotBaselineWithAuxiliary(object):
                 local_model.load_state_dict(shared_model.state_dict())
                 if done:
                     episode_length = 0
-                    cx = Variable(torch.zeros(1, lstm_size).cuda())
-                    hx = Variable(torch.zeros(1, lstm_size).cuda())
+                    cx = device.var(torch.zeros(1, lstm_size))
+                    hx = device.var(torch.zeros(1, lstm_size))
 
                 else:
-                    cx = Variable(cx.data.cuda())
-                    hx = Variable(hx.data.cuda())
+                    cx = Variable(cx.data)
+                    hx = Variable(hx.data)
 
                 values = []
                 log_probs = []
@@ -218,13 +219,13 @@ class ChaplotBaselineWithAuxiliary(object):
 
                 for step in range(args.num_steps):
                     episode_length += 1
-                    tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                    tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
                     value, logit, (hx, cx), cached_information = local_model((
-                                                    Variable(image.unsqueeze(0).cuda()),
-                                                    Variable(curr_instruction_idx.cuda()),
-                                                    Variable(prev_instruction_idx.cuda()),
-                                                    Variable(next_instruction_idx.cuda()),
+                                                    device.var(image.unsqueeze(0)),
+                                                    Variable(curr_instruction_idx),
+                                                    Variable(prev_instruction_idx),
+                                                    Variable(next_instruction_idx),
                                                     (tx, hx, cx)), cached_information)
 
                     prob = F.softmax(logit, dim=1)
@@ -242,7 +243,7 @@ class ChaplotBaselineWithAuxiliary(object):
                     # ChaplotBaselineWithAuxiliary.save_visualized_image(image, goal_location, global_id)
                     global_id += 1
                     ####################################
-                    log_prob = log_prob.gather(1, Variable(action.cuda()))
+                    log_prob = log_prob.gather(1, Variable(action))
                     action = action.cpu().numpy()[0, 0]
 
                     (image, _), reward, done, _, metadata = env.step(action)
@@ -259,9 +260,9 @@ class ChaplotBaselineWithAuxiliary(object):
                         curr_instruction_idx = np.array(curr_instr)
                         prev_instruction_idx = np.array(prev_instr)
                         next_instruction_idx = np.array(next_instr)
-                        curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-                        prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-                        next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+                        curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+                        prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+                        next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
                     image = torch.from_numpy(image).float()
 
@@ -278,40 +279,20 @@ class ChaplotBaselineWithAuxiliary(object):
                     mean_entropy = sum(entropies).data[0]/float(max(episode_length, 1))
                     tensorboard.log_scalar("Chaplot_Baseline_Entropy", mean_entropy)
 
-                R = torch.zeros(1, 1)
+                bootstrap_value = 0.0
                 if not done:
-                    tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                    tx = device.var(torch.from_numpy(np.array([episode_length])).long())
                     value, _, _, _ = local_model((
-                        Variable(image.unsqueeze(0).cuda()),
-                        Variable(curr_instruction_idx.cuda()),
-                        Variable(prev_instruction_idx.cuda()),
-                        Variable(next_instruction_idx.cuda()),
+                        device.var(image.unsqueeze(0)),
+                        Variable(curr_instruction_idx),
+                        Variable(prev_instruction_idx),
+                        Variable(next_instruction_idx),
                         (tx, hx, cx)))
-                    R = value.data
-
-                values.append(Variable(R.cuda()))
-                policy_loss = 0
-                value_loss = 0
-                R = Variable(R.cuda())
+                    bootstrap_value = value.data[0, 0]
 
-                gae = torch.zeros(1, 1).cuda()
                 entropy_coeff = max(0.0, 0.11 - env.num_epochs * 0.01)
-                for i in reversed(range(len(rewards))):
-                    R = args.gamma * R + rewards[i]
-                    advantage = R - values[i]
-                    value_loss = value_loss + 0.5 * advantage.pow(2)
-
-                    if contextual_bandit:
-                        # Just focus on immediate reward
-                        gae = torch.from_numpy(np.array([[rewards[i]]])).float()
-                    else:
-                        # Generalized Advantage Estimataion
-                        delta_t = rewards[i] + args.gamma * \
-                                  values[i + 1].data - values[i].data
-                        gae = gae * args.gamma * args.tau + delta_t
-
-                    policy_loss = policy_loss - \
-                                  log_probs[i] * Variable(gae.cuda()) - entropy_coeff * entropies[i]
+                policy_loss, value_loss = calc_a3c_loss(values, log_probs, entropies, rewards, bootstrap_value,
+                                                        args.gamma, args.tau, entropy_coeff, contextual_bandit)
 
                 temporal_autoencoding_loss = None  # local_model.get_tae_loss(image_rep, actions)
                 reward_prediction_loss = None  # local_model.get_reward_prediction_loss(lstm_rep, actions, rewards)
@@ -320,8 +301,8 @@ class ChaplotBaselineWithAuxiliary(object):
                     image_rep, cached_information["text_rep"], goal_locations)
                 optimizer.zero_grad()
 
-                p_losses.append(policy_loss.data[0, 0])
-                v_losses.append(value_loss.data[0, 0])
+                p_losses.append(policy_loss.data[0])
+                v_losses.append(value_loss.data[0])
 
                 if len(p_losses) > 1000:
                     num_iters += 1
@@ -377,6 +358,8 @@ class ChaplotBaselineWithAuxiliary(object):
 
         try:
             sys.stderr = sys.stdout
+            device = chaplot_baseline.device
+            device.init_worker()
             server.initialize_server()
             # Local Config Variables
             lstm_size = 256
@@ -402,9 +385,7 @@ class ChaplotBaselineWithAuxiliary(object):
             logger.log("Created Agent...")
 
             # Create a local model for rollouts
-            local_model = model_type(args, config=config)
-            if torch.cuda.is_available():
-                local_model.cuda()
+            local_model = device.model(model_type(args, config=config))
             chaplot_baseline.shared_model = local_model
             local_model.train()
 
@@ -440,13 +421,13 @@ class ChaplotBaselineWithAuxiliary(object):
                 next_instruction_idx = np.array(next_instr)
 
                 image = torch.from_numpy(image).float()
-                curr_instruction_idx = torch.from_numpy(curr_instruction_idx).view(1, -1)
-                prev_instruction_idx = torch.from_numpy(prev_instruction_idx).view(1, -1)
-                next_instruction_idx = torch.from_numpy(next_instruction_idx).view(1, -1)
+                curr_instruction_idx = device.tensor(torch.from_numpy(curr_instruction_idx).view(1, -1))
+                prev_instruction_idx = device.tensor(torch.from_numpy(prev_instruction_idx).view(1, -1))
+                next_instruction_idx = device.tensor(torch.from_numpy(next_instruction_idx).view(1, -1))
 
                 episode_length = 0
-                cx = Variable(torch.zeros(1, lstm_size).cuda())
-                hx = Variable(torch.zeros(1, lstm_size).cuda())
+                cx = device.var(torch.zeros(1, lstm_size))
+                hx = device.var(torch.zeros(1, lstm_size))
 
                 goal_x, goal_z = data_point.get_destination_list()[-1]
                 trajectory_str = get_oracle_trajectory(metadata, goal_x, goal_z, data_point)
@@ -468,13 +449,13 @@ class ChaplotBaselineWithAuxiliary(object):
 
                 for step in range(num_steps):
                     episode_length += 1
-                    tx = Variable(torch.from_numpy(np.array([episode_length])).long().cuda())
+                    tx = device.var(torch.from_numpy(np.array([episode_length])).long())
 
                     value, logit, (hx, cx), cached_information = local_model((
-                                                    Variable(image.unsqueeze(0).cuda()),
-                                                    Variable(curr_instruction_idx.cuda()),
-                                                    Variable(prev_instruction_idx.cuda()),
-                                                    Variable(next_instruction_idx.cuda()),
+                                                    device.var(image.unsqueeze(0)),
+                                                    Variable(curr_instruction_idx),
+                                                    Variable(prev_instruction_idx),
+                                                    Variable(next_instruction_idx),
                                                     (tx, hx, cx)), cached_information)
 
                     prob = F.softmax(logit, dim=1)
@@ -497,7 +478,7 @@ class ChaplotBaselineWithAuxiliary(object):
                     # ChaplotBaselineWithAuxiliary.save_visualized_image(image, goal_location, global_id)
                     global_id += 1
                     ####################################
-                    log_prob = log_prob.gather(1, Variable(action_var.cuda()))
+                    log_prob = log_prob.gather(1, device.var(action_var))
 
                     (image, _), reward, done, _, metadata = env.step(action)
                     image = torch.from_numpy(image).float()
@@ -514,11 +495,11 @@ class ChaplotBaselineWithAuxiliary(object):
                     mean_entropy = sum(entropies).data[0]/float(max(episode_length, 1))
                     tensorboard.log_scalar("Chaplot_Baseline_Entropy", mean_entropy)
 
-                R = torch.zeros(1, 1)
-                values.append(Variable(R.cuda()))
+                R = device.zeros(1, 1)
+                values.append(Variable(R))
                 policy_loss = 0
                 value_loss = 0
-                R = Variable(R.cuda())
+                R = Variable(R)
 
                 entropy_coeff = max(0.0, 0.11 - env.num_epochs * 0.01)
                 for i in reversed(range(len(rewards))):
@@ -590,18 +571,10 @@ class ChaplotBaselineWithAuxiliary(object):
             shared_param._grad = param.grad
 
     def load_saved_model(self, load_dir):
-        if torch.cuda.is_available():
-            torch_load = torch.load
-        else:
-            torch_load = lambda f_: torch.load(f_, map_location=lambda s_, l_: s_)
         chaplot_module_path = os.path.join(load_dir, "chaplot_model.bin")
-        self.shared_model.load_state_dict(torch_load(chaplot_module_path))
+        self.shared_model.load_state_dict(self.device.load(chaplot_module_path))
 
     def load_image_text_model(self, load_dir):
-        if torch.cuda.is_available():
-            torch_load = torch.load
-        else:
-            torch_load = lambda f_: torch.load(f_, map_location=lambda s_, l_: s_)
         chaplot_module_path = os.path.join(load_dir, "chaplot_model.bin")
         # pairs = ['conv1.weight', 'conv1.bias', 'conv2.weight', 'conv2.bias', 'conv3.weight', 'conv3.bias',
         #          'embedding.weight', 'gru.weight_ih_l0', 'gru.weight_hh_l0', 'gru.bias_ih_l0', 'gru.bias_hh_l0',
@@ -616,7 +589,7 @@ class ChaplotBaselineWithAuxiliary(object):
         not_included_list = ['linear.weight', 'linear.bias', 'lstm.weight_ih', 'lstm.weight_hh',
                              'lstm.bias_ih', 'lstm.bias_hh', 'critic_linear.weight', 'critic_linear.bias',
                              'actor_linear.weight', 'actor_linear.bias']
-        loaded_dict = torch_load(chaplot_module_path)
+        loaded_dict = self.device.load(chaplot_module_path)
         new_dict = dict()
         for key in loaded_dict:
             if key not in not_included_list:
@@ -91,7 +91,7 @@ class a3c_lstm_ga_concat_gavector(torch.nn.Module):
             i = 0
             for input_inst in (curr_instr, prev_instr, next_instr):
                 # Get the instruction representation
-                encoder_hidden = Variable(torch.zeros(1, 1, self.gru_hidden_size).cuda())
+                encoder_hidden = Variable(x.data.new(1, 1, self.gru_hidden_size).zero_())
                 for i in range(input_inst.data.size(1)):
                     word_embedding = self.embedding(input_inst[0, i]).unsqueeze(0)
                     _, encoder_hidden = self.gru(word_embedding, encoder_hidden)
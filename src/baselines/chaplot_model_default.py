@@ -118,7 +118,7 @@ class a3c_lstm_ga_default(torch.nn.Module):
 
         if cached_computation is None:
             # Get the instruction representation
-            encoder_hidden = Variable(torch.zeros(1, 1, self.gru_hidden_size).cuda())
+            encoder_hidden = Variable(x.data.new(1, 1, self.gru_hidden_size).zero_())
             for i in range(input_inst.data.size(1)):
                 word_embedding = self.embedding(input_inst[0, i]).unsqueeze(0)
                 _, encoder_hidden = self.gru(word_embedding, encoder_hidden)
@@ -138,8 +138,8 @@ class a3c_lstm_ga_default_with_aux(torch.nn.Module):
 
         if cached_computation is None:
             # Get the instruction representation
-            encoder_hidden = Variable(torch.zeros(1, 1, self.gru_hidden_size).cuda())
-            # encoder_cell = Variable(torch.zeros(1, 1, self.gru_hidden_size).cuda())
+            encoder_hidden = Variable(x.data.new(1, 1, self.gru_hidden_size).zero_())
+            # encoder_cell = Variable(x.data.new(1, 1, self.gru_hidden_size).zero_())
             for i in range(input_inst.data.size(1)):
                 word_embedding = self.embedding(input_inst[0, i]).unsqueeze(0)
                 _, encoder_hidden = self.gru(word_embedding, encoder_hidden)
@@ -174,6 +174,12 @@ class a3c_lstm_ga_default_with_aux(torch.nn.Module):
 
         return self.critic_linear(x), self.actor_linear(x), (hx, cx), cached_computation
 
+    def to_model_device(self, t):
+        """ Moves the tensor to the device of the parameters of the model """
+        if self.action_embedding.weight.is_cuda:
+            return t.cuda()
+        return t.cpu()
+
     def get_tae_loss(self, image_rep, actions):
 
         if len(image_rep) == 1:
@@ -181,7 +187,7 @@ class a3c_lstm_ga_default_with_aux(torch.nn.Module):
 
         actions = torch.cat(actions, dim=0).view(-1)
         image_rep = torch.cat(image_rep, dim=0)
-        action_embedding = self.action_embedding(Variable(actions).cuda())
+        action_embedding = self.action_embedding(Variable(self.to_model_device(actions)))
 
         image_action = torch.cat([image_rep, action_embedding], dim=1)
         x = self.tae_linear_1(image_action)
@@ -199,10 +205,10 @@ class a3c_lstm_ga_default_with_aux(torch.nn.Module):
     def get_reward_prediction_loss(self, lstm_rep, actions, rewards):
 
         actions = torch.cat(actions, dim=0).view(-1)
-        action_embedding = self.action_embedding(Variable(actions).cuda())
+        action_embedding = self.action_embedding(Variable(self.to_model_device(actions)))
 
         rewards = torch.from_numpy(np.array(rewards)).float()
-        rewards = Variable(rewards).cuda()
+        rewards = Variable(self.to_model_device(rewards))
 
         lstm_rep = torch.cat(lstm_rep, dim=0)
 
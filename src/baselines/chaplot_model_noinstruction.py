@@ -79,7 +79,7 @@ class a3c_lstm_ga_no_instruction(torch.nn.Module):
     def forward(self, inputs, cached_computation=None):
         x, _, _, _, (tx, hx, cx) = inputs
 
-        dummy_inst = Variable(torch.zeros(1, 1).cuda())
+        dummy_inst = Variable(x.data.new(1, 1).zero_())
 
         # Get the image representation
         x = F.relu(self.conv1(x))
@@ -89,7 +89,7 @@ class a3c_lstm_ga_no_instruction(torch.nn.Module):
         if cached_computation is None:
 
             # Get the instruction representation
-            encoder_hidden = Variable(torch.zeros(1, 1, self.gru_hidden_size).cuda())
+            encoder_hidden = Variable(x.data.new(1, 1, self.gru_hidden_size).zero_())
             for i in range(dummy_inst.data.size(1)):
                 word_embedding = self.embedding(dummy_inst[0, i]).unsqueeze(0)
                 _, encoder_hidden = self.gru(word_embedding, encoder_hidden)
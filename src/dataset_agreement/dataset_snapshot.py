@@ -0,0 +1,185 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import logging
+import numpy as np
+
+
+class DatasetSnapshot:
+    """ Binary snapshot of a parsed dataset which later launches load instead of parsing the dataset again.
+
+    The snapshot is keyed by a hash of the snapshot version, the parser, its settings and the content of the
+    files it reads, and is stored next to the dataset file. Datapoint fields are stored by column:
+        int lists (e.g., token ids and trajectories) as one array of values and offsets,
+        floating point tuples (e.g., start positions) as a 2D array,
+        strings (e.g., scene configs) as a table of the distinct strings and an index for every datapoint,
+        and any other field as a pickled list.
+    Loading reads every column with a single array read and converts it back to the Python values of the
+    datapoints, so that the datapoints are the same as the parsed ones.
+
+    Files referenced by the dataset, such as the scene configs of the nav drone dataset, can be many. Passing
+    them in referenced_file_names includes their size and modification time in the key instead of their
+    content, so that launches only stat them. """
+
+    VERSION = 1
+    META_FILE = "meta.json"
+    OBJECTS_FILE = "objects.pkl"
+    INT_LIST, FLOAT_TUPLE, STRING, OBJECT = "int_list", "float_tuple", "string", "object"
+
+    @staticmethod
+    def get_key(parser_name, file_names, settings, referenced_file_names=()):
+        sha = hashlib.sha1()
+        sha.update(json.dumps([DatasetSnapshot.VERSION, parser_name, settings], sort_keys=True).encode("utf-8"))
+        for file_name in file_names:
+            with open(file_name, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+        for file_name in referenced_file_names:
+            stat = os.stat(file_name)
+            sha.update(json.dumps([file_name, stat.st_size, stat.st_mtime]).encode("utf-8"))
+        return sha.hexdigest()
+
+    @staticmethod
+    def load_or_parse(parser_name, parse_fn, file_names, settings, referenced_file_names=()):
+        """ Returns the dataset of the snapshot for these files and settings if there is one, otherwise
+        parses it using parse_fn and saves a snapshot. The first file name must be the dataset file. """
+
+        key = DatasetSnapshot.get_key(parser_name, file_names, settings, referenced_file_names)
+        folder_name = "%s.%s.snapshot" % (file_names[0], key[:16])
+
+        if os.path.exists(os.path.join(folder_name, DatasetSnapshot.META_FILE)):
+            logging.info("Loading dataset snapshot %r", folder_name)
+            return DatasetSnapshot.load(folder_name)
+
+        dataset = parse_fn()
+        try:
+            DatasetSnapshot.save(dataset, folder_name)
+        except (IOError, OSError) as e:
+            logging.warning("Could not save dataset snapshot %r. Error %r", folder_name, e)
+        return dataset
+
+    @staticmethod
+    def _get_column_type(values):
+        if all([value is None or (type(value) in (list, tuple) and
+                                  all([type(v) is int for v in value])) for value in values]):
+            if len(set([type(value) for value in values if value is not None])) <= 1:
+                return DatasetSnapshot.INT_LIST
+        if len(values) > 0 and all([type(value) is tuple and all([type(v) is float for v in value])
+                                    for value in values]):
+            if len(set([len(value) for value in values])) == 1:
+                return DatasetSnapshot.FLOAT_TUPLE
+        if all([value is None or type(value) is str for value in values]):
+            return DatasetSnapshot.STRING
+        return DatasetSnapshot.OBJECT
+
+    @staticmethod
+    def save(dataset, folder_name):
+
+        datapoint_class = type(dataset[0]) if len(dataset) > 0 else None
+        field_names = list(dataset[0].__dict__.keys()) if len(dataset) > 0 else []
+        for datapoint in dataset:
+            if type(datapoint) is not datapoint_class or list(datapoint.__dict__.keys()) != field_names:
+                raise AssertionError("All datapoints must be of the same type and have the same fields")
+
+        # Written to a temporary folder which is renamed once complete
+        tmp_folder_name = "%s.tmp.%d" % (folder_name, os.getpid())
+        os.makedirs(tmp_folder_name)
+
+        columns = []
+        objects = dict()
+        for field_name in field_names:
+            values = [datapoint.__dict__[field_name] for datapoint in dataset]
+            column_type = DatasetSnapshot._get_column_type(values)
+            path = os.path.join(tmp_folder_name, field_name)
+
+            if column_type == DatasetSnapshot.INT_LIST:
+                container = [type(value) for value in values if value is not None]
+                container = "tuple" if len(container) > 0 and container[0] is tuple else "list"
+                lengths = [0 if value is None else len(value) for value in values]
+                np.save(path + ".values.npy", np.array([v for value in values if value is not None for v in value],
+                                                       dtype=np.int64))
+                np.save(path + ".offsets.npy", np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+                np.save(path + ".none.npy", np.array([value is None for value in values], dtype=bool))
+                columns.append((field_name, column_type, container))
+
+            elif column_type == DatasetSnapshot.FLOAT_TUPLE:
+                np.save(path + ".values.npy", np.array(values, dtype=np.float64))
+                columns.append((field_name, column_type, None))
+
+            elif column_type == DatasetSnapshot.STRING:
+                # Strings such as scene configs are shared by many datapoints and are stored once
+                table, indices = dict(), []
+                for value in values:
+                    indices.append(-1 if value is None else table.setdefault(value, len(table)))
+                np.save(path + ".index.npy", np.array(indices, dtype=np.int64))
+                objects[field_name] = sorted(table.keys(), key=lambda value: table[value])
+                columns.append((field_name, column_type, None))
+
+            else:
+                objects[field_name] = values
+                columns.append((field_name, column_type, None))
+
+        with open(os.path.join(tmp_folder_name, DatasetSnapshot.OBJECTS_FILE), "wb") as f:
+            pickle.dump({"datapoint_class": datapoint_class, "objects": objects}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with open(os.path.join(tmp_folder_name, DatasetSnapshot.META_FILE), "w") as f:
+            json.dump({"version": DatasetSnapshot.VERSION, "size": len(dataset), "columns": columns}, f)
+
+        try:
+            os.rename(tmp_folder_name, folder_name)
+            logging.info("Saved dataset snapshot %r", folder_name)
+        except OSError:
+            # Another process saved the same snapshot
+            shutil.rmtree(tmp_folder_name, ignore_errors=True)
+
+    @staticmethod
+    def load(folder_name):
+
+        with open(os.path.join(folder_name, DatasetSnapshot.META_FILE)) as f:
+            meta = json.load(f)
+        with open(os.path.join(folder_name, DatasetSnapshot.OBJECTS_FILE), "rb") as f:
+            pickled = pickle.load(f)
+
+        size = meta["size"]
+        datapoint_class = pickled["datapoint_class"]
+        objects = pickled["objects"]
+        fields = [dict() for _ in range(0, size)]
+
+        for field_name, column_type, container in meta["columns"]:
+            path = os.path.join(folder_name, field_name)
+
+            if column_type == DatasetSnapshot.INT_LIST:
+                values = np.load(path + ".values.npy")
+                offsets = np.load(path + ".offsets.npy").tolist()
+                is_none = np.load(path + ".none.npy").tolist()
+                for i in range(0, size):
+                    if is_none[i]:
+                        fields[i][field_name] = None
+                    else:
+                        value = values[offsets[i]: offsets[i + 1]].tolist()
+                        fields[i][field_name] = tuple(value) if container == "tuple" else value
+
+            elif column_type == DatasetSnapshot.FLOAT_TUPLE:
+                values = np.load(path + ".values.npy").tolist()
+                for i in range(0, size):
+                    fields[i][field_name] = tuple(values[i])
+
+            elif column_type == DatasetSnapshot.STRING:
+                table = objects[field_name]
+                indices = np.load(path + ".index.npy").tolist()
+                for i in range(0, size):
+                    fields[i][field_name] = None if indices[i] == -1 else table[indices[i]]
+
+            else:
+                for i, value in enumerate(objects[field_name]):
+                    fields[i][field_name] = value
+
+        dataset = []
+        for i in range(0, size):
+            datapoint = datapoint_class.__new__(datapoint_class)
+            datapoint.__dict__.update(fields[i])
+            dataset.append(datapoint)
+
+        return dataset
@@ -1,5 +1,6 @@
 import json
 from dataset_agreement.abstract_dataset_parser import AbstractDatasetParser
+from dataset_agreement.dataset_snapshot import DatasetSnapshot
 from .datapoint import DataPoint
 
 actions = ["forward", "back", "slideleft", "slideright", "lookleft", "lookright", "stop"]
@@ -29,6 +30,12 @@ class DatasetParser(AbstractDatasetParser):
 
     @staticmethod
     def parse(file_name, config, use_trajectory=False):
+        return DatasetSnapshot.load_or_parse(
+            "house", lambda: DatasetParser.parse_dataset(file_name, config, use_trajectory),
+            [file_name], {"use_trajectory": use_trajectory})
+
+    @staticmethod
+    def parse_dataset(file_name, config, use_trajectory=False):
 
         ################################
         # traj_dict = {}
@@ -2,6 +2,7 @@ import json
 import os
 import random
 from dataset_agreement.abstract_dataset_parser import AbstractDatasetParser
+from dataset_agreement.dataset_snapshot import DatasetSnapshot
 from dataset_agreement_nav_drone.nav_drone_datapoint import NavDroneDataPoint
 
 action_code_map = {
@@ -18,6 +19,23 @@ class DatasetParser(AbstractDatasetParser):
 
     @staticmethod
     def parse(file_name, config):
+        if len(config["action_names"]) != 4:
+            # Trajectories are sampled at random and are not snapshotted
+            return DatasetParser.parse_dataset(file_name, config)
+        settings = {"use_paragraphs": config["use_paragraphs"],
+                    "action_names": config["action_names"],
+                    "resources_dir": os.path.abspath(config["resources_dir"])}
+        with open(file_name) as f:
+            raw_data_list = json.load(f)
+        resources_file_names = sorted(set(os.path.join(config["resources_dir"], raw_data[key])
+                                          for raw_data in raw_data_list if raw_data["valid"]
+                                          for key in ("config_file", "path_file")))
+        return DatasetSnapshot.load_or_parse(
+            "nav_drone", lambda: DatasetParser.parse_dataset(file_name, config),
+            [file_name, config["vocab_file"]], settings, resources_file_names)
+
+    @staticmethod
+    def parse_dataset(file_name, config):
         data_point_list = []
         with open(file_name) as f:
             raw_data_list = json.load(f)
@@ -3,6 +3,7 @@ import nltk
 import ast
 
 from dataset_agreement.abstract_dataset_parser import AbstractDatasetParser
+from dataset_agreement.dataset_snapshot import DatasetSnapshot
 from dataset_agreement_streetview.datapoint import DataPoint
 
 
@@ -10,6 +11,12 @@ class DatasetParser(AbstractDatasetParser):
 
     @staticmethod
     def parse(file_name, config):
+        return DatasetSnapshot.load_or_parse(
+            "streetview", lambda: DatasetParser.parse_dataset(file_name, config),
+            [file_name, config["vocab_file"]], {})
+
+    @staticmethod
+    def parse_dataset(file_name, config):
 
         # Read the vocabulary
         vocab = [token.strip() for token in open(config["vocab_file"]).readlines()]
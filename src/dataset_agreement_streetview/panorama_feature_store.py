@@ -0,0 +1,166 @@
+import os
+import json
+import argparse
+import logging
+import numpy as np
+
+from cachetools import LRUCache
+from utils.packed_image_dataset import PackedImageDataset
+from utils.shared_numpy import share_numpy, numpy_view
+
+
+def get_image_bytes(image):
+    return image.nbytes
+
+
+class PanoramaFeatureStore:
+    """ Condensed features of the StreetView panoramas. The feature of a panorama is a width x depth array
+    stored in {panorama_id}.npy and the view for an orientation is the panorama rolled along the width.
+
+    If the feature folder has been packed (see main) all panoramas are read from a single read-only memory
+    mapped file which processes share through the OS page cache, otherwise every panorama is loaded from its
+    own file. A panorama is kept once, depth first, in an LRU cache bounded to cache_bytes and the view for
+    an orientation is gathered from it, instead of caching a rolled copy of the panorama per orientation.
+
+    After share_memory, processes to which the store is sent read the features from the same memory. """
+
+    PANORAMA_IDS_SUFFIX = ".panorama_ids.json"
+    DEFAULT_CACHE_BYTES = 2 * 1024 ** 3
+
+    def __init__(self, image_feature_folder, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.image_feature_folder = image_feature_folder
+        self.cache_bytes = cache_bytes
+        self.cache = LRUCache(maxsize=max(1, cache_bytes), getsizeof=get_image_bytes)
+
+        # All panoramas, depth first, in shared memory (see share_memory)
+        self.shared_panoramas = None
+        self.panoramas = None
+
+        self.packed = None
+        self.panorama_index = None
+        self._load_packed()
+
+        # Gather indices for every roll of a panorama width
+        self.roll_indices = dict()
+
+    def _load_packed(self):
+        packed_name = PanoramaFeatureStore.get_packed_name(self.image_feature_folder)
+        if PackedImageDataset.exists(packed_name) and \
+                os.path.exists(packed_name + PanoramaFeatureStore.PANORAMA_IDS_SUFFIX):
+            logging.info("Loading packed panorama features of %r", self.image_feature_folder)
+            self.packed = PackedImageDataset.load(packed_name)
+            with open(packed_name + PanoramaFeatureStore.PANORAMA_IDS_SUFFIX) as f:
+                panorama_ids = json.load(f)
+            self.panorama_index = dict([(panorama_id, i) for i, panorama_id in enumerate(panorama_ids)])
+
+    def share_memory(self):
+        """ Load all panoramas into shared memory. Must be called before the store is sent to other
+        processes. A packed store is already shared through the page cache so nothing is loaded. """
+
+        if self.packed is not None or self.shared_panoramas is not None:
+            return
+
+        panorama_ids = sorted([file_name[:-len(".npy")] for file_name in os.listdir(self.image_feature_folder)
+                               if file_name.endswith(".npy")])
+        panoramas = None
+        for i, panorama_id in enumerate(panorama_ids):
+            panorama = self.get_panorama(panorama_id)
+            if panoramas is None:
+                panoramas = np.empty((len(panorama_ids),) + panorama.shape, dtype=panorama.dtype)
+            panoramas[i] = panorama
+
+        if panoramas is None:
+            return
+
+        self.shared_panoramas = share_numpy(panoramas)
+        self.panoramas = numpy_view(self.shared_panoramas)
+        self.panorama_index = dict([(panorama_id, i) for i, panorama_id in enumerate(panorama_ids)])
+        self.cache.clear()
+        logging.info("Shared %r panorama features of %r bytes", len(panorama_ids), self.panoramas.nbytes)
+
+    def __getstate__(self):
+        # Processes attach to the shared panoramas and memory map the packed file on their own
+        state = self.__dict__.copy()
+        state["cache"] = None
+        state["panoramas"] = None
+        state["packed"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = LRUCache(maxsize=max(1, self.cache_bytes), getsizeof=get_image_bytes)
+        if self.shared_panoramas is not None:
+            self.panoramas = numpy_view(self.shared_panoramas)
+        else:
+            self._load_packed()
+
+    @staticmethod
+    def get_packed_name(image_feature_folder):
+        return os.path.normpath(image_feature_folder)
+
+    def get_panorama(self, panorama_id):
+        """ Returns the depth x width feature of the panorama """
+
+        if self.panoramas is not None:
+            return self.panoramas[self.panorama_index[panorama_id]]
+
+        panorama = self.cache.get(panorama_id)
+        if panorama is not None:
+            return panorama
+
+        if self.packed is None:
+            path = os.path.join(self.image_feature_folder, '{}.npy'.format(panorama_id))
+            panorama = np.load(path, mmap_mode="r")
+        else:
+            panorama = self.packed[self.panorama_index[panorama_id]][0]
+        panorama = np.ascontiguousarray(panorama.transpose())
+
+        if panorama.nbytes <= self.cache_bytes:
+            self.cache[panorama_id] = panorama
+        return panorama
+
+    def get_view(self, panorama_id, shift):
+        """ Returns the panorama rolled by shift along the width, as a depth x 1 x width array. This is the
+        same as rolling the width x depth feature by shift and moving the depth first. """
+
+        panorama = self.get_panorama(panorama_id)
+        width = panorama.shape[1]
+        key = (width, shift % width)
+
+        indices = self.roll_indices.get(key)
+        if indices is None:
+            indices = (np.arange(width) - shift) % width
+            self.roll_indices[key] = indices
+
+        return panorama.take(indices, axis=1)[:, np.newaxis, :]
+
+    @staticmethod
+    def pack(image_feature_folder):
+        """ Pack the {panorama_id}.npy features of the folder into a single file """
+
+        panorama_ids = sorted([file_name[:-len(".npy")] for file_name in os.listdir(image_feature_folder)
+                               if file_name.endswith(".npy")])
+        examples = ([np.load(os.path.join(image_feature_folder, '{}.npy'.format(panorama_id)))]
+                    for panorama_id in panorama_ids)
+
+        packed_name = PanoramaFeatureStore.get_packed_name(image_feature_folder)
+        PackedImageDataset.pack(examples, packed_name)
+
+        # Written after the packed file so that the ids always describe a complete file
+        with open(packed_name + PanoramaFeatureStore.PANORAMA_IDS_SUFFIX, "w") as f:
+            json.dump(panorama_ids, f)
+
+
+def main():
+    """ Pack the condensed panorama features used by StreetViewFSA with the new mapping type """
+
+    parser = argparse.ArgumentParser(description="Pack StreetView panorama features into a single file")
+    parser.add_argument("image_feature_folder", type=str, help="folder containing the {panorama_id}.npy features")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    PanoramaFeatureStore.pack(args.image_feature_folder)
+
+
+if __name__ == "__main__":
+    main()
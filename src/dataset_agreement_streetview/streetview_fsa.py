@@ -6,8 +6,9 @@ import numpy as np
 from collections import defaultdict
 
 from utils.edit_distance import levenshtein_distance
-from utils.fibonacci_heap import Fibonacci_heap
 from cachetools import LRUCache
+from dataset_agreement_streetview.panorama_feature_store import PanoramaFeatureStore, get_image_bytes
+from utils.shared_numpy import share_numpy, numpy_view
 
 
 class StreetViewState:
@@ -34,12 +35,20 @@ class StreetViewFSA:
 
     OLD_FEATURE, NEW_FEATURE, RGB = range(3)
 
-    image_feature_cache = LRUCache(maxsize=100000)
+    # Actions which are edges of the compiled state graph. Stop is a self-loop and is not compiled.
+    GRAPH_ACTIONS = ["turnleft", "turnright", "forward"]
+    FORWARD_INDEX = 2
 
-    def __init__(self, node_file, link_file, image_feature_folder, forward_setting_strict, mapping_type):
+    # Arrays of the compiled state graph which are moved to shared memory by share_memory
+    GRAPH_ARRAYS = ["successors", "predecessor_states", "predecessor_actions", "predecessor_indptr"]
+
+    def __init__(self, node_file, link_file, image_feature_folder, forward_setting_strict, mapping_type,
+                 feature_cache_bytes=PanoramaFeatureStore.DEFAULT_CACHE_BYTES):
 
         self.image_feature_folder = image_feature_folder
         self.forward_setting_strict = forward_setting_strict
+        self.feature_cache_bytes = feature_cache_bytes
+        self.shared_graph_arrays = None
 
         if mapping_type == "old":
             self.mapping = StreetViewFSA.OLD_FEATURE
@@ -66,6 +75,15 @@ class StreetViewFSA:
         else:
             self.image_feature_mapping = None
 
+        if self.mapping == StreetViewFSA.NEW_FEATURE:
+            # Stores every panorama once and computes the view for each orientation from it
+            self.panorama_feature_store = PanoramaFeatureStore(self.image_feature_folder, feature_cache_bytes)
+            self.image_feature_cache = None
+        else:
+            # Images of these mappings depend on the orientation so they are cached per (panorama, orientation)
+            self.panorama_feature_store = None
+            self.image_feature_cache = LRUCache(maxsize=max(1, feature_cache_bytes), getsizeof=get_image_bytes)
+
         self.node_to_panorama_dict = dict()
         self.panorama_to_node_dict = dict()
 
@@ -104,6 +122,169 @@ class StreetViewFSA:
         #         self.fsa_states.add((dest_node_id, orientation))  # one can enter dest_node_id with this orientation
         #         self.fsa_states.add((source_id, orientation))  # one can also turn in the original node to face this orientation
 
+        self.compile_state_graph()
+
+    def compile_state_graph(self):
+        """ Compile the FSA into integer indexed arrays. A state (node_id, orientation) is compiled for every
+        orientation of an outgoing edge of every node, which are all the states that are reached on taking
+        an action. successors[i, a] is the index of the state reached on taking GRAPH_ACTIONS[a] in the state
+        with index i, or -1 if that action is not an edge in this state (see get_successors). The edges entering
+        state j are stored at predecessor_indptr[j]: predecessor_indptr[j + 1] of predecessor_states and
+        predecessor_actions. """
+
+        self.state_to_index = dict()
+        self.index_to_state = []
+        self.node_to_state_indices = dict()
+        for node_id in sorted(self.outgoing_edges.keys()):
+            orientations = sorted(set([orientation for (_, orientation) in self.outgoing_edges[node_id]]))
+            self.node_to_state_indices[node_id] = list(range(len(self.index_to_state),
+                                                             len(self.index_to_state) + len(orientations)))
+            for orientation in orientations:
+                self.state_to_index[(node_id, orientation)] = len(self.index_to_state)
+                self.index_to_state.append((node_id, orientation))
+
+        num_states = len(self.index_to_state)
+        self.successors = np.full((num_states, len(StreetViewFSA.GRAPH_ACTIONS)), -1, dtype=np.int64)
+        for i, state in enumerate(self.index_to_state):
+            for act_name, new_state in self.get_successors(state).items():
+                self.successors[i, StreetViewFSA.GRAPH_ACTIONS.index(act_name)] = self.state_to_index[new_state]
+
+        sources, actions = np.nonzero(self.successors >= 0)
+        targets = self.successors[sources, actions]
+        order = np.argsort(targets, kind="mergesort")
+        self.predecessor_states = sources[order]
+        self.predecessor_actions = actions[order]
+        self.predecessor_indptr = np.zeros(num_states + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=num_states), out=self.predecessor_indptr[1:])
+
+    def share_memory(self):
+        """ Move the compiled state graph and the panorama features into shared memory. Processes to
+        which the FSA is then sent (e.g., as an argument of a torch.multiprocessing process) attach to
+        these arrays read-only instead of parsing the graph and loading the features again. Must be
+        called in the main process before the processes are started. """
+
+        if self.shared_graph_arrays is None:
+            self.shared_graph_arrays = dict()
+            for name in StreetViewFSA.GRAPH_ARRAYS:
+                self.shared_graph_arrays[name] = share_numpy(getattr(self, name))
+                setattr(self, name, numpy_view(self.shared_graph_arrays[name]))
+
+        if self.panorama_feature_store is not None:
+            self.panorama_feature_store.share_memory()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.shared_graph_arrays is not None:
+            for name in StreetViewFSA.GRAPH_ARRAYS:
+                state[name] = None
+        if self.image_feature_cache is not None:
+            state["image_feature_cache"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.shared_graph_arrays is not None:
+            for name in StreetViewFSA.GRAPH_ARRAYS:
+                setattr(self, name, numpy_view(self.shared_graph_arrays[name]))
+        if self.panorama_feature_store is None:
+            self.image_feature_cache = LRUCache(maxsize=max(1, self.feature_cache_bytes), getsizeof=get_image_bytes)
+
+    def get_successors(self, state_tuple):
+        """ Returns a dictionary from every action that is an edge of the FSA in the state (node_id, orientation)
+        to the state reached on taking it. Turning left and right faces the closest road in that direction. Forward
+        moves along the road closest to the current orientation, in the strict setting only if it is aligned with
+        it, and then faces the road at the new node which is closest to the direction of arrival. """
+
+        node_id, orientation = state_tuple
+        outgoing_edges = self.outgoing_edges[node_id]
+
+        left_most_orientation, shortest_left_most_angle = None, 360
+        right_most_orientation, shortest_right_most_angle = None, 360
+        shortest_angle_edge, shortest_turn_angle = None, 360
+
+        for (new_node_id, new_orientation) in outgoing_edges:
+
+            left_angle = self.get_turn_angle(orientation, new_orientation, direction="left")
+            right_angle = self.get_turn_angle(orientation, new_orientation, direction="right")
+            turn_angle = self.get_turn_angle(orientation, new_orientation, direction="shortest")
+
+            if 0 < left_angle < shortest_left_most_angle:
+                shortest_left_most_angle = left_angle
+                left_most_orientation = new_orientation
+
+            if 0 < right_angle < shortest_right_most_angle:
+                shortest_right_most_angle = right_angle
+                right_most_orientation = new_orientation
+
+            if turn_angle < shortest_turn_angle:
+                shortest_turn_angle = turn_angle
+                shortest_angle_edge = (new_node_id, new_orientation)
+
+        successors = dict()
+
+        if left_most_orientation is not None:
+            successors["turnleft"] = (node_id, left_most_orientation)
+
+        if right_most_orientation is not None:
+            successors["turnright"] = (node_id, right_most_orientation)
+
+        # Forward into a node without outgoing roads is not an edge since no action can be taken there
+        if shortest_angle_edge is not None and shortest_angle_edge[0] in self.outgoing_edges and \
+                ((not self.forward_setting_strict) or shortest_turn_angle == 0.0):
+
+            new_node_id, new_orientation = shortest_angle_edge
+            next_smallest_angle_diff = 1000
+            closest_next_orientation = new_orientation
+            for (_, next_orientation) in self.outgoing_edges[new_node_id]:
+                angle_diff = self.get_turn_angle(next_orientation, new_orientation, direction="shortest")
+                if angle_diff < next_smallest_angle_diff:
+                    next_smallest_angle_diff = angle_diff
+                    closest_next_orientation = next_orientation
+
+            successors["forward"] = (new_node_id, closest_next_orientation)
+
+        return successors
+
+    def compute_distance_field(self, goal_node_id):
+        """ Number of actions needed to reach the goal node from every compiled state using a breadth first
+        search over the predecessor arrays which starts from all the states at the goal node. Returns arrays with
+        the distance (-1 if the goal cannot be reached), the number of forward actions on the shortest path
+        having the fewest forward actions, and the first action (index in GRAPH_ACTIONS) of that path. """
+
+        num_states = len(self.index_to_state)
+        distance = np.full(num_states, -1, dtype=np.int64)
+        node_error = np.full(num_states, np.iinfo(np.int64).max, dtype=np.int64)
+        next_action = np.full(num_states, -1, dtype=np.int64)
+
+        frontier = np.array(self.node_to_state_indices.get(goal_node_id, []), dtype=np.int64)
+        distance[frontier] = 0
+        node_error[frontier] = 0
+        level = 0
+
+        while len(frontier) > 0:
+
+            # Gather all edges entering the frontier
+            starts = self.predecessor_indptr[frontier]
+            lengths = self.predecessor_indptr[frontier + 1] - starts
+            edge_offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            sources = self.predecessor_states[edge_offsets]
+            actions = self.predecessor_actions[edge_offsets]
+            targets = np.repeat(frontier, lengths)
+
+            unvisited = distance[sources] == -1
+            sources, actions, targets = sources[unvisited], actions[unvisited], targets[unvisited]
+
+            level += 1
+            distance[sources] = level
+            errors = node_error[targets] + (actions == StreetViewFSA.FORWARD_INDEX)
+            np.minimum.at(node_error, sources, errors)
+            best = errors == node_error[sources]
+            next_action[sources[best]] = actions[best]
+
+            frontier = np.unique(sources)
+
+        return distance, node_error, next_action
+
     def reset_to_new_state(self, datapoint):
 
         trajectory = datapoint.get_trajectory()
@@ -138,6 +319,16 @@ class StreetViewFSA:
 
         node_id = state.get_node_id()
         orientation = state.get_orientation()
+
+        # Look up the compiled state graph. States outside it and actions which are not edges (e.g., moving
+        # forward when not aligned with a road in the strict setting) are handled below.
+        index = self.state_to_index.get((node_id, orientation))
+        if index is not None and act_name in StreetViewFSA.GRAPH_ACTIONS:
+            new_index = self.successors[index, StreetViewFSA.GRAPH_ACTIONS.index(act_name)]
+            if new_index >= 0:
+                new_node_id, new_orientation = self.index_to_state[new_index]
+                return StreetViewState(new_node_id, new_orientation)
+
         outgoing_edges = self.outgoing_edges[node_id]
 
         if act_name == "forward":
@@ -222,28 +413,14 @@ class StreetViewFSA:
 
     def get_image_from_state_condensed_features(self, state):
 
-        panorama_id, _ = self.node_to_panorama_dict[state.get_node_id()]
+        panorama_id, panorama_orientation = self.node_to_panorama_dict[state.get_node_id()]
         state_orientation = state.get_orientation()
 
-        key = (panorama_id, state_orientation)
+        pano_width = self.panorama_feature_store.get_panorama(panorama_id).shape[1]
+        shift_angle = 157.5 + panorama_orientation - state_orientation
+        shift = int(pano_width * shift_angle / 360)
 
-        if key in self.image_feature_cache:
-            return self.image_feature_cache[key]
-        else:
-            _, panorama_orientation = self.node_to_panorama_dict[state.get_node_id()]
-
-            path = os.path.join(self.image_feature_folder, '{}.npy'.format(panorama_id))
-            image = np.load(path)
-            image = np.expand_dims(image, axis=0)
-            pano_width = image.shape[1]
-
-            shift_angle = 157.5 + panorama_orientation - state_orientation
-            shift = int(pano_width * shift_angle / 360)
-            image = np.roll(image, shift, axis=1)
-            image = image.swapaxes(1, 2).swapaxes(0, 1)
-            self.image_feature_cache[key] = image
-
-            return image
+        return self.panorama_feature_store.get_view(panorama_id, shift)
 
     def get_image_from_state_old(self, state):
 
@@ -327,124 +504,67 @@ class StreetViewUtils:
         self.fsa = fsa
         self.forward_setting_strict = fsa.forward_setting_strict
         self.action_space = action_space
-        self.dist = dict()  # dictionary of node_ids to real values
-        self.prev = dict()  # dictionary of node_ids to node_ids
-        self.fibonacci_node_map = dict()
-        self.fib_heap = Fibonacci_heap()
-        self.closed_set = set()  # set of closed states
-        # self.goal_node = None
 
+        # Distance field of the goal node (see StreetViewFSA.compute_distance_field)
         self.goal_node = None
-        self.distance_cache = dict()
+        self.distance_field = None
 
     def reset_utils(self, goal_state):
 
         self.goal_node = (goal_state.get_node_id(), goal_state.get_orientation())
-        self.distance_cache = dict()
+        self.distance_field = self.fsa.compute_distance_field(goal_state.get_node_id())
 
     def path_to_goal(self, start_state, destination_state, get_path=True):
-        """ Returns the shortest path to the goal state from the current state using Dijskta's algorithm """
+        """ Returns the length of the shortest path from the current state to any state at the node of the
+        destination state, the path as a list of (node, action) pairs starting with (None, "stop") if get_path
+        is True and the number of forward actions on the path. These are looked up in the distance field
+        computed by reset_utils, or computed afresh if the destination is not at the goal node. """
 
         source_node = (start_state.get_node_id(), start_state.get_orientation())
-        destination_node = (destination_state.get_node_id(), destination_state.get_orientation())
-
-        if destination_node == self.goal_node and source_node in self.distance_cache:
-            return self.distance_cache[source_node]
-
-        self.dist = dict()  # dictionary of node_ids to real values
-        self.prev = dict()  # dictionary of node_ids to node_ids
-        self.fibonacci_node_map = dict()
-        self.fib_heap = Fibonacci_heap()
-        self.closed_set = set()
-
-        self.dist[source_node] = 0.0
-        self.prev[source_node] = (None, "stop")
-        fib_node = self.fib_heap.enqueue(source_node, self.dist[source_node])
-        self.fibonacci_node_map[source_node] = fib_node
-
-        do_no_break_loop = True
-        distance = StreetViewUtils.MAX_DISTANCE
-        final_node = None
+        destination_node_id = destination_state.get_node_id()
 
-        while do_no_break_loop:
-
-            min_data = self.fib_heap.dequeue_min()
-
-            if min_data is None:
-                break
-
-            dist_u = min_data.get_priority()
-            u = min_data.get_value()
-
-            self.closed_set.add(u)
-
-            # Consider the following break condition. In each condition, we let the
-            # children of the breaking nodes be added to the heap before terminating.
-            # this way, we do not loose the children when continuing the next time.
-            if u[0] == destination_node[0]:
-                distance = dist_u
-                final_node = u
-                do_no_break_loop = False
+        if self.goal_node is not None and destination_node_id == self.goal_node[0]:
+            distance_field = self.distance_field
+        else:
+            distance_field = self.fsa.compute_distance_field(destination_node_id)
+        distance, node_error, next_action = distance_field
 
-            if dist_u == StreetViewUtils.MAX_DISTANCE:
-                # The shortest node that is not visited is at infinite distance
-                # so relaxation does not makes sense.
-                do_no_break_loop = False
+        path = [(None, "stop")]
+        index = self.fsa.state_to_index.get(source_node)
 
-            neighbors = StreetViewUtils.get_neighbors(u, self.fsa)
-            for v, edge_weight, name in neighbors:
+        if index is None:
+            # States outside the compiled graph are only the start states whose orientation is not along a road
+            if source_node[0] == destination_node_id:
+                return 0, path, 0
 
-                if v in self.closed_set:
+            best = None
+            for act_name, new_node in self.fsa.get_successors(source_node).items():
+                new_index = self.fsa.state_to_index[new_node]
+                if distance[new_index] < 0:
                     continue
+                key = (distance[new_index], node_error[new_index] + int(act_name == "forward"))
+                if best is None or key < best[0]:
+                    best = (key, act_name, new_index)
+
+            if best is None:
+                raise AssertionError("Shortest Path Distance exceeds max limit")
+            (source_distance, source_node_error), act_name, index = best
+            path.append((source_node, act_name))
+            source_distance += 1
+        else:
+            if distance[index] < 0:
+                raise AssertionError("Shortest Path Distance exceeds max limit")
+            source_distance, source_node_error = distance[index], node_error[index]
 
-                if v in self.dist:
-                    fib_node = self.fibonacci_node_map[v]
-                    dist_v = self.dist[v]
-                else:
-                    # Insert to Fib Heap
-                    dist_v = StreetViewUtils.MAX_DISTANCE
-                    self.dist[v] = dist_v
-                    self.prev[v] = (None, "stop")
-                    fib_node = self.fib_heap.enqueue(v, dist_v)
-                    self.fibonacci_node_map[v] = fib_node
-
-                alt = dist_u + edge_weight
-                if alt < dist_v:
-                    self.dist[v] = alt
-                    self.prev[v] = (u, name)  # name is the action required to go from u to this node
-
-                    # Update the fibonacci heap in O(1)
-                    self.fib_heap.decrease_key(fib_node, alt)
-
-        path = []
         if get_path:
-            iter_node = final_node
-            while iter_node is not None:
-                iter_node_pairs = self.prev[iter_node]
-                path.append(iter_node_pairs)
-                iter_node = iter_node_pairs[0]
-            path = list(reversed(path))
-
-        iter_node = final_node
-        dist_ix = 0
-        node_error = 0
-        while iter_node is not None:
-            self.distance_cache[iter_node] = (dist_ix, None, node_error)
-            dist_ix += 1
-            iter_node_pairs = self.prev[iter_node]
-            iter_node = iter_node_pairs[0]
-            act_name = iter_node_pairs[1]
-            if act_name == "forward":
-                node_error += 1
-
-        assert (dist_ix - 1) == distance, "distance should match"
-
-        if distance >= StreetViewUtils.MAX_DISTANCE:
-            raise AssertionError("Shortest Path Distance exceeds max limit")
-
-        self.distance_cache[source_node] = (distance, path, node_error)
-
-        return distance, path, node_error
+            while distance[index] > 0:
+                action = next_action[index]
+                path.append((self.fsa.index_to_state[index], StreetViewFSA.GRAPH_ACTIONS[action]))
+                index = self.fsa.successors[index, action]
+        else:
+            path = []
+
+        return int(source_distance), path, int(source_node_error)
 
     def get_task_completion_accuracy(self, state, datapoint):
 
@@ -550,67 +670,12 @@ class StreetViewUtils:
         """ Neighbors of a node consist of the left and right node achieved on turning and if the node can
             move forward then move forward."""
 
-        orientation = node[1]
-        outgoing_edges = fsa.outgoing_edges[node[0]]
-
-        left_most_node = None
-        shortest_left_most_angle = 360
-
-        right_most_node = None
-        shortest_right_most_angle = 360
-
-        shortest_angle_node = None
-        shortest_turn_angle = 360
-
-        for (new_node_id, new_orientation) in outgoing_edges:
-
-            left_angle = fsa.get_turn_angle(orientation, new_orientation, direction="left")
-            right_angle = fsa.get_turn_angle(orientation, new_orientation, direction="right")
-            turn_angle = fsa.get_turn_angle(orientation, new_orientation, direction="shortest")
-
-            if 0 < left_angle < shortest_left_most_angle:
-                shortest_left_most_angle = left_angle
-                left_most_node = (node[0], new_orientation)
-
-            if 0 < right_angle < shortest_right_most_angle:
-                shortest_right_most_angle = right_angle
-                right_most_node = (node[0], new_orientation)
-
-            if turn_angle < shortest_turn_angle:
-                shortest_turn_angle = turn_angle
-                shortest_angle_node = (new_node_id, new_orientation)
-
-        neighbors = set()
-
-        if (not fsa.forward_setting_strict) or shortest_turn_angle == 0.0:
-
-            if shortest_angle_node is not None:
-
-                next_smallest_angle_diff = 1000
-                new_outgoing_edges = fsa.outgoing_edges[shortest_angle_node[0]]
-                closest_next_orientation = shortest_angle_node[1]
-                for (_, next_orientation) in new_outgoing_edges:
-                    angle_diff = fsa.get_turn_angle(next_orientation, shortest_angle_node[1],
-                                                    direction="shortest")
-                    if angle_diff < next_smallest_angle_diff:
-                        next_smallest_angle_diff = angle_diff
-                        closest_next_orientation = next_orientation
-
-                forward_node = (shortest_angle_node[0], closest_next_orientation)
-                neighbors.add((forward_node, 1.0, "forward"))
-
-        if left_most_node is not None:
-            neighbors.add((left_most_node, 1.0, "turnleft"))
-
-        if right_most_node is not None:
-            neighbors.add((right_most_node, 1.0, "turnright"))
-
-        return neighbors
+        return set([(new_node, 1.0, act_name) for act_name, new_node in fsa.get_successors(node).items()])
 
     def get_reward(self, source_state, act_name, new_state, goal_state):
 
-        dist1, path1, _ = self.path_to_goal(source_state, goal_state)
-        dist2, path2, _ = self.path_to_goal(new_state, goal_state)
+        dist1, _, _ = self.path_to_goal(source_state, goal_state, get_path=False)
+        dist2, _, _ = self.path_to_goal(new_state, goal_state, get_path=False)
 
         problem_reward = -0.2
 
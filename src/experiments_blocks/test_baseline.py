@@ -15,6 +15,7 @@ from setup_agreement_blocks.validate_setup_blocks import BlocksSetupValidator
 from utils.check_port import find_k_ports
 from utils.launch_unity import launch_k_unity_builds
 from utils.multiprocess_logger import MultiprocessingLoggerManager
+from utils.vocabulary import Vocabulary
 
 
 # Environment arguments
@@ -68,13 +69,8 @@ def main():
     meta_data_util = MetaDataUtil()
 
     # Create vocabulary
-    vocab = dict()
-    vocab_list = open("./Assets/vocab_both").readlines()
-    for i, tk in enumerate(vocab_list):
-        token = tk.strip().lower()
-        vocab[token] = i
-    vocab["$UNK$"] = len(vocab_list)
-    config["vocab_size"] = len(vocab_list) + 1
+    vocab = Vocabulary.load("./Assets/vocab_both", lower=True, unk_token=Vocabulary.UNK_TOKEN)
+    config["vocab_size"] = vocab.size()
 
     try:
         # Read the dataset
@@ -22,6 +22,7 @@ from server_house.house_server import HouseServer
 from setup_agreement_house.validate_setup_house import HouseSetupValidator
 from utils.check_port import find_k_ports
 from utils.multiprocess_logger import MultiprocessingLoggerManager
+from utils.vocabulary import Vocabulary
 
 
 def main():
@@ -72,16 +73,10 @@ def main():
                                config["num_manipulation_row"], config["num_manipulation_col"])
     meta_data_util = MetaDataUtil()
 
-    # TODO: Create vocabulary
-    vocab = dict()
-    vocab_list = open(data_filename + "/house_all_vocab.txt").readlines()
-    for i, tk in enumerate(vocab_list):
-        token = tk.strip().lower()
-        # vocab[token] = i
-        vocab[i] = token
-    # vocab["$UNK$"] = len(vocab_list)
-    vocab[len(vocab_list)] = "$UNK$"
-    config["vocab_size"] = len(vocab_list) + 1
+    # Create vocabulary
+    vocabulary = Vocabulary.load(data_filename + "/house_all_vocab.txt", lower=True, unk_token=Vocabulary.UNK_TOKEN)
+    vocab = vocabulary.id_to_token
+    config["vocab_size"] = vocabulary.size()
 
     # Number of processes
     house_ids = [1, 2, 3, 4, 5]
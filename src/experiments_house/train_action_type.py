@@ -18,6 +18,7 @@ from models.incremental_model.incremental_model_attention_chaplot_resnet import
 from models.module.action_type_module import ActionTypeModule
 from setup_agreement_house.validate_setup_house import HouseSetupValidator
 from utils.tensorboard import Tensorboard
+from utils.vocabulary import Vocabulary
 
 data_filename = "simulators/house/AssetsHouse"
 experiment_name = "train_house_action_types"
@@ -65,16 +66,9 @@ action_space = ActionSpace(config["action_names"], config["stop_action"], config
                            config["num_manipulation_row"], config["num_manipulation_col"])
 meta_data_util = MetaDataUtil()
 
-# TODO: Create vocabulary
-vocab = dict()
-vocab_list = open(data_filename + "/house_all_vocab.txt").readlines()
-for i, tk in enumerate(vocab_list):
-    token = tk.strip().lower()
-    vocab[token] = i
-    # vocab[i] = token
-vocab["$UNK$"] = len(vocab_list)
-# vocab[len(vocab_list)] = "$UNK$"
-config["vocab_size"] = len(vocab_list) + 1
+# Create vocabulary
+vocab = Vocabulary.load(data_filename + "/house_all_vocab.txt", lower=True, unk_token=Vocabulary.UNK_TOKEN)
+config["vocab_size"] = vocab.size()
 
 # Number of processes
 house_ids = [1, 2, 3, 4, 5]
@@ -10,6 +10,7 @@ from dataset_agreement_house.action_space import ActionSpace
 from dataset_agreement_house.metadata_util import MetaDataUtil
 from dataset_agreement_house.dataset_parser import DatasetParser
 from learning.asynchronous.tmp_house_asynchronous_contextual_bandit_learning import TmpAsynchronousContextualBandit
+from learning.asynchronous.gradient_exchange import GradientExchange
 from models.incremental_model.tmp_house_incremental_model_chaplot import TmpHouseIncrementalModelChaplot
 from models.incremental_model.tmp_house_incremental_model_oracle_gold_prob import TmpHouseIncrementalModelOracleGoldProb
 from models.incremental_model.tmp_house_misra_baseline import TmpHouseMisraBaseline
@@ -17,6 +18,7 @@ from server_house.house_server import HouseServer
 from setup_agreement_house.validate_setup_house import HouseSetupValidator
 from utils.check_port import find_k_ports
 from utils.multiprocess_logger import MultiprocessingLoggerManager
+from utils.vocabulary import Vocabulary
 
 
 def main():
@@ -67,21 +69,19 @@ def main():
                                config["num_manipulation_row"], config["num_manipulation_col"])
     meta_data_util = MetaDataUtil()
 
-    # TODO: Create vocabulary
-    vocab = dict()
-    vocab_list = open(data_filename + "/house_all_vocab.txt").readlines()
-    for i, tk in enumerate(vocab_list):
-        token = tk.strip().lower()
-        # vocab[token] = i
-        vocab[i] = token
-    # vocab["$UNK$"] = len(vocab_list)
-    vocab[len(vocab_list)] = "$UNK$"
-    config["vocab_size"] = len(vocab_list) + 1
+    # Create vocabulary
+    vocabulary = Vocabulary.load(data_filename + "/house_all_vocab.txt", lower=True, unk_token=Vocabulary.UNK_TOKEN)
+    vocab = vocabulary.id_to_token
+    config["vocab_size"] = vocabulary.size()
 
     # Number of processes
     house_ids = [1, 2, 3, 4, 5]
     num_processes = len(house_ids)
 
+    # How gradients of the processes are applied to the shared model: hogwild, locked, sync or
+    # bounded-staleness (see GradientExchange)
+    gradient_exchange_mode = GradientExchange.HOGWILD
+
     try:
         # Create the model
         master_logger.log("CREATING MODEL")
@@ -91,6 +91,7 @@ def main():
 
         # make the shared model use share memory
         shared_model.share_memory()
+        GradientExchange.share(shared_model, gradient_exchange_mode, num_processes)
 
         master_logger.log("MODEL CREATED")
         print("Created Model...")
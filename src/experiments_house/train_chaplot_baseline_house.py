@@ -7,6 +7,7 @@ import argparse
 import torch.multiprocessing as mp
 import utils.generic_policy as gp
 
+from baselines.baseline_device import BaselineDevice
 from baselines.chaplot_model_concat_gavector import a3c_lstm_ga_concat_gavector
 from baselines.chaplot_model_house_default import a3c_lstm_ga_default
 from dataset_agreement_house.action_space import ActionSpace
@@ -17,6 +18,7 @@ from setup_agreement_house.validate_setup_house import HouseSetupValidator
 from utils.tensorboard import Tensorboard
 from utils.multiprocess_logger import MultiprocessingLoggerManager
 from utils.check_port import find_k_ports
+from utils.vocabulary import Vocabulary
 from baselines.chaplot_baseline_house import ChaplotBaselineHouse
 
 
@@ -74,14 +76,8 @@ def main(args):
     meta_data_util = MetaDataUtil()
 
     # Create vocabulary
-    vocab = dict()
-    vocab_list = open(data_filename + "/house_all_vocab.txt").readlines()
-    for i, tk in enumerate(vocab_list):
-        token = tk.strip().lower()
-        # vocab[token] = i
-        vocab[i] = token
-    # vocab["$UNK$"] = len(vocab_list)
-    vocab[len(vocab_list)] = "$UNK$"
+    vocabulary = Vocabulary.load(data_filename + "/house_all_vocab.txt", lower=True, unk_token=Vocabulary.UNK_TOKEN)
+    vocab = vocabulary.id_to_token
 
     args.input_size = config['vocab_size'] + 2
 
@@ -224,6 +220,7 @@ if __name__ == "__main__":
                         2:Evaluate Zero-shot Generalization (default: 0)""")
     parser.add_argument('--dump-location', type=str, default="./saved/",
                         help='path to dump models and log (default: ./saved/)')
+    BaselineDevice.add_arguments(parser)
 
     args = parser.parse_args()
     print(args)
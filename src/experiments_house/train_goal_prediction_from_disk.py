@@ -15,6 +15,7 @@ from learning.single_client.goal_prediction_house_single_360_image_supervised_fr
 from models.incremental_model.incremental_model_attention_chaplot_resnet import IncrementalModelAttentionChaplotResNet
 from setup_agreement_house.validate_setup_house import HouseSetupValidator
 from utils.tensorboard import Tensorboard
+from utils.vocabulary import Vocabulary
 
 data_filename = "simulators/house/AssetsHouse"
 experiment_name = "train_house_goal_prediction_m4jksum1_repeat"
@@ -62,16 +63,9 @@ action_space = ActionSpace(config["action_names"], config["stop_action"], config
                            config["num_manipulation_row"], config["num_manipulation_col"])
 meta_data_util = MetaDataUtil()
 
-# TODO: Create vocabulary
-vocab = dict()
-vocab_list = open(data_filename + "/house_all_vocab.txt").readlines()
-for i, tk in enumerate(vocab_list):
-    token = tk.strip().lower()
-    vocab[token] = i
-    # vocab[i] = token
-vocab["$UNK$"] = len(vocab_list)
-# vocab[len(vocab_list)] = "$UNK$"
-config["vocab_size"] = len(vocab_list) + 1
+# Create vocabulary
+vocab = Vocabulary.load(data_filename + "/house_all_vocab.txt", lower=True, unk_token=Vocabulary.UNK_TOKEN)
+config["vocab_size"] = vocab.size()
 
 config["do_goal_prediction"] = True  # force the goal prediction to happen
 
@@ -8,6 +8,7 @@ import argparse
 
 import utils.generic_policy as gp
 from agents.agent import Agent
+from baselines.baseline_device import BaselineDevice
 from baselines.chaplot_model_concat_gavector import a3c_lstm_ga_concat_gavector
 from baselines.chaplot_model_default import a3c_lstm_ga_default
 from dataset_agreement_nav_drone.action_space import ActionSpace
@@ -109,6 +110,7 @@ parser.add_argument('-e', '--evaluate', type=int, default=0,
                     2:Evaluate Zero-shot Generalization (default: 0)""")
 parser.add_argument('--dump-location', type=str, default="./saved/",
                     help='path to dump models and log (default: ./saved/)')
+BaselineDevice.add_arguments(parser)
 
 args = parser.parse_args()
 
@@ -9,6 +9,7 @@ from dataset_agreement_nav_drone.action_space import ActionSpace
 from dataset_agreement_nav_drone.metadata_util import MetaDataUtil
 from dataset_agreement_nav_drone.nav_drone_dataset_parser import DatasetParser
 from learning.asynchronous.asynchronous_contextual_bandit_learning import AsynchronousContextualBandit
+from learning.asynchronous.gradient_exchange import GradientExchange
 from models.incremental_model.incremental_model_oracle_gold_prob import IncrementalModelOracleGoldProb, \
     IncrementalModelOracleGoldProbWithImage
 from server_nav_drone.nav_drone_server_py3 import NavDroneServerPy3
@@ -64,6 +65,14 @@ def main():
     # Number of processes
     num_processes = 6
 
+    # Number of simulators driven by each process. If more than 1 then each process
+    # batches the forward passes of all its simulators (see BatchedRollout).
+    num_envs_per_process = 1
+
+    # How gradients of the processes are applied to the shared model: hogwild, locked, sync or
+    # bounded-staleness (see GradientExchange)
+    gradient_exchange_mode = GradientExchange.HOGWILD
+
     try:
         # Create the model
         master_logger.log("CREATING MODEL")
@@ -77,6 +86,7 @@ def main():
 
         # Make the shared model use share memory
         shared_model.share_memory()
+        GradientExchange.share(shared_model, gradient_exchange_mode, num_processes)
 
         master_logger.log("MODEL CREATED")
         print("Created Model...")
@@ -108,11 +118,16 @@ def main():
             train_split_process_chunks.append(chunk)
 
         # Start the training thread(s)
-        ports = find_k_ports(num_processes)
-        for i, port in enumerate(ports):
+        ports = find_k_ports(num_processes * num_envs_per_process)
+        for i in range(0, num_processes):
             train_chunk = train_split_process_chunks[i]
-            tmp_config = {k: v for k, v in config.items()}
-            tmp_config["port"] = port
+            process_ports = ports[i * num_envs_per_process: (i + 1) * num_envs_per_process]
+            servers = []
+            for port in process_ports:
+                tmp_config = {k: v for k, v in config.items()}
+                tmp_config["port"] = port
+                servers.append(NavDroneServerPy3(tmp_config, action_space, multi_client=True))
+            tmp_config = servers[0].config
             if i == num_processes - 1:
                 # Master client which does testing. Don't want each client to do testing.
                 tmp_tune_split = tune_split
@@ -120,14 +135,18 @@ def main():
                 tmp_tune_split = []
 
             print("Client " + str(i) + " getting a validation set of size ", len(tmp_tune_split))
-            server = NavDroneServerPy3(tmp_config, action_space, multi_client=True)
             client_logger = multiprocess_logging_manager.get_logger(i)
 
-            p = mp.Process(target=AsynchronousContextualBandit.do_train, args=(simulator_file, shared_model, tmp_config,
-                                                                               action_space, meta_data_util,
-                                                                               constants, train_chunk, tmp_tune_split,
-                                                                               experiment, experiment_name, i, server,
-                                                                               client_logger, model_type))
+            if num_envs_per_process == 1:
+                p = mp.Process(target=AsynchronousContextualBandit.do_train,
+                               args=(simulator_file, shared_model, tmp_config, action_space, meta_data_util,
+                                     constants, train_chunk, tmp_tune_split, experiment, experiment_name, i,
+                                     servers[0], client_logger, model_type))
+            else:
+                p = mp.Process(target=AsynchronousContextualBandit.do_train_batched,
+                               args=(simulator_file, shared_model, tmp_config, action_space, meta_data_util,
+                                     constants, train_chunk, tmp_tune_split, experiment, experiment_name, i,
+                                     servers, client_logger, model_type))
             p.daemon = False
             p.start()
             processes.append(p)
@@ -6,6 +6,7 @@ import traceback
 import argparse
 import torch.multiprocessing as mp
 
+from baselines.baseline_device import BaselineDevice
 from baselines.chaplot_model_concat_gavector import a3c_lstm_ga_concat_gavector
 from baselines.chaplot_model_default import a3c_lstm_ga_default
 from baselines.chaplot_model_default_auxiliary import a3c_lstm_ga_default_with_aux
@@ -102,6 +103,7 @@ def main():
                         2:Evaluate Zero-shot Generalization (default: 0)""")
     parser.add_argument('--dump-location', type=str, default="./saved/",
                         help='path to dump models and log (default: ./saved/)')
+    BaselineDevice.add_arguments(parser)
 
     args = parser.parse_args()
 
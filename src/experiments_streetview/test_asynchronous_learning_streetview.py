@@ -147,11 +147,14 @@ def main():
 
         assert sum([len(chunk) for chunk in test_split_process_chunks]) == len(test_split), "Test dataset not properly partitioned." 
 
+        # Build the FSA once in shared memory. Every process attaches to it instead of building its own.
+        shared_fsa = StreetViewServer.create_shared_fsa(config, forward_setting_strict=False)
+
         # Start the training thread(s)
         for i in range(0, num_processes):
             test_chunk = test_split_process_chunks[i]
             print("Client " + str(i) + " getting a test set of size ", len(test_chunk))
-            server = StreetViewServer(config, action_space, forward_setting_strict=False)
+            server = StreetViewServer(config, action_space, forward_setting_strict=False, fsa=shared_fsa)
             client_logger = multiprocess_logging_manager.get_logger(i)
             p = mp.Process(target=TmpStreetViewAsynchronousContextualBandit.do_test, args=(shared_model, config,
                                                                                            action_space,
@@ -9,6 +9,7 @@ import torch.multiprocessing as mp
 from dataset_agreement_streetview.action_space import ActionSpace
 from dataset_agreement_streetview.metadata_util import MetaDataUtil
 from dataset_agreement_streetview.dataset_parser import DatasetParser
+from learning.asynchronous.gradient_exchange import GradientExchange
 from learning.asynchronous.tmp_streetview_asynchronous_contextual_bandit_learning import \
     TmpStreetViewAsynchronousContextualBandit
 from learning.asynchronous.tmp_streetview_asynchronous_supervised_learning import \
@@ -76,6 +77,10 @@ def main():
     learning_alg = args.learning_alg
     master_logger.log("Num processes %r, Learning Algorithm %r " % (num_processes, learning_alg))
 
+    # How gradients of the processes are applied to the shared model: hogwild, locked, sync or
+    # bounded-staleness (see GradientExchange)
+    gradient_exchange_mode = GradientExchange.HOGWILD
+
     try:
         # Create the model
         master_logger.log("CREATING MODEL")
@@ -87,6 +92,7 @@ def main():
 
         # make the shared model use share memory
         shared_model.share_memory()
+        GradientExchange.share(shared_model, gradient_exchange_mode, num_processes)
 
         master_logger.log("MODEL CREATED")
         print("Created Model...")
@@ -112,6 +118,9 @@ def main():
             train_pad += train_chunk_size
             tune_pad += tune_chunk_size
 
+        # Build the FSA once in shared memory. Every process attaches to it instead of building its own.
+        shared_fsa = StreetViewServer.create_shared_fsa(config, forward_setting_strict=False)
+
         # Start the training thread(s)
         for i in range(0, num_processes):
             train_chunk = train_split_process_chunks[i]
@@ -121,7 +130,7 @@ def main():
             else:
                 tmp_tune_split = tune_split_process_chunks[i]
             print("Client " + str(i) + " getting a validation set of size ", len(tmp_tune_split))
-            server = StreetViewServer(config, action_space, forward_setting_strict=False)
+            server = StreetViewServer(config, action_space, forward_setting_strict=False, fsa=shared_fsa)
             client_logger = multiprocess_logging_manager.get_logger(i)
 
             if learning_alg == "cb" or (learning_alg == "mix" and i < num_processes - 2):
@@ -6,6 +6,7 @@ import traceback
 import argparse
 import torch.multiprocessing as mp
 
+from baselines.baseline_device import BaselineDevice
 from baselines.chaplot_baseline_multiprocess_streetview import ChaplotBaselineStreetView
 from baselines.chaplot_model_concat_gavector import a3c_lstm_ga_concat_gavector
 from baselines.chaplot_model_default import a3c_lstm_ga_default
@@ -100,6 +101,7 @@ def main():
                         2:Evaluate Zero-shot Generalization (default: 0)""")
     parser.add_argument('--dump-location', type=str, default="./saved/",
                         help='path to dump models and log (default: ./saved/)')
+    BaselineDevice.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -171,13 +173,16 @@ def main():
             train_pad += train_chunk_size
             tune_pad += tune_chunk_size
 
+        # Build the FSA once in shared memory. Every process attaches to it instead of building its own.
+        shared_fsa = StreetViewServer.create_shared_fsa(config, forward_setting_strict=False)
+
         # Start the training thread(s)
         for i in range(args.num_processes):
             train_chunk = train_split_process_chunks[i]
             tune_chunk = tune_split_process_chunks[i]
             print ("Client " + str(i) + " receives train-split of size %d and tune-split of size %d " %
                    (len(train_chunk), len(tune_chunk)))
-            server = StreetViewServer(config, action_space, forward_setting_strict=False)
+            server = StreetViewServer(config, action_space, forward_setting_strict=False, fsa=shared_fsa)
             client_logger = multiprocess_logging_manager.get_logger(i)
             p = mp.Process(target=ChaplotBaselineStreetView.do_train, args=(model, shared_model, config,
                                                                             action_space, meta_data_util, args,
@@ -1,5 +1,7 @@
 import torch
 
+from learning.asynchronous.gradient_exchange import GradientExchange
+
 
 class AbstractLearning:
 
@@ -14,6 +16,7 @@ class AbstractLearning:
         self.iter = 0
         self.grad_log_enable = False
         self.grad_log_iter = 200
+        self.gradient_exchange = GradientExchange(shared_model, local_model, optimizer)
 
     def do_update(self, batch_replay_items):
 
@@ -22,12 +25,11 @@ class AbstractLearning:
         if loss is None:
             return 0
 
-        self.optimizer.zero_grad()
+        self.gradient_exchange.zero_grads()
         loss.backward()
         torch.nn.utils.clip_grad_norm(self.local_navigator_model.get_parameters(), 40)
 
-        self.ensure_shared_grads(self.local_navigator_model, self.shared_navigator_model)
-        self.optimizer.step()
+        self.gradient_exchange.apply()
 
         if self.grad_log_enable:
             if self.iter % self.grad_log_iter == 0:
@@ -40,28 +42,21 @@ class AbstractLearning:
 
     @staticmethod
     def ensure_shared_grads(local_model, shared_model):
-
-        local_model_parameters = local_model.get_parameters()
-        shared_model_parameters = shared_model.get_parameters()
-
-        for param, shared_param in zip(local_model_parameters, shared_model_parameters):
-            if shared_param.grad is not None:
-                return
-            shared_param._grad = param.grad
+        GradientExchange.copy_grads(local_model, shared_model)
 
     def write_grad_summaries(self):
         if self.tensorboard is None:
             return
         named_params = self.local_navigator_model.get_named_parameters()
         for name, parameter in named_params:
-            weights = parameter.data.cpu()
+            weights = parameter.data
             mean_weight = torch.mean(torch.abs(weights))
-            weights = weights.numpy()
-            self.tensorboard.log_histogram("hist_" + name + "_data", weights, bins=100)
+            self.tensorboard.log_histogram("hist_" + name + "_data", self.tensorboard.sample_tensor(weights),
+                                           bins=100)
             self.tensorboard.log_scalar("mean_" + name + "_data", mean_weight)
             if parameter.grad is not None:
-                grad = parameter.grad.data.cpu()
+                grad = parameter.grad.data
                 mean_grad = torch.mean(torch.abs(grad))
-                grad = grad.numpy()
-                self.tensorboard.log_histogram("hist_" + name + "_grad", grad, bins=100)
+                self.tensorboard.log_histogram("hist_" + name + "_grad", self.tensorboard.sample_tensor(grad),
+                                               bins=100)
                 self.tensorboard.log_scalar("mean_" + name + "_grad", mean_grad)
@@ -7,8 +7,10 @@ import numpy as np
 
 from agents.agent import Agent
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.asynchronous.abstract_learning import AbstractLearning
+from learning.asynchronous.parameter_sync import ParameterSync
+from learning.asynchronous.batched_rollout import BatchedRollout
 from utils.cuda import cuda_var
 from utils.launch_unity import launch_k_unity_builds
 from utils.pushover_logger import PushoverLogger
@@ -37,19 +39,10 @@ class AsynchronousContextualBandit(AbstractLearning):
     def calc_loss(self, batch_replay_items):
         """ Given a set of replay items this function calculates the loss variable """
 
-        agent_observation_state_ls = []
-        immediate_rewards = []
-        action_batch = []
-        log_probabilities = []
-        for replay_item in batch_replay_items:
-            agent_observation_state_ls.append(replay_item.get_agent_observed_state())
-            action_batch.append(replay_item.get_action())
-            immediate_rewards.append(replay_item.get_reward())
-            log_probabilities.append(replay_item.get_log_prob())
-
-        log_probabilities = torch.cat(log_probabilities)
-        action_batch = cuda_var(torch.from_numpy(np.array(action_batch)))
-        immediate_rewards = cuda_var(torch.from_numpy(np.array(immediate_rewards)).float())
+        batch = ReplayBatch.from_items(batch_replay_items)
+        log_probabilities = batch.get_log_prob_batch()
+        action_batch = batch.get_action_batch()
+        immediate_rewards = batch.get_reward_batch()
 
         model_log_prob_batch = log_probabilities
         chosen_log_probs = model_log_prob_batch.gather(1, action_batch.view(-1, 1))
@@ -88,10 +81,8 @@ class AsynchronousContextualBandit(AbstractLearning):
 
         # torch.manual_seed(args.seed + rank)
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
 
         if use_pushover:
             pushover_logger = PushoverLogger(experiment_name)
@@ -122,21 +113,29 @@ class AsynchronousContextualBandit(AbstractLearning):
         learner = AsynchronousContextualBandit(shared_model, local_model, action_space, meta_data_util,
                                                config, constants, tensorboard)
 
+        # Copy the shared parameters only when another update has been made
+        parameter_sync = ParameterSync(shared_model, local_model)
+
         for epoch in range(1, max_epochs + 1):
 
             for data_point_ix, data_point in enumerate(train_dataset):
 
                 # Sync with the shared model
-                local_model.load_from_state_dict(shared_model.get_state_dict())
+                parameter_sync.maybe_sync()
 
                 if (data_point_ix + 1) % 100 == 0:
                     logger.log("Done %d out of %d" %(data_point_ix, dataset_size))
                     logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % parameter_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
 
                 num_actions = 0
                 max_num_actions = constants["horizon"] + constants["max_extra_horizon"]
 
-                image, metadata = agent.server.reset_receive_feedback(data_point)
+                # The reset for this data point is issued while the previous update is performed
+                if data_point_ix == 0:
+                    agent.server.reset_nonblocking(data_point)
+                image, metadata = agent.server.receive_reset_feedback()
 
                 state = AgentObservedState(instruction=data_point.instruction,
                                            config=config,
@@ -147,7 +146,7 @@ class AsynchronousContextualBandit(AbstractLearning):
                 meta_data_util.start_state_update_metadata(state, metadata)
 
                 model_state = None
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
                 total_reward = 0
                 forced_stop = True
 
@@ -193,6 +192,10 @@ class AsynchronousContextualBandit(AbstractLearning):
                                                    reward, log_prob=log_probabilities, volatile=volatile)
                     batch_replay_items.append(replay_item)
 
+                # Reset the simulator for the next data point while the update is performed
+                if data_point_ix + 1 < dataset_size:
+                    agent.server.reset_nonblocking(train_dataset[data_point_ix + 1])
+
                 # Perform update
                 if len(batch_replay_items) > 0:
                     loss_val = learner.do_update(batch_replay_items)
@@ -203,6 +206,121 @@ class AsynchronousContextualBandit(AbstractLearning):
                         tensorboard.log_scalar("entropy", entropy)
                         tensorboard.log_scalar("total_reward", total_reward)
 
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
+            # Save the model
+            local_model.save_model(experiment + "/contextual_bandit_" + str(rank) + "_epoch_" + str(epoch))
+            logger.log("Training data action counts %r" % action_counts)
+
+            if tune_dataset_size > 0:
+                # Test on tuning data
+                agent.test(tune_dataset, tensorboard=tensorboard,
+                           logger=logger, pushover_logger=pushover_logger)
+
+    @staticmethod
+    def do_train_batched(simulator_file, shared_model, config, action_space, meta_data_util,
+                         constants, train_dataset, tune_dataset, experiment,
+                         experiment_name, rank, servers, logger, model_type, use_pushover=False):
+        try:
+            AsynchronousContextualBandit.do_train_batched_(simulator_file, shared_model, config, action_space,
+                                                           meta_data_util, constants, train_dataset, tune_dataset,
+                                                           experiment, experiment_name, rank, servers, logger,
+                                                           model_type, use_pushover)
+        except Exception:
+            exc_info = sys.exc_info()
+            traceback.print_exception(*exc_info)
+
+    @staticmethod
+    def do_train_batched_(simulator_file, shared_model, config, action_space, meta_data_util, constants,
+                          train_dataset, tune_dataset, experiment, experiment_name, rank, servers,
+                          logger, model_type, use_pushover=False):
+        """ Same as do_train_ but a single process drives all the given servers in lockstep. Every server
+        must have its own port in its config. Data points are consumed in waves of len(servers) episodes
+        and a single update is performed on the replay items of the whole wave. """
+
+        # Launch unity
+        launch_k_unity_builds([server.config["port"] for server in servers], simulator_file)
+        for server in servers:
+            server.initialize_server()
+
+        # Test policy
+        test_policy = gp.get_argmax_action
+
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
+
+        if use_pushover:
+            pushover_logger = PushoverLogger(experiment_name)
+        else:
+            pushover_logger = None
+
+        # Create a local model for rollouts
+        local_model = model_type(config, constants)
+
+        # Create the Agent. Only used for testing on the first server.
+        logger.log("STARTING AGENT")
+        agent = Agent(server=servers[0],
+                      model=local_model,
+                      test_policy=test_policy,
+                      action_space=action_space,
+                      meta_data_util=meta_data_util,
+                      config=config,
+                      constants=constants)
+        logger.log("Created Agent...")
+
+        batched_rollout = BatchedRollout(servers, local_model, action_space, meta_data_util, config, constants)
+        num_envs = batched_rollout.num_envs()
+        logger.log("Driving %d servers from a single process" % num_envs)
+
+        action_counts = [0] * action_space.num_actions()
+        max_epochs = constants["max_epochs"]
+        dataset_size = len(train_dataset)
+        tune_dataset_size = len(tune_dataset)
+
+        # Create the learner to compute the loss
+        learner = AsynchronousContextualBandit(shared_model, local_model, action_space, meta_data_util,
+                                               config, constants, tensorboard)
+
+        # Copy the shared parameters only when another update has been made
+        parameter_sync = ParameterSync(shared_model, local_model)
+
+        for epoch in range(1, max_epochs + 1):
+
+            for wave_start in range(0, dataset_size, num_envs):
+
+                # Sync with the shared model
+                parameter_sync.maybe_sync()
+
+                if wave_start // 100 != (wave_start + num_envs) // 100:
+                    logger.log("Done %d out of %d" % (wave_start, dataset_size))
+                    logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % parameter_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
+
+                data_points = train_dataset[wave_start: wave_start + num_envs]
+                episodes = batched_rollout.rollout(data_points, action_counts, tensorboard)
+
+                batch_replay_items = ReplayBatch()
+                total_num_actions = 0
+                for _, episode_replay_items, total_reward, num_actions in episodes:
+                    batch_replay_items.extend(episode_replay_items)
+                    total_num_actions += num_actions + 1
+                    if tensorboard is not None:
+                        tensorboard.log_scalar("total_reward", total_reward)
+
+                # Perform update
+                if len(batch_replay_items) > 0:
+                    loss_val = learner.do_update(batch_replay_items)
+
+                    if tensorboard is not None:
+                        entropy = float(learner.entropy.data[0])/float(total_num_actions)
+                        tensorboard.log_scalar("loss", loss_val)
+                        tensorboard.log_scalar("entropy", entropy)
+
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
             # Save the model
             local_model.save_model(experiment + "/contextual_bandit_" + str(rank) + "_epoch_" + str(epoch))
             logger.log("Training data action counts %r" % action_counts)
@@ -210,4 +328,4 @@ class AsynchronousContextualBandit(AbstractLearning):
             if tune_dataset_size > 0:
                 # Test on tuning data
                 agent.test(tune_dataset, tensorboard=tensorboard,
-                           logger=logger, pushover_logger=pushover_logger)
\ No newline at end of file
+                           logger=logger, pushover_logger=pushover_logger)
@@ -0,0 +1,125 @@
+import torch
+import utils.generic_policy as gp
+
+from agents.agent_observed_state import AgentObservedState
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
+
+
+class EpisodeSlot:
+    """ Book-keeping for a single live episode running on one of the servers of a BatchedRollout """
+
+    def __init__(self, server):
+        self.server = server
+        self.data_point = None
+        self.state = None
+        self.model_state = None
+        self.batch_replay_items = ReplayBatch()
+        self.total_reward = 0
+        self.num_actions = 0
+        self.done = True
+
+    def reset(self, data_point, config, constants, meta_data_util):
+        image, metadata = self.server.reset_receive_feedback(data_point)
+        self.data_point = data_point
+        self.state = AgentObservedState(instruction=data_point.instruction,
+                                        config=config,
+                                        constants=constants,
+                                        start_image=image,
+                                        previous_action=None,
+                                        data_point=data_point)
+        meta_data_util.start_state_update_metadata(self.state, metadata)
+        self.model_state = None
+        self.batch_replay_items = ReplayBatch()
+        self.total_reward = 0
+        self.num_actions = 0
+        self.done = False
+
+
+class BatchedRollout:
+    """ Drives several servers from a single process. At every tick the observed states of all live
+    episodes are stacked into a single get_probs_batch call, actions are sampled and sent to the
+    respective servers. Episodes which stop early are masked out of the batch while the others continue.
+    A rollout of a wave ends when every episode in the wave has finished. """
+
+    def __init__(self, servers, local_model, action_space, meta_data_util, config, constants):
+        self.slots = [EpisodeSlot(server) for server in servers]
+        self.local_model = local_model
+        self.action_space = action_space
+        self.meta_data_util = meta_data_util
+        self.config = config
+        self.constants = constants
+        self.max_num_actions = constants["horizon"] + constants["max_extra_horizon"]
+
+    def num_envs(self):
+        return len(self.slots)
+
+    def rollout(self, data_points, action_counts=None, tensorboard=None):
+        """ Runs one episode per data point (at most one per server) in lockstep and returns a list of
+        (data_point, batch_replay_items, total_reward, num_actions) for every episode in the wave """
+
+        assert len(data_points) <= len(self.slots), "More data points than servers"
+        slots = self.slots[:len(data_points)]
+        for slot, data_point in zip(slots, data_points):
+            slot.reset(data_point, self.config, self.constants, self.meta_data_util)
+
+        stop_action = self.action_space.get_stop_action_index()
+
+        while True:
+            live_slots = [slot for slot in slots if not slot.done]
+            if len(live_slots) == 0:
+                break
+
+            # Single forward pass for all live episodes
+            log_probabilities, new_model_states, _, volatile_list = self.local_model.get_probs_batch(
+                [slot.state for slot in live_slots], model_state_list=[slot.model_state for slot in live_slots])
+            probabilities_batch = torch.exp(log_probabilities.data)
+
+            for i, slot in enumerate(live_slots):
+                log_prob = log_probabilities[i:i + 1]
+                volatile = volatile_list[i]
+                slot.model_state = new_model_states[i]
+
+                # Sample action from the probability
+                action = gp.sample_action_from_prob(list(probabilities_batch[i]))
+                if action_counts is not None:
+                    action_counts[action] += 1
+
+                if action == stop_action:
+                    self._halt(slot, log_prob, volatile, forced_stop=False, tensorboard=tensorboard)
+                    continue
+
+                # Send the action and get feedback
+                image, reward, metadata = slot.server.send_action_receive_feedback(action)
+
+                # Store it in the replay memory list
+                replay_item = ReplayMemoryItem(slot.state, action, reward, log_prob=log_prob, volatile=volatile)
+                slot.batch_replay_items.append(replay_item)
+
+                # Update the agent state
+                slot.state = slot.state.update(image, action, data_point=slot.data_point)
+                self.meta_data_util.state_update_metadata(slot.state, metadata)
+
+                slot.num_actions += 1
+                slot.total_reward += reward
+
+                if slot.num_actions >= self.max_num_actions:
+                    self._halt(slot, None, None, forced_stop=True, tensorboard=tensorboard)
+
+        return [(slot.data_point, slot.batch_replay_items, slot.total_reward, slot.num_actions) for slot in slots]
+
+    def _halt(self, slot, log_prob, volatile, forced_stop, tensorboard):
+        """ Send final STOP action to the server of this slot and close its episode """
+
+        image, reward, metadata = slot.server.halt_and_receive_feedback()
+        slot.total_reward += reward
+
+        if tensorboard is not None:
+            self.meta_data_util.state_update_metadata(tensorboard, metadata)
+
+        # Store it in the replay memory list
+        if not forced_stop:
+            replay_item = ReplayMemoryItem(slot.state, self.action_space.get_stop_action_index(),
+                                           reward, log_prob=log_prob, volatile=volatile)
+            slot.batch_replay_items.append(replay_item)
+
+        slot.done = True
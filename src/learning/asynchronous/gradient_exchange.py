@@ -0,0 +1,169 @@
+import torch
+import torch.multiprocessing as mp
+
+from learning.asynchronous.parameter_sync import ParameterSync
+
+
+class SharedGradientState:
+    """ State of a gradient exchange that is shared by all processes training a shared model. It must be
+    created in the main process before the training processes are started (see GradientExchange.share). """
+
+    def __init__(self, shared_model, mode, num_processes, max_staleness):
+        self.mode = mode
+        self.num_processes = num_processes
+        self.max_staleness = max_staleness
+        self.lock = mp.Lock()
+
+        if mode == GradientExchange.SYNC:
+            # Gradients of all the processes are summed into these buffers
+            self.grad_buffers = [param.data.new(param.data.size()).zero_().share_memory_()
+                                 for param in shared_model.get_parameters()]
+            self.num_contributions = torch.zeros(1).long().share_memory_()
+        else:
+            self.grad_buffers = None
+            self.num_contributions = None
+
+
+class GradientExchange:
+    """ Moves the gradients computed on the local model of a worker to the shared model and performs the
+    optimizer step on the shared parameters. Supported modes are:
+
+        hogwild: gradients are copied and applied without any synchronization (as in A3C).
+        locked: copying and the optimizer step are performed under a lock shared by all the processes, so
+                updates of different processes are never interleaved.
+        sync: gradients of num_processes updates are averaged and applied in a single optimizer step, which
+              is a synchronous all-reduce across the local processes without making any process wait.
+              Gradients of fewer updates left in the buffer are applied by flush, which every process must
+              call at the end of an epoch. The process that completes the buffer performs the step with its
+              own optimizer, so the optimizer state (e.g. the moments of Adam) is only consistent across
+              steps if the optimizer keeps it in shared memory or has no state (e.g. SGD).
+        bounded-staleness: as locked but gradients computed on parameters that are more than max_staleness
+                versions behind the shared model are discarded.
+
+    The gradients are always copied into buffers owned by the shared model. Unlike aliasing the local
+    gradients, this never drops the gradients of parameters which had no gradient in the first update.
+
+    Every mode other than hogwild requires shared state created in the main process using share. """
+
+    HOGWILD, LOCKED, SYNC, BOUNDED_STALENESS = "hogwild", "locked", "sync", "bounded-staleness"
+
+    def __init__(self, shared_model, local_model, optimizer):
+        self.shared_model = shared_model
+        self.local_model = local_model
+        self.optimizer = optimizer
+
+        self.shared_state = getattr(shared_model, "gradient_exchange_state", None)
+        if self.shared_state is None:
+            self.mode = GradientExchange.HOGWILD
+        else:
+            self.mode = self.shared_state.mode
+
+        # Statistics
+        self.num_updates = 0
+        self.num_steps = 0
+        self.num_discarded = 0
+
+    @staticmethod
+    def share(shared_model, mode, num_processes=1, max_staleness=4):
+        """ Create the state shared by all processes. Must be called in the main process. """
+        if mode not in [GradientExchange.HOGWILD, GradientExchange.LOCKED,
+                        GradientExchange.SYNC, GradientExchange.BOUNDED_STALENESS]:
+            raise AssertionError("Unknown gradient exchange mode " + str(mode))
+        shared_model.gradient_exchange_state = SharedGradientState(shared_model, mode, num_processes, max_staleness)
+
+    @staticmethod
+    def copy_grads(local_model, shared_model):
+        """ Copy the gradients of the local model into the gradient buffers of the shared model """
+
+        for param, shared_param in zip(local_model.get_parameters(), shared_model.get_parameters()):
+            if param.grad is None:
+                shared_param._grad = None
+            elif shared_param.grad is None:
+                shared_param._grad = param.grad.clone()
+            else:
+                shared_param.grad.data.copy_(param.grad.data)
+
+    def zero_grads(self):
+        self.optimizer.zero_grad()
+        for param in self.local_model.get_parameters():
+            if param.grad is not None:
+                param.grad.data.zero_()
+
+    def apply(self):
+        """ Apply the gradients of the local model to the shared model. Returns True if an optimizer
+        step was performed on the shared model. """
+
+        self.num_updates += 1
+
+        if self.mode == GradientExchange.HOGWILD:
+            self._step()
+            return True
+
+        if self.mode == GradientExchange.BOUNDED_STALENESS:
+            staleness = ParameterSync.get_version(self.shared_model) - ParameterSync.get_version(self.local_model)
+            if staleness > self.shared_state.max_staleness:
+                self.num_discarded += 1
+                return False
+
+        with self.shared_state.lock:
+            if self.mode == GradientExchange.SYNC:
+                return self._accumulate_and_step()
+            else:
+                self._step()
+                return True
+
+    def _step(self):
+        GradientExchange.copy_grads(self.local_model, self.shared_model)
+        self.optimizer.step()
+        ParameterSync.increment_version(self.shared_model)
+        self.num_steps += 1
+
+    def _accumulate_and_step(self):
+
+        shared_state = self.shared_state
+        for param, grad_buffer in zip(self.local_model.get_parameters(), shared_state.grad_buffers):
+            if param.grad is not None:
+                grad_buffer.add_(param.grad.data.type_as(grad_buffer))
+        shared_state.num_contributions += 1
+
+        if int(shared_state.num_contributions[0]) < shared_state.num_processes:
+            return False
+
+        # The last contributor applies the average of all the gradients
+        return self._step_buffer()
+
+    def flush(self):
+        """ Apply the gradients left in the sync buffer by fewer than num_processes updates, so that they
+        are not lost at the end of an epoch or of training. Returns True if an optimizer step was performed
+        on the shared model. Does nothing in the other modes. """
+
+        if self.mode != GradientExchange.SYNC:
+            return False
+
+        with self.shared_state.lock:
+            if int(self.shared_state.num_contributions[0]) == 0:
+                return False
+            return self._step_buffer()
+
+    def _step_buffer(self):
+        """ Optimizer step with the average of the gradients in the sync buffer. Must hold the lock. """
+
+        shared_state = self.shared_state
+        num_contributions = int(shared_state.num_contributions[0])
+        for shared_param, grad_buffer in zip(self.shared_model.get_parameters(), shared_state.grad_buffers):
+            grad_buffer.div_(num_contributions)
+            if shared_param.grad is None:
+                shared_param._grad = torch.autograd.Variable(grad_buffer.clone())
+            else:
+                shared_param.grad.data.copy_(grad_buffer)
+            grad_buffer.zero_()
+        shared_state.num_contributions.zero_()
+
+        self.optimizer.step()
+        ParameterSync.increment_version(self.shared_model)
+        self.num_steps += 1
+        return True
+
+    def get_metrics(self):
+        return {"mode": self.mode, "num_updates": self.num_updates, "num_steps": self.num_steps,
+                "num_discarded": self.num_discarded}
@@ -0,0 +1,83 @@
+class ParameterSync:
+    """ Copies parameters of the shared model into the local model of a worker only when needed.
+
+    The shared model carries a version counter in shared memory (parameter_version) which is
+    incremented after every optimizer step on the shared parameters. Before every episode a worker
+    calls maybe_sync which copies the shared parameters only if the local copy is more than
+    max_staleness versions old, or if it is older at all and sync_every episodes have passed
+    since the last copy. With the defaults a copy happens only when the shared model has changed,
+    which gives the same behaviour as copying before every episode without the redundant copies.
+
+    Concurrent increments of the version counter may be lost but the counter never goes backward,
+    so a worker never misses that the shared model has changed.
+
+    If the shared model is updated by the optimizer step of another model (e.g., the predictor in
+    the two stage learners) then that model can be given as version_model. """
+
+    def __init__(self, shared_model, local_model, max_staleness=0, sync_every=None, version_model=None):
+        if version_model is None:
+            version_model = shared_model
+        assert hasattr(version_model, "parameter_version"), "Shared model does not have a parameter version"
+        self.shared_model = shared_model
+        self.version_model = version_model
+        self.local_model = local_model
+        self.max_staleness = max_staleness
+        self.sync_every = sync_every
+        self.local_version = None
+        self.episodes_since_sync = 0
+
+        # Statistics
+        self.num_syncs = 0
+        self.num_skipped_syncs = 0
+        self.sum_staleness = 0
+        self.max_staleness_seen = 0
+        self.num_episodes = 0
+
+    @staticmethod
+    def increment_version(shared_model):
+        # Models which are never shared across processes need not have a version
+        if hasattr(shared_model, "parameter_version"):
+            shared_model.parameter_version += 1
+
+    @staticmethod
+    def get_version(shared_model):
+        return int(shared_model.parameter_version[0])
+
+    def maybe_sync(self):
+        """ Copy the shared parameters into the local model if the local copy is too stale.
+        Returns True if the parameters were copied. """
+
+        shared_version = ParameterSync.get_version(self.version_model)
+        if self.local_version is None:
+            staleness = None
+        else:
+            staleness = shared_version - self.local_version
+            self.sum_staleness += staleness
+            self.max_staleness_seen = max(self.max_staleness_seen, staleness)
+        self.num_episodes += 1
+        self.episodes_since_sync += 1
+
+        if staleness is None or staleness > self.max_staleness or \
+                (staleness > 0 and self.sync_every is not None and self.episodes_since_sync >= self.sync_every):
+            self.local_model.load_from_state_dict(self.shared_model.get_state_dict())
+            self.local_version = shared_version
+            if hasattr(self.local_model, "parameter_version"):
+                # Version of the parameters held by the local model (see GradientExchange)
+                self.local_model.parameter_version.fill_(shared_version)
+            self.episodes_since_sync = 0
+            self.num_syncs += 1
+            return True
+        else:
+            self.num_skipped_syncs += 1
+            return False
+
+    def get_staleness(self):
+        """ Number of updates to the shared model since the last copy """
+        if self.local_version is None:
+            return 0
+        return ParameterSync.get_version(self.version_model) - self.local_version
+
+    def get_metrics(self):
+        mean_staleness = self.sum_staleness / float(max(1, self.num_episodes))
+        return {"num_syncs": self.num_syncs, "num_skipped_syncs": self.num_skipped_syncs,
+                "mean_staleness": mean_staleness, "max_staleness": self.max_staleness_seen}
@@ -8,12 +8,13 @@ import nltk
 
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from agents.tmp_house_agent import TmpHouseAgent
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_detection import ObjectDetection
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
 from learning.asynchronous.abstract_learning import AbstractLearning
+from learning.asynchronous.parameter_sync import ParameterSync
 from learning.auxiliary_objective.action_prediction import ActionPrediction
 from learning.auxiliary_objective.temporal_autoencoder import TemporalAutoEncoder
 from utils.cuda import cuda_var
@@ -63,21 +64,10 @@ class TmpAsynchronousContextualBandit(AbstractLearning):
 
     def calc_loss(self, batch_replay_items):
 
-        agent_observation_state_ls = []
-        immediate_rewards = []
-        action_batch = []
-        log_probabilities = []
-        factor_entropy = []
-        for replay_item in batch_replay_items:
-            agent_observation_state_ls.append(replay_item.get_agent_observed_state())
-            action_batch.append(replay_item.get_action())
-            immediate_rewards.append(replay_item.get_reward())
-            log_probabilities.append(replay_item.get_log_prob())
-            factor_entropy.append(replay_item.get_factor_entropy())
-
-        log_probabilities = torch.cat(log_probabilities)
-        action_batch = cuda_var(torch.from_numpy(np.array(action_batch)))
-        immediate_rewards = cuda_var(torch.from_numpy(np.array(immediate_rewards)).float())
+        batch = ReplayBatch.from_items(batch_replay_items)
+        log_probabilities = batch.get_log_prob_batch()
+        action_batch = batch.get_action_batch()
+        immediate_rewards = batch.get_reward_batch()
 
         # self.logger.log("Learning from Log Probabilities is %r " % log_probabilities.data.cpu().numpy())
         # self.logger.log("Learning from Action Batch is %r " % action_batch.data.cpu().numpy())
@@ -229,11 +219,9 @@ class TmpAsynchronousContextualBandit(AbstractLearning):
         # Test policy
         test_policy = gp.get_argmax_action
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-            logger.log('Created Tensorboard Server.')
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
+        logger.log('Created Tensorboard Server.')
 
         if use_pushover:
             pushover_logger = None
@@ -270,23 +258,31 @@ class TmpAsynchronousContextualBandit(AbstractLearning):
         # TODO change 2 --- unity launch moved up
         learner.logger = logger
 
+        # Copy the shared parameters only when another update has been made
+        parameter_sync = ParameterSync(shared_model, local_model)
+
         for epoch in range(1, max_epochs + 1):
 
             for data_point_ix, data_point in enumerate(train_dataset):
 
                 # Sync with the shared model
                 # local_model.load_state_dict(shared_model.state_dict())
-                local_model.load_from_state_dict(shared_model.get_state_dict())
+                parameter_sync.maybe_sync()
 
                 if (data_point_ix + 1) % 100 == 0:
                     logger.log("Done %d out of %d" %(data_point_ix, dataset_size))
                     logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % parameter_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
 
                 num_actions = 0
                 max_num_actions = constants["horizon"]
                 max_num_actions += constants["max_extra_horizon"]
 
-                image, metadata = tmp_agent.server.reset_receive_feedback(data_point)
+                # The reset for this data point is issued while the previous update is performed
+                if data_point_ix == 0:
+                    tmp_agent.server.reset_nonblocking(data_point)
+                image, metadata = tmp_agent.server.receive_reset_feedback()
                 instruction = data_point.get_instruction()
                 # instruction_str = TmpAsynchronousContextualBandit.convert_indices_to_text(instruction, vocab)
                 # print("Instruction str is ", instruction_str)
@@ -301,7 +297,7 @@ class TmpAsynchronousContextualBandit(AbstractLearning):
                 state.goal = learner.get_goal(metadata)
 
                 model_state = None
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
                 total_reward = 0
                 forced_stop = True
 
@@ -352,6 +348,10 @@ class TmpAsynchronousContextualBandit(AbstractLearning):
                 # Update the scores based on meta_data
                 # self.meta_data_util.log_results(metadata)
 
+                # Reset the simulator for the next data point while the update is performed
+                if data_point_ix + 1 < dataset_size:
+                    tmp_agent.server.reset_nonblocking(train_dataset[data_point_ix + 1])
+
                 # Perform update
                 if len(batch_replay_items) > 0:  # 32
                     loss_val = learner.do_update(batch_replay_items)
@@ -383,6 +383,9 @@ class TmpAsynchronousContextualBandit(AbstractLearning):
                             goal_prediction_loss = float(learner.goal_prediction_loss.data[0])
                             tensorboard.log_scalar("goal_prediction_loss", goal_prediction_loss)
 
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
             # Save the model
             local_model.save_model(experiment + "/contextual_bandit_" + str(rank) + "_epoch_" + str(epoch))
             logger.log("Training data action counts %r" % action_counts)
@@ -7,12 +7,13 @@ import numpy as np
 import nltk
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from agents.tmp_house_agent import TmpHouseAgent
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_detection import ObjectDetection
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
 from learning.asynchronous.abstract_learning import AbstractLearning
+from learning.asynchronous.parameter_sync import ParameterSync
 from learning.auxiliary_objective.action_prediction import ActionPrediction
 from learning.auxiliary_objective.temporal_autoencoder import TemporalAutoEncoder
 from utils.cuda import cuda_var
@@ -63,18 +64,9 @@ class TmpSupervisedLearning(AbstractLearning):
 
     def calc_loss(self, batch_replay_items):
 
-        agent_observation_state_ls = []
-        action_batch = []
-        log_probabilities = []
-        factor_entropy = []
-        for replay_item in batch_replay_items:
-            agent_observation_state_ls.append(replay_item.get_agent_observed_state())
-            action_batch.append(replay_item.get_action())
-            log_probabilities.append(replay_item.get_log_prob())
-            factor_entropy.append(replay_item.get_factor_entropy())
-
-        log_probabilities = torch.cat(log_probabilities)
-        action_batch = cuda_var(torch.from_numpy(np.array(action_batch)))
+        batch = ReplayBatch.from_items(batch_replay_items)
+        log_probabilities = batch.get_log_prob_batch()
+        action_batch = batch.get_action_batch()
 
         num_states = int(action_batch.size()[0])
         model_log_prob_batch = log_probabilities
@@ -96,6 +88,7 @@ class TmpSupervisedLearning(AbstractLearning):
 
         # Minimize the Factor Entropy if the model is implicit factorization model
         if isinstance(self.local_model, IncrementalModelRecurrentImplicitFactorizationResnet):
+            factor_entropy = [replay_item.get_factor_entropy() for replay_item in batch]
             self.mean_factor_entropy = torch.mean(torch.cat(factor_entropy))
             loss = loss + self.mean_factor_entropy
         else:
@@ -193,10 +186,8 @@ class TmpSupervisedLearning(AbstractLearning):
 
         # torch.manual_seed(args.seed + rank)
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
 
         if use_pushover:
             # pushover_logger = PushoverLogger(experiment_name)
@@ -229,17 +220,22 @@ class TmpSupervisedLearning(AbstractLearning):
                                                   config, constants, tensorboard)
         # TODO change 2 --- unity launch moved up
 
+        # Copy the shared parameters only when another update has been made
+        parameter_sync = ParameterSync(shared_model, local_model)
+
         for epoch in range(1, max_epochs + 1):
 
             for data_point_ix, data_point in enumerate(train_dataset):
 
                 # Sync with the shared model
                 # local_model.load_state_dict(shared_model.state_dict())
-                local_model.load_from_state_dict(shared_model.get_state_dict())
+                parameter_sync.maybe_sync()
 
                 if (data_point_ix + 1) % 100 == 0:
                     logger.log("Done %d out of %d" %(data_point_ix, dataset_size))
                     logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % parameter_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
 
                 image, metadata = tmp_agent.server.reset_receive_feedback(data_point)
                 # instruction = TmpSupervisedLearning.convert_text_to_indices(metadata["instruction"], vocab)
@@ -254,7 +250,7 @@ class TmpSupervisedLearning(AbstractLearning):
                                            data_point=data_point)
 
                 model_state = None
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
                 total_reward = 0
 
                 # trajectory = metadata["trajectory"]
@@ -337,6 +333,9 @@ class TmpSupervisedLearning(AbstractLearning):
                             mean_factor_entropy = float(learner.mean_factor_entropy.data[0])
                             tensorboard.log_factor_entropy_loss(mean_factor_entropy)
 
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
             # Save the model
             local_model.save_model(experiment + "/contextual_bandit_" + str(rank) + "_epoch_" + str(epoch))
             logger.log("Training data action counts %r" % action_counts)
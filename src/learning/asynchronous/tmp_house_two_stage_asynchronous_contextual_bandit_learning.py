@@ -9,12 +9,13 @@ import nltk
 
 from agents.agent_observed_state import AgentObservedState
 from agents.house_decoupled_predictor_navigator_model import HouseDecoupledPredictorNavigatorAgent
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from agents.tmp_house_agent import TmpHouseAgent
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_detection import ObjectDetection
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
 from learning.asynchronous.abstract_learning import AbstractLearning
+from learning.asynchronous.parameter_sync import ParameterSync
 from learning.auxiliary_objective.action_prediction import ActionPrediction
 from learning.auxiliary_objective.temporal_autoencoder import TemporalAutoEncoder
 from utils.cuda import cuda_var
@@ -52,23 +53,11 @@ class TmpTwoStageAsynchronousContextualBandit(AbstractLearning):
 
     def calc_loss(self, batch_replay_items):
 
-        agent_observation_state_ls = []
-        immediate_rewards = []
-        action_batch = []
-        log_probabilities = []
-        factor_entropy = []
-        chosen_log_goal_prob = []
-        for replay_item in batch_replay_items:
-            agent_observation_state_ls.append(replay_item.get_agent_observed_state())
-            action_batch.append(replay_item.get_action())
-            immediate_rewards.append(replay_item.get_reward())
-            log_probabilities.append(replay_item.get_log_prob())
-            factor_entropy.append(replay_item.get_factor_entropy())
-            chosen_log_goal_prob.append(replay_item.get_volatile_features()["goal_sample_prob"])
-
-        log_probabilities = torch.cat(log_probabilities)
-        action_batch = cuda_var(torch.from_numpy(np.array(action_batch)))
-        immediate_rewards = cuda_var(torch.from_numpy(np.array(immediate_rewards)).float())
+        batch = ReplayBatch.from_items(batch_replay_items)
+        log_probabilities = batch.get_log_prob_batch()
+        action_batch = batch.get_action_batch()
+        immediate_rewards = batch.get_reward_batch()
+        chosen_log_goal_prob = [replay_item.get_volatile_features()["goal_sample_prob"] for replay_item in batch]
 
         model_log_prob_batch = log_probabilities
         chosen_log_action_probs = model_log_prob_batch.gather(1, action_batch.view(-1, 1))
@@ -250,11 +239,9 @@ class TmpTwoStageAsynchronousContextualBandit(AbstractLearning):
         # Test policy
         test_policy = gp.get_argmax_action
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-            logger.log('Created Tensorboard Server.')
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
+        logger.log('Created Tensorboard Server.')
 
         if use_pushover:
             pushover_logger = None
@@ -296,18 +283,25 @@ class TmpTwoStageAsynchronousContextualBandit(AbstractLearning):
         # TODO change 2 --- unity launch moved up
         learner.logger = logger
 
+        # Copy the shared parameters only when another update has been made
+        navigator_sync = ParameterSync(shared_navigator_model, local_navigator_model)
+        predictor_sync = ParameterSync(shared_predictor_model, local_predictor_model,
+                                       version_model=shared_navigator_model)
+
         for epoch in range(1, max_epochs + 1):
 
             for data_point_ix, data_point in enumerate(train_dataset):
 
                 # Sync with the shared model
                 # local_model.load_state_dict(shared_model.state_dict())
-                local_navigator_model.load_from_state_dict(shared_navigator_model.get_state_dict())
-                local_predictor_model.load_from_state_dict(shared_predictor_model.get_state_dict())
+                navigator_sync.maybe_sync()
+                predictor_sync.maybe_sync()
 
                 if (data_point_ix + 1) % 100 == 0:
                     logger.log("Done %d out of %d" %(data_point_ix, dataset_size))
                     logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % navigator_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
 
                 num_actions = 0
                 max_num_actions = constants["horizon"]
@@ -331,7 +325,7 @@ class TmpTwoStageAsynchronousContextualBandit(AbstractLearning):
                 state.goal = learner.get_goal(metadata, "inferred")
 
                 model_state = None
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
                 total_reward = 0
                 forced_stop = True
 
@@ -399,6 +393,9 @@ class TmpTwoStageAsynchronousContextualBandit(AbstractLearning):
                         tensorboard.log_scalar("total_reward", total_reward)
                         tensorboard.log_scalar("mean navigation error", metadata['mean-navigation-error'])
 
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
             # Save the model
             local_navigator_model.save_model(
                 experiment + "/navigator_contextual_bandit_" + str(rank) + "_epoch_" + str(epoch))
@@ -10,12 +10,13 @@ import random
 
 from agents.tmp_streetview_agent import Agent
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_detection import ObjectDetection
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
 from learning.asynchronous.abstract_learning import AbstractLearning
+from learning.asynchronous.parameter_sync import ParameterSync
 from learning.auxiliary_objective.action_prediction import ActionPrediction
 from learning.auxiliary_objective.temporal_autoencoder import TemporalAutoEncoder
 from utils.cuda import cuda_var
@@ -71,21 +72,10 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
 
     def calc_loss(self, batch_replay_items):
 
-        agent_observation_state_ls = []
-        immediate_rewards = []
-        action_batch = []
-        log_probabilities = []
-        factor_entropy = []
-        for replay_item in batch_replay_items:
-            agent_observation_state_ls.append(replay_item.get_agent_observed_state())
-            action_batch.append(replay_item.get_action())
-            immediate_rewards.append(replay_item.get_reward())
-            log_probabilities.append(replay_item.get_log_prob())
-            factor_entropy.append(replay_item.get_factor_entropy())
-
-        log_probabilities = torch.cat(log_probabilities)
-        action_batch = cuda_var(torch.from_numpy(np.array(action_batch)))
-        immediate_rewards = cuda_var(torch.from_numpy(np.array(immediate_rewards)).float())
+        batch = ReplayBatch.from_items(batch_replay_items)
+        log_probabilities = batch.get_log_prob_batch()
+        action_batch = batch.get_action_batch()
+        immediate_rewards = batch.get_reward_batch()
 
         num_states = int(action_batch.size()[0])
         model_log_prob_batch = log_probabilities
@@ -178,10 +168,8 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
 
         # torch.manual_seed(args.seed + rank)
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
 
         if use_pushover:
             pushover_logger = PushoverLogger(experiment_name)
@@ -213,6 +201,9 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
         learner = TmpStreetViewAsynchronousContextualBandit(shared_model, local_model, action_space, meta_data_util,
                                                             config, constants, tensorboard)
 
+        # Copy the shared parameters only when another update has been made
+        parameter_sync = ParameterSync(shared_model, local_model)
+
         for epoch in range(1, max_epochs + 1):
 
             learner.epoch = epoch
@@ -223,11 +214,13 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
 
                 # Sync with the shared model
                 # local_model.load_state_dict(shared_model.state_dict())
-                local_model.load_from_state_dict(shared_model.get_state_dict())
+                parameter_sync.maybe_sync()
 
                 if (data_point_ix + 1) % 100 == 0:
                     logger.log("Done %d out of %d" %(data_point_ix, dataset_size))
                     logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % parameter_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
                     mean_action_reward = [action_sum / max(1.0, action_count) for (action_sum, action_count) in
                                           zip(action_rewards, action_counts)]
                     logger.log("Training data action rewards %r" % mean_action_reward)
@@ -247,7 +240,7 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
                 #                                               learner.image_height, learner.image_width)
 
                 model_state = None
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
                 total_reward = 0
                 forced_stop = True
 
@@ -346,6 +339,9 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
                             goal_prediction_loss = float(learner.goal_prediction_loss.data[0])
                             tensorboard.log_scalar("goal_prediction_loss", goal_prediction_loss)
 
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
             # Save the model
             local_model.save_model(experiment + "/contextual_bandit_" + str(rank) + "_epoch_" + str(epoch))
             logger.log("Training data action counts %r" % action_counts)
@@ -391,10 +387,8 @@ class TmpStreetViewAsynchronousContextualBandit(AbstractLearning):
 
         # torch.manual_seed(args.seed + rank)
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
 
         if use_pushover:
             pushover_logger = PushoverLogger(experiment_name)
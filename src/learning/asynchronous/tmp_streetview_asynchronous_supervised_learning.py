@@ -10,12 +10,13 @@ import random
 
 from agents.tmp_streetview_agent import Agent
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_detection import ObjectDetection
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
 from learning.asynchronous.abstract_learning import AbstractLearning
+from learning.asynchronous.parameter_sync import ParameterSync
 from learning.auxiliary_objective.action_prediction import ActionPrediction
 from learning.auxiliary_objective.temporal_autoencoder import TemporalAutoEncoder
 from utils.cuda import cuda_var
@@ -50,16 +51,9 @@ class TmpStreetViewAsynchronousSupervisedLearning(AbstractLearning):
 
     def calc_loss(self, batch_replay_items):
 
-        agent_observation_state_ls = []
-        action_batch = []
-        log_probabilities = []
-        for replay_item in batch_replay_items:
-            agent_observation_state_ls.append(replay_item.get_agent_observed_state())
-            action_batch.append(replay_item.get_action())
-            log_probabilities.append(replay_item.get_log_prob())
-
-        log_probabilities = torch.cat(log_probabilities)
-        action_batch = cuda_var(torch.from_numpy(np.array(action_batch)))
+        batch = ReplayBatch.from_items(batch_replay_items)
+        log_probabilities = batch.get_log_prob_batch()
+        action_batch = batch.get_action_batch()
 
         num_states = int(action_batch.size()[0])
         model_log_prob_batch = log_probabilities
@@ -99,10 +93,8 @@ class TmpStreetViewAsynchronousSupervisedLearning(AbstractLearning):
 
         # torch.manual_seed(args.seed + rank)
 
-        if rank == 0:  # client 0 creates a tensorboard server
-            tensorboard = Tensorboard(experiment_name)
-        else:
-            tensorboard = None
+        # Every client writes summaries to its own run of the experiment (see Tensorboard)
+        tensorboard = Tensorboard(experiment_name, worker_id=rank)
 
         if use_pushover:
             pushover_logger = PushoverLogger(experiment_name)
@@ -133,6 +125,9 @@ class TmpStreetViewAsynchronousSupervisedLearning(AbstractLearning):
         learner = TmpStreetViewAsynchronousSupervisedLearning(shared_model, local_model, action_space, meta_data_util,
                                                               config, constants, tensorboard)
 
+        # Copy the shared parameters only when another update has been made
+        parameter_sync = ParameterSync(shared_model, local_model)
+
         for epoch in range(1, max_epochs + 1):
 
             learner.epoch = epoch
@@ -151,11 +146,13 @@ class TmpStreetViewAsynchronousSupervisedLearning(AbstractLearning):
 
                 # Sync with the shared model
                 # local_model.load_state_dict(shared_model.state_dict())
-                local_model.load_from_state_dict(shared_model.get_state_dict())
+                parameter_sync.maybe_sync()
 
                 if (data_point_ix + 1) % 100 == 0:
                     logger.log("Done %d out of %d" % (data_point_ix, dataset_size))
                     logger.log("Training data action counts %r" % action_counts)
+                    logger.log("Parameter sync %r" % parameter_sync.get_metrics())
+                    logger.log("Gradient exchange %r" % learner.gradient_exchange.get_metrics())
                     logger.log("Total Time %f, Server Time %f, Update Time %f, Prob Time %f " %
                                (time_taken["total_time"], time_taken["server_time"],
                                 time_taken["update_time"], time_taken["prob_time"]))
@@ -175,7 +172,7 @@ class TmpStreetViewAsynchronousSupervisedLearning(AbstractLearning):
                 #                                               learner.image_height, learner.image_width)
 
                 model_state = None
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
                 total_reward = 0
 
                 trajectory = agent.server.get_trajectory_exact(data_point.trajectory)
@@ -256,6 +253,9 @@ class TmpStreetViewAsynchronousSupervisedLearning(AbstractLearning):
                 time_taken["update_time"] += time.time() - time_start
                 time_taken["total_time"] += time.time() - start
 
+            # Apply the gradients left in the sync buffer by this epoch
+            learner.gradient_exchange.flush()
+
             # Save the model
             local_model.save_model(experiment + "/supervised_learning" + str(rank) + "_epoch_" + str(epoch))
             logger.log("Training data action counts %r" % action_counts)
@@ -53,16 +53,16 @@ class AbstractLearning:
             return
         named_params = self.model.get_named_parameters()
         for name, parameter in named_params:
-            weights = parameter.data.cpu()
+            weights = parameter.data
             mean_weight = torch.mean(torch.abs(weights))
-            weights = weights.numpy()
-            self.tensorboard.log_histogram("hist_" + name + "_data", weights, bins=100)
+            self.tensorboard.log_histogram("hist_" + name + "_data", self.tensorboard.sample_tensor(weights),
+                                           bins=100)
             self.tensorboard.log_scalar("mean_" + name + "_data", mean_weight)
             if parameter.grad is not None:
-                grad = parameter.grad.data.cpu()
+                grad = parameter.grad.data
                 mean_grad = torch.mean(torch.abs(grad))
-                grad = grad.numpy()
-                self.tensorboard.log_histogram("hist_" + name + "_grad", grad, bins=100)
+                self.tensorboard.log_histogram("hist_" + name + "_grad", self.tensorboard.sample_tensor(grad),
+                                               bins=100)
                 self.tensorboard.log_scalar("mean_" + name + "_grad", mean_grad)
 
 
@@ -12,7 +12,7 @@ import scipy.misc
 import matplotlib.pyplot as plt
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.asynchronous.tmp_blocks_asynchronous_contextual_bandit_learning import TmpAsynchronousContextualBandit
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
@@ -25,6 +25,8 @@ from utils.cuda import cuda_var
 from models.incremental_model.incremental_model_recurrent_implicit_factorization_resnet import \
     IncrementalModelRecurrentImplicitFactorizationResnet
 from utils.debug_nav_drone_instruction import instruction_to_string
+from utils.packed_image_dataset import PackedImageDataset
+from utils.vocabulary import Vocabulary
 from utils.geometry import current_pos_from_metadata, current_pose_from_metadata, get_turn_angle_from_metadata_datapoint
 
 
@@ -55,14 +57,7 @@ class BlockGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
         self.ignore_none = True
         self.inference_procedure = BlockGoalPredictionSupervisedLearningFromDisk.MODE
 
-        self.vocab = {}
-        vocab_path = config["vocab_file"]
-        word_index = 0
-        with open(vocab_path) as f:
-            for line in f.readlines():
-                token = line.strip()
-                self.vocab[token] = word_index
-                word_index += 1
+        self.vocab = Vocabulary.load(config["vocab_file"])
 
         # Auxiliary Objectives
         if self.config["do_action_prediction"]:
@@ -122,16 +117,39 @@ class BlockGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
 
         return loss
 
+    @staticmethod
+    def read_image(folder_name, i):
+        """ Read the image of example i as height x width x channel """
+        image = np.load(folder_name + "/example_%s/image.npy" % i)
+        image = image.swapaxes(0, 1).swapaxes(1, 2)
+        image = np.rot90(image, k=2)
+        image = np.fliplr(image)
+        return image
+
+    @staticmethod
+    def read_images(folder_name):
+        """ Yields the image of every example in the order of dataset_goal.json as a list with a single image """
+
+        with open(folder_name + "/dataset_goal.json") as f:
+            data = json.load(f)
+
+        for datapoint in data:
+            image = BlockGoalPredictionSupervisedLearningFromDisk.read_image(folder_name, int(datapoint["id"]))
+            yield [image.swapaxes(1, 2).swapaxes(0, 1)]
+
     @staticmethod
     def parse(folder_name, dataset, vocab, debug=False):
 
         start = time.time()
 
+        # Use the packed images if the dataset has been packed (see utils.packed_image_dataset)
+        packed_images = PackedImageDataset.load_if_exists(folder_name)
+
         with open(folder_name + "/dataset_goal.json") as f:
 
             data = json.load(f)
 
-            for datapoint in data:
+            for datapoint_ix, datapoint in enumerate(data):
 
                 # Read dataset information
                 i = int(datapoint["id"])
@@ -153,10 +171,10 @@ class BlockGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
                 goal_pixel = [float(w) for w in goal_pixel_str]
 
                 # Read the image
-                image = np.load(folder_name + "/example_%s/image.npy" % i)
-                image = image.swapaxes(0, 1).swapaxes(1, 2)
-                image = np.rot90(image, k=2)
-                image = np.fliplr(image)
+                if packed_images is None:
+                    image = BlockGoalPredictionSupervisedLearningFromDisk.read_image(folder_name, i)
+                else:
+                    image = packed_images[datapoint_ix][0].transpose(1, 2, 0)
 
                 # Read the goal information
                 lines = open(folder_name + "/example_%s/instruction.txt" % i).readlines()
@@ -223,14 +241,8 @@ class BlockGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
         logging.info("Parsed dataset of size %r in time % seconds", len(dataset), (end - start))
 
     def convert_to_id(self, instruction):
-        tk_seq = instruction.split()
-        token_ids = []
-        for tk in tk_seq:
-            if tk in self.vocab:
-                token_ids.append(self.vocab[tk])
-            else:
-                print("Out of vocabulary word. Ignoring ", tk)
-        return token_ids
+        # Out of vocabulary words are ignored
+        return self.vocab.tokenize(instruction, tokenizer=Vocabulary.SPLIT)
 
     def is_close_enough(self, inferred_ix, row, col):
         predicted_row = int(inferred_ix / float(self.final_width))
@@ -546,7 +558,7 @@ class BlockGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
 
             logging.info("Starting epoch %d", epoch)
 
-            batch_replay_items = []
+            batch_replay_items = ReplayBatch()
             best_real_world_distance = min(best_real_world_distance, mean_real_world_distance)
 
             for data_point_ix, data_point in enumerate(train_dataset):
@@ -577,7 +589,7 @@ class BlockGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
                 # Perform update
                 if len(batch_replay_items) > 0:
                     loss_val = self.do_update(batch_replay_items)
-                    batch_replay_items = []
+                    batch_replay_items = ReplayBatch()
                     if tensorboard is not None:
                         tensorboard.log_scalar("Loss", loss_val)
                         if self.goal_prediction_loss is not None:
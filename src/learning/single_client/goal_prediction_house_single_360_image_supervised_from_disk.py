@@ -1,6 +1,5 @@
 import json
 import torch
-import nltk
 import time
 import math
 import random
@@ -11,7 +10,7 @@ import scipy.misc
 import matplotlib.pyplot as plt
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
@@ -108,15 +107,12 @@ class GoalPredictionHouseSingle360ImageSupervisedLearningFromDisk(AbstractLearni
         start = time.time()
         lines = open("./house_house%r_goal_prediction_data.json" % house_id).readlines()
 
-        dataset = []
-        for line in lines:
-
-            jobj = json.loads(line)
+        # Read and tokenize the instructions
+        jobjs = [json.loads(line) for line in lines]
+        instructions = vocab.tokenize_all([jobj["instruction"].lower() for jobj in jobjs])
 
-            # Read the instruction
-            instruction_string = jobj["instruction"].lower()
-            instruction = GoalPredictionHouseSingle360ImageSupervisedLearningFromDisk.convert_to_id(
-                instruction_string, vocab)
+        dataset = []
+        for jobj, instruction in zip(jobjs, instructions):
 
             # Read the image
             image_file_name = jobj["imageFileName"].replace("goal_images", "goal_images_%r" % size)
@@ -226,14 +222,7 @@ class GoalPredictionHouseSingle360ImageSupervisedLearningFromDisk(AbstractLearni
 
     @staticmethod
     def convert_to_id(instruction, vocab):
-        tk_seq = nltk.tokenize.word_tokenize(instruction)
-        token_ids = []
-        for tk in tk_seq:
-            if tk in vocab:
-                token_ids.append(vocab[tk])
-            else:
-                token_ids.append(vocab["$UNK$"])
-        return token_ids
+        return vocab.tokenize(instruction)
 
     def is_close_enough(self, inferred_ix, row, col):
         predicted_row = int(inferred_ix / float(self.final_width))
@@ -589,7 +578,7 @@ class GoalPredictionHouseSingle360ImageSupervisedLearningFromDisk(AbstractLearni
 
             logging.info("Starting epoch %d", epoch)
 
-            batch_replay_items = []
+            batch_replay_items = ReplayBatch()
             best_distance = min(best_distance, mean_distance)
 
             for data_point_ix, data_point in enumerate(train_dataset):
@@ -620,7 +609,7 @@ class GoalPredictionHouseSingle360ImageSupervisedLearningFromDisk(AbstractLearni
                 # Perform update
                 if len(batch_replay_items) > 0:
                     loss_val = self.do_update(batch_replay_items)
-                    batch_replay_items = []
+                    batch_replay_items = ReplayBatch()
                     if tensorboard is not None:
                         tensorboard.log_scalar("Loss", loss_val)
                         if self.goal_prediction_loss is not None:
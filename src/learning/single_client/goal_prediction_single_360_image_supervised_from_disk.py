@@ -12,7 +12,7 @@ import scipy.misc
 import matplotlib.pyplot as plt
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
@@ -24,6 +24,8 @@ from utils.cuda import cuda_var
 from models.incremental_model.incremental_model_recurrent_implicit_factorization_resnet import \
     IncrementalModelRecurrentImplicitFactorizationResnet
 from utils.debug_nav_drone_instruction import instruction_to_string
+from utils.packed_image_dataset import PackedImageDataset
+from utils.vocabulary import Vocabulary
 from utils.geometry import current_pos_from_metadata, current_pose_from_metadata, get_turn_angle_from_metadata_datapoint
 
 
@@ -54,14 +56,7 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
         self.ignore_none = True
         self.inference_procedure = GoalPredictionSingle360ImageSupervisedLearningFromDisk.MODE
 
-        self.vocab = {}
-        vocab_path = config["vocab_file"]
-        word_index = 0
-        with open(vocab_path) as f:
-            for line in f.readlines():
-                token = line.strip()
-                self.vocab[token] = word_index
-                word_index += 1
+        self.vocab = Vocabulary.load(config["vocab_file"])
 
         # Auxiliary Objectives
         if self.config["do_action_prediction"]:
@@ -183,18 +178,13 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
         return new_pos_angle
 
     @staticmethod
-    def parse(folder_name, dataset, model, config, format_type="numpy"):
-
-        start = time.time()
-        num_channel, height, width = model.image_module.get_final_dimension()
+    def read_images(folder_name, format_type="numpy"):
+        """ Yields the panorama of every example in the folder as a list with a single image """
 
-        # Read images
         num_examples = len(os.listdir(folder_name))
 
         if format_type == "numpy":
 
-            image_dataset = []
-
             # Read panaroma images
             for i in range(0, num_examples):
                 example_folder_name = folder_name + "/example_" + str(i)
@@ -207,10 +197,9 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
                 images = [slices[3], slices[4], slices[5], slices[0], slices[1], slices[2]]
                 images = np.hstack(images)
                 images = images.swapaxes(1, 2).swapaxes(0, 1)
-                image_dataset.append([images])
+                yield [images]
 
         elif format_type == "png":
-            image_dataset = []
 
             # Read panaroma images
             for i in range(0, num_examples):
@@ -225,10 +214,23 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
                     images.append(img)
                 images = np.hstack(images)
                 images = images.swapaxes(1, 2).swapaxes(0, 1)
-                image_dataset.append([images])
+                yield [images]
         else:
             raise AssertionError("")
 
+    @staticmethod
+    def parse(folder_name, dataset, model, config, format_type="numpy"):
+
+        start = time.time()
+        num_channel, height, width = model.image_module.get_final_dimension()
+
+        # Read images. Use the packed images if the dataset has been packed (see utils.packed_image_dataset)
+        image_dataset = PackedImageDataset.load_if_exists(folder_name)
+        if image_dataset is None:
+            image_dataset = list(GoalPredictionSingle360ImageSupervisedLearningFromDisk.read_images(
+                folder_name, format_type))
+        num_examples = len(image_dataset)
+
         # Read the goal state. The data for the single image can be
         # directly computed and does not need to be saved.
         goal_dataset = []
@@ -414,14 +416,8 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
         return image_dataset, goal_dataset
 
     def convert_to_id(self, instruction):
-        tk_seq = instruction.split()
-        token_ids = []
-        for tk in tk_seq:
-            if tk in self.vocab:
-                token_ids.append(self.vocab[tk])
-            else:
-                print("Out of vocabulary word. Ignoring ", tk)
-        return token_ids
+        # Out of vocabulary words are ignored
+        return self.vocab.tokenize(instruction, tokenizer=Vocabulary.SPLIT)
 
     def is_close_enough(self, inferred_ix, row, col):
         predicted_row = int(inferred_ix / float(self.final_width))
@@ -832,7 +828,7 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
 
             logging.info("Starting epoch %d", epoch)
 
-            batch_replay_items = []
+            batch_replay_items = ReplayBatch()
             best_real_world_distance = min(best_real_world_distance, mean_real_world_distance)
 
             for data_point_ix, data_point in enumerate(train_dataset):
@@ -866,7 +862,7 @@ class GoalPredictionSingle360ImageSupervisedLearningFromDisk(AbstractLearning):
                 # Perform update
                 if len(batch_replay_items) > 0:
                     loss_val = self.do_update(batch_replay_items)
-                    batch_replay_items = []
+                    batch_replay_items = ReplayBatch()
                     if tensorboard is not None:
                         tensorboard.log_scalar("Loss", loss_val)
                         if self.goal_prediction_loss is not None:
@@ -10,7 +10,7 @@ import scipy.misc
 import matplotlib.pyplot as plt
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
@@ -22,6 +22,8 @@ from utils.cuda import cuda_var
 from models.incremental_model.incremental_model_recurrent_implicit_factorization_resnet import \
     IncrementalModelRecurrentImplicitFactorizationResnet
 from utils.debug_nav_drone_instruction import instruction_to_string
+from utils.packed_image_dataset import PackedImageDataset
+from utils.vocabulary import Vocabulary
 from utils.geometry import current_pos_from_metadata, current_pose_from_metadata
 
 
@@ -45,14 +47,7 @@ class GoalPredictionSingleImageSupervisedLearningFromDisk(AbstractLearning):
 
         self.ignore_none = True
 
-        self.vocab = {}
-        vocab_path = config["vocab_file"]
-        word_index = 0
-        with open(vocab_path) as f:
-            for line in f.readlines():
-                token = line.strip()
-                self.vocab[token] = word_index
-                word_index += 1
+        self.vocab = Vocabulary.load(config["vocab_file"])
 
         # Auxiliary Objectives
         if self.config["do_action_prediction"]:
@@ -102,6 +97,16 @@ class GoalPredictionSingleImageSupervisedLearningFromDisk(AbstractLearning):
 
         return loss
 
+    @staticmethod
+    def read_images(folder_name):
+        """ Yields the list of images of every example in the folder """
+
+        num_examples = len(os.listdir(folder_name))
+        for i in range(0, num_examples):
+            example_folder_name = folder_name + "/example_" + str(i)
+            img = scipy.misc.imread(example_folder_name + "/image_0.png").swapaxes(1, 2).swapaxes(0, 1)
+            yield [img]
+
     @staticmethod
     def parse(folder_name, dataset, model):
 
@@ -109,14 +114,11 @@ class GoalPredictionSingleImageSupervisedLearningFromDisk(AbstractLearning):
 
         num_channel, height, width = model.image_module.get_final_dimension()
 
-        # Read images
-        image_dataset = []
-        num_examples = len(os.listdir(folder_name))
-        for i in range(0, num_examples):
-            example_folder_name = folder_name + "/example_" + str(i)
-            img = scipy.misc.imread(example_folder_name + "/image_0.png").swapaxes(1, 2).swapaxes(0, 1)
-            images = [img]
-            image_dataset.append(images)
+        # Read images. Use the packed images if the dataset has been packed (see utils.packed_image_dataset)
+        image_dataset = PackedImageDataset.load_if_exists(folder_name)
+        if image_dataset is None:
+            image_dataset = list(GoalPredictionSingleImageSupervisedLearningFromDisk.read_images(folder_name))
+        num_examples = len(image_dataset)
 
         assert len(image_dataset) == len(dataset)
 
@@ -152,14 +154,8 @@ class GoalPredictionSingleImageSupervisedLearningFromDisk(AbstractLearning):
         return image_dataset, goal_dataset
 
     def convert_to_id(self, instruction):
-        tk_seq = instruction.split()
-        token_ids = []
-        for tk in tk_seq:
-            if tk in self.vocab:
-                token_ids.append(self.vocab[tk])
-            else:
-                print("Out of vocabulary word. Ignoring ", tk)
-        return token_ids
+        # Out of vocabulary words are ignored
+        return self.vocab.tokenize(instruction, tokenizer=Vocabulary.SPLIT)
 
     def is_close_enough(self, inferred_ix, row, col):
         predicted_row = int(inferred_ix / float(self.final_width))
@@ -369,7 +365,7 @@ class GoalPredictionSingleImageSupervisedLearningFromDisk(AbstractLearning):
 
             # Test on tuning data
             self.test(tune_dataset, tune_images, tune_goal_location, tensorboard=tensorboard)
-            batch_replay_items = []
+            batch_replay_items = ReplayBatch()
 
             for data_point_ix, data_point in enumerate(train_dataset):
 
@@ -402,7 +398,7 @@ class GoalPredictionSingleImageSupervisedLearningFromDisk(AbstractLearning):
                 # Perform update
                 if len(batch_replay_items) > 0:
                     loss_val = self.do_update(batch_replay_items)
-                    batch_replay_items = []
+                    batch_replay_items = ReplayBatch()
                     if tensorboard is not None:
                         tensorboard.log_scalar("Loss", loss_val)
                         if self.goal_prediction_loss is not None:
@@ -9,7 +9,7 @@ import scipy.misc
 import matplotlib.pyplot as plt
 
 from agents.agent_observed_state import AgentObservedState
-from agents.replay_memory_item import ReplayMemoryItem
+from agents.replay_memory_item import ReplayMemoryItem, ReplayBatch
 from learning.auxiliary_objective.goal_prediction import GoalPrediction
 from learning.auxiliary_objective.object_pixel_identification import ObjectPixelIdentification
 from learning.auxiliary_objective.symbolic_language_prediction import SymbolicLanguagePrediction
@@ -20,6 +20,8 @@ from utils.cuda import cuda_var
 from models.incremental_model.incremental_model_recurrent_implicit_factorization_resnet import \
     IncrementalModelRecurrentImplicitFactorizationResnet
 from utils.debug_nav_drone_instruction import instruction_to_string
+from utils.packed_image_dataset import PackedImageDataset
+from utils.vocabulary import Vocabulary
 
 
 class UnetGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
@@ -44,14 +46,7 @@ class UnetGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
         self.global_id = 1
         self.final_height, self.final_width = 32, 32
 
-        self.vocab = {}
-        vocab_path = config["vocab_file"]
-        word_index = 0
-        with open(vocab_path) as f:
-            for line in f.readlines():
-                token = line.strip()
-                self.vocab[token] = word_index
-                word_index += 1
+        self.vocab = Vocabulary.load(config["vocab_file"])
 
         # Auxiliary Objectives
         if self.config["do_object_detection"]:
@@ -157,11 +152,9 @@ class UnetGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
         return loss, meta
 
     @staticmethod
-    def parse(folder_name, dataset):
-
-        start = time.time()
+    def read_images(folder_name):
+        """ Yields the list of images of every example in the folder """
 
-        image_dataset = []
         num_examples = len(os.listdir(folder_name))
         for i in range(0, num_examples):
             example_folder_name = folder_name + "/example_" + str(i)
@@ -171,7 +164,18 @@ class UnetGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
             for j in range(0, num_actions):
                 img = scipy.misc.imread(example_folder_name + "/image_" + str(j) + ".png").swapaxes(1, 2).swapaxes(0, 1)
                 images.append(img)
-            image_dataset.append(images)
+            yield images
+
+    @staticmethod
+    def parse(folder_name, dataset):
+
+        start = time.time()
+
+        # Use the packed images if the dataset has been packed (see utils.packed_image_dataset)
+        image_dataset = PackedImageDataset.load_if_exists(folder_name)
+        if image_dataset is None:
+            image_dataset = list(UnetGoalPredictionSupervisedLearningFromDisk.read_images(folder_name))
+        num_examples = len(image_dataset)
 
         goal_dataset = []
         num_examples = len(os.listdir(folder_name))
@@ -236,14 +240,8 @@ class UnetGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
         plt.clf()
 
     def convert_to_id(self, instruction):
-        tk_seq = instruction.split()
-        token_ids = []
-        for tk in tk_seq:
-            if tk in self.vocab:
-                token_ids.append(self.vocab[tk])
-            else:
-                print("Out of vocabulary word. Ignoring ", tk)
-        return token_ids
+        # Out of vocabulary words are ignored
+        return self.vocab.tokenize(instruction, tokenizer=Vocabulary.SPLIT)
 
     def interactive_shell(self, train_dataset, train_images):
 
@@ -446,7 +444,7 @@ class UnetGoalPredictionSupervisedLearningFromDisk(AbstractLearning):
                 traj_len = len(trajectory)
                 if self.only_first:
                     trajectory = trajectory[0:1]
-                batch_replay_items = []
+                batch_replay_items = ReplayBatch()
 
                 for action_ix, action in enumerate(trajectory):
 
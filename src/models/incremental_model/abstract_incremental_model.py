@@ -6,6 +6,10 @@ class AbstractIncrementalModel(object):
     def __init__(self, config, constants):
         self.config = config
         self.constants = constants
+        # Number of optimizer steps made on this model when it is shared across processes
+        self.parameter_version = torch.zeros(1).long().share_memory_()
+        # Set to True when the server sends uint8 images which it has not normalized (normalize_image=False)
+        self.normalize_image = False
 
     def load_saved_model(self, load_dir):
         raise NotImplementedError()
@@ -13,13 +17,29 @@ class AbstractIncrementalModel(object):
     def save_model(self, save_dir):
         raise NotImplementedError()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None, volatile=False):
-        """
+    def get_probs_batch(self, agent_observed_state_list, model_state_list=None, mode=None, volatile=False):
+        """ Default implementation that calls get_probs once per state. Models which can
+        batch their forward pass should override this.
         :param agent_observed_state_list: list of agent observed states
+        :param model_state_list: list of model states (one per episode) or None
         :type agent_observed_state_list: list
-        :return: PyTorch Variable of shape "BatchSize x NumActions"
+        :return: PyTorch Variable of shape "BatchSize x NumActions", list of new model states,
+                 list of image embeddings and list of state features
         """
-        raise NotImplementedError()
+        if model_state_list is None:
+            model_state_list = [None] * len(agent_observed_state_list)
+        assert len(model_state_list) == len(agent_observed_state_list)
+
+        log_probs_list, new_model_state_list, image_emb_seq_list, state_feature_list = [], [], [], []
+        for agent_observed_state, model_state in zip(agent_observed_state_list, model_state_list):
+            log_probs, new_model_state, image_emb_seq, state_feature = self.get_probs(
+                agent_observed_state, model_state, mode=mode, volatile=volatile)
+            log_probs_list.append(log_probs)
+            new_model_state_list.append(new_model_state)
+            image_emb_seq_list.append(image_emb_seq)
+            state_feature_list.append(state_feature)
+
+        return torch.cat(log_probs_list), new_model_state_list, image_emb_seq_list, state_feature_list
 
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
         """
@@ -43,7 +63,7 @@ class AbstractIncrementalModel(object):
         :return: numpy array of shape "BatchSize"
         """
         probs_batch = self.get_probs_batch(agent_observed_state_list,
-                                           mode=mode).data
+                                           mode=mode)[0].data
         action_batch = torch.from_numpy(np.array(action_list))
         chosen_action_probs = probs_batch.gather(1, action_batch.view(-1, 1))
         return chosen_action_probs.numpy()
@@ -61,6 +81,22 @@ class AbstractIncrementalModel(object):
                                                   [action], mode=mode)
         return action_prob_array[0]
 
+    def enable_instruction_cache(self, instructions=None, batch_size=32):
+        """ Cache the instruction embeddings of the text modules of this model that support it, and
+        pre-encode the given list of instructions in batches. The model must not be trained until
+        disable_instruction_cache is called. """
+        for text_module in self.get_cached_text_modules():
+            text_module.enable_embedding_cache()
+            if instructions is not None:
+                text_module.pre_encode(instructions, batch_size)
+
+    def disable_instruction_cache(self):
+        for text_module in self.get_cached_text_modules():
+            text_module.disable_embedding_cache()
+
+    def get_cached_text_modules(self):
+        return [module for module in self.__dict__.values() if hasattr(module, "enable_embedding_cache")]
+
     def get_parameters(self):
         raise NotImplementedError()
 
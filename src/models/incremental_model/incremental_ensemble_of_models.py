@@ -50,9 +50,6 @@ class IncrementalEnsembleOfModels(AbstractIncrementalModel):
         self.config = config
         self.constants = constants
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         new_ensemble_model_state = []
@@ -22,7 +22,7 @@ from models.module.symbolic_embddings import *
 from models.module.symbolic_instruction_module_probabilities import SymbolicInstructionModuleProbabilities
 from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
 from models.incremental_module.incremental_recurrence_simple_module import IncrementalRecurrenceSimpleModule
-from utils.cuda import cuda_var, cuda_tensor
+from utils.cuda import cuda_var, cuda_tensor, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 
 
@@ -101,45 +101,6 @@ class IncrementalJointModelRecurrentPolicyNetworkSymbolicTextResnet(AbstractIncr
             if self.object_detection_module is not None:
                 self.object_detection_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-        for aos in agent_observed_state_list:
-            assert isinstance(aos, AgentObservedState)
-        # print "batch size:", len(agent_observed_state_list)
-
-        # sort list by instruction length
-        agent_observed_state_list = sorted(
-            agent_observed_state_list,
-            key=lambda aos_: len(aos_.get_instruction()),
-            reverse=True
-        )
-
-        image_seq_lens = [aos.get_num_images()
-                          for aos in agent_observed_state_list]
-        image_seq_lens_batch = cuda_tensor(
-            torch.from_numpy(np.array(image_seq_lens)))
-        max_len = max(image_seq_lens)
-        image_seqs = [aos.get_image()[:max_len]
-                      for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float())
-
-        instructions = [aos.get_instruction()
-                        for aos in agent_observed_state_list]
-        read_pointers = [aos.get_read_pointers()
-                         for aos in agent_observed_state_list]
-        instructions_batch = (instructions, read_pointers)
-
-        prev_actions_raw = [aos.get_previous_action()
-                            for aos in agent_observed_state_list]
-        prev_actions = [self.none_action if a is None else a
-                        for a in prev_actions_raw]
-        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)))
-
-        probs_batch, _ = self.final_module(image_batch, image_seq_lens_batch,
-                                           instructions_batch, prev_actions_batch,
-                                           mode, model_state=None)
-        return probs_batch
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
@@ -150,7 +111,7 @@ class IncrementalJointModelRecurrentPolicyNetworkSymbolicTextResnet(AbstractIncr
             torch.from_numpy(np.array(image_seq_lens)))
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         start_images = [aos.data_point.get_six_start_images() for aos in agent_observed_state_list]
         instructions = [aos.get_instruction()
@@ -184,7 +145,7 @@ class IncrementalJointModelRecurrentPolicyNetworkSymbolicTextResnet(AbstractIncr
             torch.from_numpy(np.array(image_seq_lens)))
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions_batch = [symbolic_text]
 
@@ -28,7 +28,7 @@ from models.module.action_prediction_module import ActionPredictionModule
 from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
 from models.incremental_module.incremental_recurrence_simple_module import IncrementalRecurrenceSimpleModule
 from models.resnet_image_detection import ImageDetectionModule
-from utils.cuda import cuda_var, cuda_tensor
+from utils.cuda import cuda_var, cuda_tensor, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 
 
@@ -109,9 +109,6 @@ class IncrementalModelChaplot(AbstractIncrementalModel):
             if self.goal_prediction_module is not None:
                 self.goal_prediction_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
@@ -119,7 +116,7 @@ class IncrementalModelChaplot(AbstractIncrementalModel):
 
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
@@ -69,9 +69,6 @@ class IncrementalModelEmnlp(AbstractIncrementalModel):
             self.final_module.cuda()
 
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
@@ -38,7 +38,7 @@ from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
 from models.incremental_module.incremental_recurrence_simple_module import IncrementalRecurrenceSimpleModule
 from models.module.unet_image_module import UnetImageModule
 from models.resnet_image_detection import ImageDetectionModule
-from utils.cuda import cuda_var, cuda_tensor
+from utils.cuda import cuda_var, cuda_tensor, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 from utils.debug_nav_drone_instruction import instruction_to_string
 
@@ -127,9 +127,6 @@ class IncrementalModelOracleGoldProb(AbstractIncrementalModel):
             if self.goal_prediction_module is not None:
                 self.goal_prediction_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
@@ -137,7 +134,7 @@ class IncrementalModelOracleGoldProb(AbstractIncrementalModel):
 
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
@@ -209,7 +206,7 @@ class IncrementalModelOracleGoldProb(AbstractIncrementalModel):
 
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
@@ -14,7 +14,7 @@ from models.module.object_detection_module import ObjectDetectionModule
 from models.module.action_prediction_module import ActionPredictionModule
 from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
 from models.incremental_module.incremental_recurrence_simple_module import IncrementalRecurrenceSimpleModule
-from utils.cuda import cuda_var, cuda_tensor
+from utils.cuda import cuda_var, cuda_tensor, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 
 
@@ -78,45 +78,6 @@ class IncrementalModelRecurrentPolicyNetworkGoalImageResnet(AbstractIncrementalM
             if self.object_detection_module is not None:
                 self.object_detection_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-        for aos in agent_observed_state_list:
-            assert isinstance(aos, AgentObservedState)
-        # print "batch size:", len(agent_observed_state_list)
-
-        # sort list by instruction length
-        agent_observed_state_list = sorted(
-            agent_observed_state_list,
-            key=lambda aos_: len(aos_.get_instruction()),
-            reverse=True
-        )
-
-        image_seq_lens = [aos.get_num_images()
-                          for aos in agent_observed_state_list]
-        image_seq_lens_batch = cuda_tensor(
-            torch.from_numpy(np.array(image_seq_lens)))
-        max_len = max(image_seq_lens)
-        image_seqs = [aos.get_image()[:max_len]
-                      for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float())
-
-        instructions = [aos.get_instruction()
-                        for aos in agent_observed_state_list]
-        read_pointers = [aos.get_read_pointers()
-                         for aos in agent_observed_state_list]
-        instructions_batch = (instructions, read_pointers)
-
-        prev_actions_raw = [aos.get_previous_action()
-                            for aos in agent_observed_state_list]
-        prev_actions = [self.none_action if a is None else a
-                        for a in prev_actions_raw]
-        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)))
-
-        probs_batch, _ = self.final_module(image_batch, image_seq_lens_batch,
-                                           instructions_batch, prev_actions_batch,
-                                           mode, model_state=None)
-        return probs_batch
-
     # def resize(self, img):
     #     img = img.swapaxes(0, 1).swapaxes(1, 2)
     #     resized_img = scipy.misc.imresize(img, (224, 224))
@@ -148,7 +109,7 @@ class IncrementalModelRecurrentPolicyNetworkGoalImageResnet(AbstractIncrementalM
     #                                                                     mode, model_state)
     #     return probs_batch, new_model_state, image_emb_seq
 
-    def get_probs(self, agent_observed_state, model_state, mode=None):
+    def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
         agent_observed_state_list = [agent_observed_state]
@@ -158,21 +119,21 @@ class IncrementalModelRecurrentPolicyNetworkGoalImageResnet(AbstractIncrementalM
             torch.from_numpy(np.array(image_seq_lens)))
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float())
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         goal_image_seqs = [[aos.get_goal_image()] for aos in agent_observed_state_list]
-        goal_image_batch = cuda_var(torch.from_numpy(np.array(goal_image_seqs)).float())
+        goal_image_batch = cuda_var(torch.from_numpy(np.array(goal_image_seqs)).float(), volatile)
 
         prev_actions_raw = [aos.get_previous_action()
                             for aos in agent_observed_state_list]
         prev_actions = [self.none_action if a is None else a
                         for a in prev_actions_raw]
-        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)))
+        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)), volatile)
 
         probs_batch, new_model_state, image_emb_seq = self.final_module(image_batch, image_seq_lens_batch,
                                                                         goal_image_batch, prev_actions_batch,
                                                                         mode, model_state)
-        return probs_batch, new_model_state, image_emb_seq
+        return probs_batch, new_model_state, image_emb_seq, None
 
     def action_prediction_log_prob(self, batch_input):
         assert self.action_prediction_module is not None, "Action prediction module not created. Check config."
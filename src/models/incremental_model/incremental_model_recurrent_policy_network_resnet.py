@@ -24,7 +24,7 @@ from models.module.action_prediction_module import ActionPredictionModule
 from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
 from models.incremental_module.incremental_recurrence_simple_module import IncrementalRecurrenceSimpleModule
 from models.resnet_image_detection import ImageDetectionModule
-from utils.cuda import cuda_var, cuda_tensor
+from utils.cuda import cuda_var, cuda_tensor, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 
 
@@ -121,27 +121,25 @@ class IncrementalModelRecurrentPolicyNetworkResnet(AbstractIncrementalModel):
             if self.goal_prediction_module is not None:
                 self.goal_prediction_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise AssertionError("Buggy")
+    def get_probs_batch(self, agent_observed_state_list, model_state_list=None, mode=None, volatile=False):
+        """ Batched version of get_probs. Each agent observed state comes from a different episode and
+        model_state_list[i] is the model state of that episode (None at the start of an episode). Returns
+        log-probabilities of shape "BatchSize x NumActions" and lists of the per-episode new model states,
+        image embeddings and state features. Calling this on a single state gives the same output as get_probs. """
+
         for aos in agent_observed_state_list:
             assert isinstance(aos, AgentObservedState)
-        # print "batch size:", len(agent_observed_state_list)
-
-        # sort list by instruction length
-        agent_observed_state_list = sorted(
-            agent_observed_state_list,
-            key=lambda aos_: len(aos_.get_instruction()),
-            reverse=True
-        )
+        batch_size = len(agent_observed_state_list)
+        if model_state_list is None:
+            model_state_list = [None] * batch_size
+        assert len(model_state_list) == batch_size
 
-        image_seq_lens = [aos.get_num_images()
-                          for aos in agent_observed_state_list]
+        image_seq_lens = [1] * batch_size
         image_seq_lens_batch = cuda_tensor(
             torch.from_numpy(np.array(image_seq_lens)))
-        max_len = max(image_seq_lens)
-        image_seqs = [aos.get_image()[:max_len]
+        image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float())
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
@@ -153,12 +151,50 @@ class IncrementalModelRecurrentPolicyNetworkResnet(AbstractIncrementalModel):
                             for aos in agent_observed_state_list]
         prev_actions = [self.none_action if a is None else a
                         for a in prev_actions_raw]
-        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)))
+        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)), volatile)
+
+        batch_model_state = self._stack_model_states(agent_observed_state_list, model_state_list, volatile)
+
+        probs_batch, new_batch_model_state, image_emb_seq, state_feature = self.final_module(
+            image_batch, image_seq_lens_batch, instructions_batch, prev_actions_batch, mode, batch_model_state)
+
+        text_emb, (hidden, cell), image_memory_emb = new_batch_model_state
+        new_model_state_list = [(text_emb[i:i + 1], (hidden[:, i:i + 1], cell[:, i:i + 1]), image_memory_emb[i:i + 1])
+                                for i in range(0, batch_size)]
+        image_emb_seq_list = [image_emb_seq[i:i + 1] for i in range(0, batch_size)]
+        state_feature_list = [state_feature[i:i + 1] for i in range(0, batch_size)]
+
+        return probs_batch, new_model_state_list, image_emb_seq_list, state_feature_list
+
+    def _stack_model_states(self, agent_observed_state_list, model_state_list, volatile):
+        """ Stack per-episode model states into a single batched model state. Episodes which are just
+        starting (model state is None) get their instruction encoded and zero recurrent states. """
+
+        new_episode_ix = [i for i, model_state in enumerate(model_state_list) if model_state is None]
+        model_state_list = list(model_state_list)
+
+        if len(new_episode_ix) > 0:
+            # Text module expects instructions in descending order of length
+            new_episode_ix = sorted(new_episode_ix,
+                                    key=lambda i: len(agent_observed_state_list[i].get_instruction()),
+                                    reverse=True)
+            instructions = [agent_observed_state_list[i].get_instruction() for i in new_episode_ix]
+            read_pointers = [agent_observed_state_list[i].get_read_pointers() for i in new_episode_ix]
+            text_emb = self.text_module((instructions, read_pointers))
+
+            hidden_dim = self.image_recurrence_module.output_emb_dim
+            num_layers = self.image_recurrence_module.num_layers
+            zero_hidden = cuda_var(torch.zeros(num_layers, 1, hidden_dim), volatile)
+            zero_memory = cuda_var(torch.zeros(1, hidden_dim), volatile)
+            for j, i in enumerate(new_episode_ix):
+                model_state_list[i] = (text_emb[j:j + 1], (zero_hidden, zero_hidden), zero_memory)
+
+        text_emb = torch.cat([model_state[0] for model_state in model_state_list], dim=0)
+        hidden = torch.cat([model_state[1][0] for model_state in model_state_list], dim=1)
+        cell = torch.cat([model_state[1][1] for model_state in model_state_list], dim=1)
+        image_memory_emb = torch.cat([model_state[2] for model_state in model_state_list], dim=0)
 
-        probs_batch, _ = self.final_module(image_batch, image_seq_lens_batch,
-                                           instructions_batch, prev_actions_batch,
-                                           mode, model_state=None)
-        return probs_batch
+        return text_emb, (hidden, cell), image_memory_emb
 
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
@@ -173,7 +209,7 @@ class IncrementalModelRecurrentPolicyNetworkResnet(AbstractIncrementalModel):
         #               for aos in agent_observed_state_list]
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
@@ -12,7 +12,7 @@ from models.module.action_simple_module import ActionSimpleModule
 from models.module.text_pointer_module import TextPointerModule
 from models.module.text_simple_module import TextSimpleModule
 from models.module.image_resnet_text_based_kernel_module import ImageTextKernelResnetModule
-from utils.cuda import cuda_var, cuda_tensor
+from utils.cuda import cuda_var, cuda_tensor, cuda_image_var
 
 
 class IncrementalModelTextKernelRecurrentPolicyNetworkResnet(AbstractIncrementalModel):
@@ -65,45 +65,7 @@ class IncrementalModelTextKernelRecurrentPolicyNetworkResnet(AbstractIncremental
             self.action_module.cuda()
             self.final_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        for aos in agent_observed_state_list:
-            assert isinstance(aos, AgentObservedState)
-        # print "batch size:", len(agent_observed_state_list)
-
-        # sort list by instruction length
-        agent_observed_state_list = sorted(
-            agent_observed_state_list,
-            key=lambda aos_: len(aos_.get_instruction()),
-            reverse=True
-        )
-
-        image_seq_lens = [aos.get_num_images()
-                          for aos in agent_observed_state_list]
-        image_seq_lens_batch = cuda_tensor(
-            torch.from_numpy(np.array(image_seq_lens)))
-        max_len = max(image_seq_lens)
-        image_seqs = [aos.get_image()[:max_len]
-                      for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float())
-
-        instructions = [aos.get_instruction()
-                        for aos in agent_observed_state_list]
-        read_pointers = [aos.get_read_pointers()
-                         for aos in agent_observed_state_list]
-        instructions_batch = (instructions, read_pointers)
-
-        prev_actions_raw = [aos.get_previous_action()
-                            for aos in agent_observed_state_list]
-        prev_actions = [self.none_action if a is None else a
-                        for a in prev_actions_raw]
-        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)))
-
-        probs_batch = self.final_module(image_batch, image_seq_lens_batch,
-                                        instructions_batch, prev_actions_batch,
-                                        mode, model_state=None)
-        return probs_batch
-
-    def get_probs(self, agent_observed_state, model_state, mode=None):
+    def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
         agent_observed_state_list = [agent_observed_state]
@@ -116,7 +78,7 @@ class IncrementalModelTextKernelRecurrentPolicyNetworkResnet(AbstractIncremental
         #               for aos in agent_observed_state_list]
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float())
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
@@ -128,12 +90,12 @@ class IncrementalModelTextKernelRecurrentPolicyNetworkResnet(AbstractIncremental
                             for aos in agent_observed_state_list]
         prev_actions = [self.none_action if a is None else a
                         for a in prev_actions_raw]
-        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)))
+        prev_actions_batch = cuda_var(torch.from_numpy(np.array(prev_actions)), volatile)
 
         probs_batch, new_model_state, image_emb_seq = self.final_module(image_batch, image_seq_lens_batch,
                                                          instructions_batch, prev_actions_batch,
                                                          mode, model_state)
-        return probs_batch, new_model_state, image_emb_seq
+        return probs_batch, new_model_state, image_emb_seq, None
 
     def load_saved_model(self, load_dir):
         if torch.cuda.is_available():
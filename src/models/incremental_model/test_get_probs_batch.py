@@ -0,0 +1,102 @@
+import unittest
+import numpy as np
+import torch
+
+from agents.agent_observed_state import AgentObservedState
+from models.incremental_model.abstract_incremental_model import AbstractIncrementalModel
+from models.incremental_model.incremental_model_recurrent_policy_network_resnet import \
+    IncrementalModelRecurrentPolicyNetworkResnet
+
+
+CONFIG = {
+    "num_actions": 81,
+    "image_height": 32,
+    "image_width": 32,
+    "vocab_size": 20,
+    "use_pointer_model": False,
+    "do_action_prediction": False,
+    "do_temporal_autoencoding": False,
+    "do_object_detection": False,
+    "do_symbolic_language_prediction": False,
+    "do_goal_prediction": False
+}
+
+CONSTANTS = {
+    "image_emb_dim": 8,
+    "action_emb_dim": 4,
+    "word_emb_dim": 4,
+    "lstm_emb_dim": 6,
+    "max_num_images": 5
+}
+
+
+class PerStateModel(IncrementalModelRecurrentPolicyNetworkResnet):
+    """ Same model without its batched forward pass, so that it uses the default implementation
+    of AbstractIncrementalModel which calls get_probs once per state """
+    get_probs_batch = AbstractIncrementalModel.get_probs_batch
+
+
+class TestGetProbsBatch(unittest.TestCase):
+    """ get_probs_batch on the states of several episodes must give the same log-probabilities
+    and new model states as calling get_probs on every state separately """
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.rng = np.random.RandomState(0)
+
+    def random_image(self):
+        return self.rng.rand(3, CONFIG["image_height"], CONFIG["image_width"]).astype(np.float32)
+
+    def make_episodes(self, model):
+        """ States of episodes with instructions of different lengths. Some episodes are starting
+        (model state None) and the others are a few steps in. """
+
+        states, model_states = [], []
+        for num_steps, instruction_len in [(0, 5), (2, 9), (0, 3), (1, 7), (3, 4)]:
+            instruction = list(self.rng.randint(0, CONFIG["vocab_size"], size=instruction_len))
+            state = AgentObservedState(instruction=instruction, config=CONFIG, constants=CONSTANTS,
+                                       start_image=self.random_image(), previous_action=None)
+            model_state = None
+            for _ in range(num_steps):
+                _, model_state, _, _ = model.get_probs(state, model_state, volatile=True)
+                action = int(self.rng.randint(0, CONFIG["num_actions"]))
+                state = state.update(self.random_image(), action)
+            states.append(state)
+            model_states.append(model_state)
+        return states, model_states
+
+    def assert_same_as_get_probs(self, model):
+        model.final_module.eval()
+        states, model_states = self.make_episodes(model)
+
+        log_probs_batch, new_model_states, _, _ = model.get_probs_batch(
+            states, model_state_list=model_states, volatile=True)
+        self.assertEqual(tuple(log_probs_batch.size()), (len(states), CONFIG["num_actions"]))
+        self.assertEqual(len(new_model_states), len(states))
+
+        for i, (state, model_state) in enumerate(zip(states, model_states)):
+            log_probs, new_model_state, _, _ = model.get_probs(state, model_state, volatile=True)
+            self.assert_close(log_probs_batch[i:i + 1], log_probs)
+            text_emb, (hidden, cell), image_memory_emb = new_model_state
+            batch_text_emb, (batch_hidden, batch_cell), batch_image_memory_emb = new_model_states[i]
+            self.assert_close(batch_text_emb, text_emb)
+            self.assert_close(batch_hidden, hidden)
+            self.assert_close(batch_cell, cell)
+            self.assert_close(batch_image_memory_emb, image_memory_emb)
+
+    def assert_close(self, batch_var, var):
+        batch_value = batch_var.data.cpu().numpy()
+        value = var.data.cpu().numpy()
+        self.assertEqual(batch_value.shape, value.shape)
+        self.assertTrue(np.allclose(batch_value, value, atol=1e-5),
+                        "max difference %r" % np.abs(batch_value - value).max())
+
+    def test_batched_forward_pass(self):
+        self.assert_same_as_get_probs(IncrementalModelRecurrentPolicyNetworkResnet(CONFIG, CONSTANTS))
+
+    def test_default_implementation(self):
+        self.assert_same_as_get_probs(PerStateModel(CONFIG, CONSTANTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
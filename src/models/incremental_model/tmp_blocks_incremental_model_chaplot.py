@@ -14,7 +14,7 @@ from models.module.object_detection_module import ObjectDetectionModule
 from models.module.symbolic_language_prediction_module import SymbolicLanguagePredictionModule
 from models.module.action_prediction_module import ActionPredictionModule
 from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
-from utils.cuda import cuda_var
+from utils.cuda import cuda_var, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 
 
@@ -93,9 +93,6 @@ class TmpBlocksIncrementalModelChaplot(AbstractIncrementalModel):
             if self.goal_prediction_module is not None:
                 self.goal_prediction_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
@@ -103,7 +100,7 @@ class TmpBlocksIncrementalModelChaplot(AbstractIncrementalModel):
 
         image_seqs = [[aos.get_last_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
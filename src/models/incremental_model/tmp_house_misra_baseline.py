@@ -16,7 +16,7 @@ from models.module.object_detection_module import ObjectDetectionModule
 from models.module.symbolic_language_prediction_module import SymbolicLanguagePredictionModule
 from models.module.action_prediction_module import ActionPredictionModule
 from models.module.temporal_autoencoder_module import TemporalAutoencoderModule
-from utils.cuda import cuda_var
+from utils.cuda import cuda_var, cuda_image_var
 from utils.nav_drone_landmarks import get_all_landmark_names
 
 
@@ -49,9 +49,6 @@ class TmpHouseMisraBaseline(AbstractIncrementalModel):
             self.text_module.cuda()
             self.final_module.cuda()
 
-    def get_probs_batch(self, agent_observed_state_list, mode=None):
-        raise NotImplementedError()
-
     def get_probs(self, agent_observed_state, model_state, mode=None, volatile=False):
 
         assert isinstance(agent_observed_state, AgentObservedState)
@@ -60,7 +57,7 @@ class TmpHouseMisraBaseline(AbstractIncrementalModel):
         # Extract the last 4 images or add dummy paddings
         image_seqs = [[aos.get_image()]
                       for aos in agent_observed_state_list]
-        image_batch = cuda_var(torch.from_numpy(np.array(image_seqs)).float(), volatile)
+        image_batch = cuda_image_var(np.array(image_seqs), volatile, self.normalize_image)
 
         instructions = [aos.get_instruction()
                         for aos in agent_observed_state_list]
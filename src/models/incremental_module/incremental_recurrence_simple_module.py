@@ -42,11 +42,17 @@ class IncrementalRecurrenceSimpleModule(nn.Module):
             dims = (self.num_layers, batch_size, self.output_emb_dim)
             hidden_vectors = (Variable(cuda_tensor(torch.zeros(*dims)), requires_grad=False),
                               Variable(cuda_tensor(torch.zeros(*dims)), requires_grad=False))
+        else:
+            # hidden vectors are given in batch order and must follow the sorted sequences
+            sort_idx_var = Variable(cuda_tensor(torch.LongTensor(sort_idx)))
+            hidden_vectors = tuple(h.index_select(1, sort_idx_var) for h in hidden_vectors)
 
         # swap so batch dimension is second, sequence dimension is first
         image_seq_batch = image_seq_batch.transpose(0, 1)
         packed_input = pack_padded_sequence(image_seq_batch, lengths_np)
         lstm_out_packed, new_hidden_vector = self.lstm(packed_input, hidden_vectors)
+        sort_idx_reverse_var = Variable(cuda_tensor(torch.LongTensor(sort_idx_reverse)))
+        new_hidden_vector = tuple(h.index_select(1, sort_idx_reverse_var) for h in new_hidden_vector)
         # return average output embedding
         lstm_out, seq_lengths = pad_packed_sequence(lstm_out_packed)
         lstm_out = lstm_out.transpose(0, 1)
@@ -66,11 +66,12 @@ class TmpIncrementalMultimodalDenseValtsRecurrentSimpleModule(nn.Module):
             block_logits = self.dense_block(x_3)
             direction_logits = self.dense_direction(x_3)
 
-            block_logprob = F.log_softmax(block_logits)   # 1 x num_block
-            direction_logprob = F.log_softmax(direction_logits)  # 1 x num_direction
+            block_logprob = F.log_softmax(block_logits)   # batch x num_block
+            direction_logprob = F.log_softmax(direction_logits)  # batch x num_direction
 
-            action_logprob = block_logprob.transpose(0, 1) + direction_logprob[:, :4]  # num_block x num_direction
-            action_logprob = action_logprob.view(1, -1)
+            # batch x num_block x num_direction
+            action_logprob = block_logprob.unsqueeze(2) + direction_logprob[:, :4].unsqueeze(1)
+            action_logprob = action_logprob.view(num_states, -1)
             stop_logprob = direction_logprob[:, 4:5]
 
             action_logprob = torch.cat([action_logprob, stop_logprob], dim=1)
@@ -0,0 +1,62 @@
+import hashlib
+import torch
+
+from cachetools import LRUCache
+from torch.autograd import Variable
+
+
+class InstructionEmbeddingCache:
+    """ Cache of the instruction embeddings computed by a text module at inference. Embeddings are keyed
+    by the version of the text module, which is a hash of its parameters, the instruction tokens and the
+    read pointers, so embeddings are reused whenever the same checkpoint embeds the same instruction again.
+    The least recently used embeddings are evicted once max_size embeddings are cached.
+
+    Embeddings are returned without gradient, so the cache must only be used while the text module is
+    not trained. """
+
+    DEFAULT_MAX_SIZE = 20000
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.embeddings = LRUCache(maxsize=max_size)
+        self.version = None
+
+    @staticmethod
+    def get_module_version(module):
+        sha = hashlib.sha1()
+        for name, tensor in sorted(module.state_dict().items()):
+            sha.update(name.encode("utf-8"))
+            sha.update(tensor.cpu().numpy().tobytes())
+        return sha.hexdigest()
+
+    def set_version(self, module):
+        """ Must be called whenever the parameters of the module change """
+        self.version = InstructionEmbeddingCache.get_module_version(module)
+
+    def encode(self, encode_fn, instructions_batch):
+        """ Returns the embeddings of the instructions batch. Embeddings not in the cache are computed
+        with encode_fn, in a single batch which keeps the order of the instructions batch. """
+
+        token_lists, text_pointers = instructions_batch
+        keys = [(self.version, tuple(tokens), tuple(pointers))
+                for tokens, pointers in zip(token_lists, text_pointers)]
+
+        embeddings = [self.embeddings.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if len(missing) > 0:
+            missing_embeddings = encode_fn(([token_lists[i] for i in missing],
+                                            [text_pointers[i] for i in missing])).data
+            for j, i in enumerate(missing):
+                embeddings[i] = missing_embeddings[j:j + 1]
+                self.embeddings[keys[i]] = embeddings[i]
+
+        return Variable(torch.cat(embeddings), requires_grad=False)
+
+    def pre_encode(self, encode_fn, token_lists, batch_size=32):
+        """ Embeds the distinct instructions in token_lists in batches sorted by descending length, with
+        read pointers covering the entire instruction. """
+
+        instructions = sorted(set([tuple(tokens) for tokens in token_lists if len(tokens) > 0]),
+                              key=lambda tokens: -len(tokens))
+        for i in range(0, len(instructions), batch_size):
+            batch = [list(tokens) for tokens in instructions[i: i + batch_size]]
+            self.encode(encode_fn, (batch, [(0, len(tokens)) for tokens in batch]))
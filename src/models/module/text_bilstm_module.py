@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 from torch.autograd import Variable
 from utils.cuda import cuda_tensor, cuda_var
+from models.module.instruction_embedding_cache import InstructionEmbeddingCache
 from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 
 
@@ -32,6 +33,10 @@ class TextBiLSTMModule(nn.Module):
         self.lstm_f = nn.LSTM(emb_dim, hidden_dim, num_layers)
         self.lstm_b = nn.LSTM(emb_dim, hidden_dim, num_layers)
 
+        # Cache of instruction embeddings used at inference
+        self.embedding_cache = None
+        self.use_embedding_cache = False
+
     def init_weights(self):
         self.embedding.weight.data.normal_(0, 1)
         for name, param in self.lstm_f.named_parameters():
@@ -45,7 +50,28 @@ class TextBiLSTMModule(nn.Module):
             elif 'weight' in name:
                 nn.init.xavier_normal(param)
 
+    def enable_embedding_cache(self, max_size=InstructionEmbeddingCache.DEFAULT_MAX_SIZE):
+        """ Reuse instruction embeddings until disable_embedding_cache is called. The module must not be
+        trained in between. """
+        if self.embedding_cache is None:
+            self.embedding_cache = InstructionEmbeddingCache(max_size)
+        self.embedding_cache.set_version(self)
+        self.use_embedding_cache = True
+
+    def disable_embedding_cache(self):
+        self.use_embedding_cache = False
+
+    def pre_encode(self, token_lists, batch_size=32):
+        """ Embeds the instructions in batches and caches their embeddings """
+        assert self.use_embedding_cache, "Embedding cache is not enabled"
+        self.embedding_cache.pre_encode(self.encode, token_lists, batch_size)
+
     def forward(self, instructions_batch):
+        if self.use_embedding_cache:
+            return self.embedding_cache.encode(self.encode, instructions_batch)
+        return self.encode(instructions_batch)
+
+    def encode(self, instructions_batch):
         token_lists, _ = instructions_batch
         batch_size = len(token_lists)
         text_lengths = np.array([len(tokens) for tokens in token_lists])
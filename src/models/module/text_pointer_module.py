@@ -6,6 +6,7 @@ from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 import torch.nn.functional as F
 
 from utils.cuda import cuda_tensor, cuda_var
+from models.module.instruction_embedding_cache import InstructionEmbeddingCache
 
 
 class TextPointerModule(nn.Module):
@@ -36,7 +37,32 @@ class TextPointerModule(nn.Module):
 
         self.final_dense = nn.Linear(hidden_dim * 4, hidden_dim)
 
+        # Cache of instruction embeddings used at inference
+        self.embedding_cache = None
+        self.use_embedding_cache = False
+
+    def enable_embedding_cache(self, max_size=InstructionEmbeddingCache.DEFAULT_MAX_SIZE):
+        """ Reuse instruction embeddings until disable_embedding_cache is called. The module must not be
+        trained in between. """
+        if self.embedding_cache is None:
+            self.embedding_cache = InstructionEmbeddingCache(max_size)
+        self.embedding_cache.set_version(self)
+        self.use_embedding_cache = True
+
+    def disable_embedding_cache(self):
+        self.use_embedding_cache = False
+
+    def pre_encode(self, token_lists, batch_size=32):
+        """ Embeds the instructions in batches and caches their embeddings """
+        assert self.use_embedding_cache, "Embedding cache is not enabled"
+        self.embedding_cache.pre_encode(self.encode, token_lists, batch_size)
+
     def forward(self, instructions_batch):
+        if self.use_embedding_cache:
+            return self.embedding_cache.encode(self.encode, instructions_batch)
+        return self.encode(instructions_batch)
+
+    def encode(self, instructions_batch):
         token_lists, text_pointers = instructions_batch
         batch_size = len(token_lists)
         text_lengths = np.array([len(tokens) for tokens in token_lists])
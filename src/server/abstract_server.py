@@ -1,29 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
 class AbstractServer:
+    """ Interface to a simulator. Every step has a blocking version that returns the feedback and a
+    non-blocking version that only issues the request. Feedback of a non-blocking request is received
+    using receive_feedback (blocking) or receive_feedback_nonblocking (returns None if the feedback has
+    not arrived yet) and similarly for reset. This lets a learner overlap the simulator latency with
+    model computation, e.g., resetting the simulator for the next data point while the update is performed.
+
+    The default non-blocking implementation runs the blocking call on a single background thread.
+    Only one request can be outstanding at a time and the server should not be used in any other
+    way until its feedback has been received. """
 
     def __init__(self, config, action_space):
         self.config = config
         self.action_space = action_space
+        self._executor = None
+        self._pending_feedback = None
 
-    def receive_feedback_nonblocking(self):
-        raise NotImplementedError()
+    def _submit(self, fn, *args):
+        assert self._pending_feedback is None, "Received a request before feedback of the previous request"
+        if self._executor is None:
+            # Created lazily so that servers can be sent to other processes before use
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_feedback = self._executor.submit(fn, *args)
+        return self._pending_feedback
+
+    def _receive_pending(self, block):
+        assert self._pending_feedback is not None, "No request has been sent"
+        if not block and not self._pending_feedback.done():
+            return None
+        feedback = self._pending_feedback.result()
+        self._pending_feedback = None
+        return feedback
 
     def send_action_receive_feedback(self, action):
         raise NotImplementedError()
 
     def send_action_nonblocking(self, action):
-        raise NotImplementedError()
+        """ Issues the action and returns a future of the feedback (image, reward, metadata) """
+        return self._submit(self.send_action_receive_feedback, action)
 
     def halt_and_receive_feedback(self):
         raise NotImplementedError()
 
     def halt_nonblocking(self):
-        raise NotImplementedError()
+        """ Issues the stop action and returns a future of the feedback (image, reward, metadata) """
+        return self._submit(self.halt_and_receive_feedback)
 
     def reset_receive_feedback(self, next_data_point):
         raise NotImplementedError()
 
     def reset_nonblocking(self, next_data_point):
-        raise NotImplementedError()
+        """ Issues a reset and returns a future of the feedback (image, metadata) """
+        return self._submit(self.reset_receive_feedback, next_data_point)
+
+    def receive_feedback(self):
+        """ Waits for and returns the feedback of the last non-blocking action or halt """
+        return self._receive_pending(block=True)
+
+    def receive_feedback_nonblocking(self):
+        """ Returns the feedback of the last non-blocking action or halt, or None if it has not arrived """
+        return self._receive_pending(block=False)
+
+    def receive_reset_feedback(self):
+        """ Waits for and returns the feedback of the last non-blocking reset """
+        return self._receive_pending(block=True)
+
+    def receive_reset_feedback_nonblocking(self):
+        """ Returns the feedback of the last non-blocking reset, or None if it has not arrived """
+        return self._receive_pending(block=False)
 
     def clear_metadata(self):
         raise NotImplementedError()
@@ -0,0 +1,116 @@
+import struct
+
+
+""" Length-prefixed framing used between the python servers and the simulators.
+
+Every message in either direction is a frame: a 4 byte little-endian unsigned header giving the
+length of the payload followed by the payload itself. Image frames carry the raw image bytes and
+metadata frames carry a packed binary struct (see the individual servers for the layout). """
+
+FRAME_HEADER = struct.Struct("<I")
+
+
+class BufferedSocketReader:
+    """ Reads from a socket into a single growing buffer. Data is consumed exactly, so two messages
+    received by one recv call are never merged and a message split across several recv calls is never
+    returned partially. """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = bytearray(BufferedSocketReader.CHUNK_SIZE)
+        self.start = 0
+        self.end = 0
+
+    def _fill(self, num_bytes):
+        """ Ensure that at least num_bytes unread bytes are in the buffer """
+
+        if self.end - self.start >= num_bytes:
+            return
+
+        # Move unread bytes to the front and grow the buffer if needed
+        unread = self.end - self.start
+        if self.start > 0:
+            self.buffer[:unread] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, unread
+        required = max(num_bytes, unread + BufferedSocketReader.CHUNK_SIZE)
+        if len(self.buffer) < required:
+            self.buffer.extend(bytearray(required - len(self.buffer)))
+
+        with memoryview(self.buffer) as view:
+            while self.end - self.start < num_bytes:
+                nbytes = self.connection.recv_into(view[self.end:], len(self.buffer) - self.end)
+                if nbytes == 0:
+                    raise ConnectionError("Socket closed by the simulator")
+                self.end += nbytes
+
+    def read_exact(self, num_bytes):
+        """ Returns the next num_bytes as a bytes object """
+
+        self._fill(num_bytes)
+        data = bytes(self.buffer[self.start: self.start + num_bytes])
+        self.start += num_bytes
+        if self.start == self.end:
+            self.start, self.end = 0, 0
+        return data
+
+    def read_exact_into(self, out_view):
+        """ Reads exactly len(out_view) bytes into the given writable buffer """
+
+        num_bytes = len(out_view)
+        buffered = min(num_bytes, self.end - self.start)
+        if buffered > 0:
+            out_view[:buffered] = self.buffer[self.start: self.start + buffered]
+            self.start += buffered
+            if self.start == self.end:
+                self.start, self.end = 0, 0
+        out_view = out_view[buffered:]
+        while len(out_view) > 0:
+            nbytes = self.connection.recv_into(out_view, len(out_view))
+            if nbytes == 0:
+                raise ConnectionError("Socket closed by the simulator")
+            out_view = out_view[nbytes:]
+
+    def read_frame(self):
+        """ Reads a complete frame and returns its payload """
+        payload_size, = FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+        return self.read_exact(payload_size)
+
+    def read_frame_into(self, out_view):
+        """ Reads a complete frame whose payload must be exactly the size of out_view """
+        payload_size, = FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+        if payload_size != len(out_view):
+            raise AssertionError("Expected a frame of %d bytes, found %d" % (len(out_view), payload_size))
+        self.read_exact_into(out_view)
+
+    def read_available(self, max_bytes):
+        """ Returns buffered bytes if there are any, else the result of a single recv call. Used
+        for the legacy unframed protocol. """
+
+        if self.end > self.start:
+            num_bytes = min(max_bytes, self.end - self.start)
+            data = bytes(self.buffer[self.start: self.start + num_bytes])
+            self.start += num_bytes
+            if self.start == self.end:
+                self.start, self.end = 0, 0
+            return data
+        return self.connection.recv(max_bytes)
+
+
+def send_frame(connection, payload):
+    """ Sends a frame with the given payload (bytes-like) """
+    connection.sendall(FRAME_HEADER.pack(len(payload)) + bytes(payload))
+
+
+def pack_string(value):
+    """ Pack a string as a 2 byte length followed by utf-8 bytes """
+    encoded = value.encode("utf-8")
+    return struct.pack("<H", len(encoded)) + encoded
+
+
+def unpack_string(data, offset):
+    """ Unpack a string packed using pack_string. Returns the string and the offset after it. """
+    length, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    return bytes(data[offset: offset + length]).decode("utf-8"), offset + length
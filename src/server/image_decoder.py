@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class ImageDecoder:
+    """ Decodes raw image frames sent by a Unity simulator into channel first numpy arrays.
+
+    Two wire formats are supported:
+        float32_rgba: the legacy format with 4 float32 values per pixel.
+        uint8_rgb: 3 bytes per pixel which is over 5x smaller than float32_rgba.
+
+    Frames are received into a single preallocated buffer and the alpha removal, orientation and
+    channel first transpose are all applied as views, so that decoding makes exactly one copy.
+    uint8 frames are normalized to [0, 1] in the same pass unless normalize is False, in which
+    case the uint8 image is returned and the model must normalize it on the device by setting its
+    normalize_image attribute (see utils.cuda.cuda_image_var). """
+
+    FLOAT32_RGBA, UINT8_RGB = "float32_rgba", "uint8_rgb"
+
+    def __init__(self, row, col, image_format=FLOAT32_RGBA, flip_rows=False, normalize=True):
+        if image_format == ImageDecoder.FLOAT32_RGBA:
+            self.dtype, self.channel = np.float32, 4
+        elif image_format == ImageDecoder.UINT8_RGB:
+            self.dtype, self.channel = np.uint8, 3
+        else:
+            raise AssertionError("Unknown image format " + str(image_format))
+
+        self.row = row
+        self.col = col
+        self.image_format = image_format
+        self.flip_rows = flip_rows
+        self.normalize = normalize
+        self.num_bytes = row * col * self.channel * np.dtype(self.dtype).itemsize
+        self.buffer = bytearray(self.num_bytes)
+
+    def decode(self):
+        """ Decode the frame currently in self.buffer into a new (3, row, col) array """
+
+        img = np.frombuffer(self.buffer, dtype=self.dtype).reshape((self.row, self.col, self.channel))
+
+        # Remove alpha channel, fix orientation and move channel first. These are all views.
+        img = img[:, :, :3]
+        if self.flip_rows:
+            img = img[::-1]
+        img = img.transpose(2, 0, 1)
+
+        if self.dtype == np.uint8 and self.normalize:
+            out = np.empty(img.shape, dtype=np.float32)
+            np.multiply(img, np.float32(1.0 / 255.0), out=out)
+            return out
+
+        return np.ascontiguousarray(img)
+
+    def decode_cameras(self, byte_str, out=None):
+        """ Decode a frame of one or more cameras, such as the 6 camera panorama of the nav drone simulator,
+        directly from byte_str into a new (3 * num_cameras, row, col) array whose channels 3i to 3i + 2 are the
+        RGB channels of camera i, or into the float32 array out if given. Values are little endian as sent
+        by Unity. """
+
+        assert len(byte_str) % self.num_bytes == 0, "incorrect image bytes"
+        num_cameras = len(byte_str) // self.num_bytes
+
+        dtype = np.dtype(self.dtype).newbyteorder("<")
+        img = np.frombuffer(byte_str, dtype=dtype).reshape((num_cameras, self.row, self.col, self.channel))
+
+        # Remove alpha channel, fix orientation and move channel first. These are all views.
+        img = img[:, :, :, :3]
+        if self.flip_rows:
+            img = img[:, ::-1]
+        img = img.transpose(0, 3, 1, 2)
+
+        if out is None:
+            out = np.empty((num_cameras * 3, self.row, self.col), dtype=np.float32)
+        assert out.shape == (num_cameras * 3, self.row, self.col), "incorrect output shape"
+        if self.dtype == np.uint8 and self.normalize:
+            np.multiply(img, np.float32(1.0 / 255.0), out=out.reshape(img.shape))
+        else:
+            out.reshape(img.shape)[:] = img
+        return out
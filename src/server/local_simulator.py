@@ -0,0 +1,139 @@
+import time
+import socket
+import threading
+import numpy as np
+
+from server.framed_protocol import BufferedSocketReader, send_frame, pack_string
+from server.image_decoder import ImageDecoder
+from server_house.house_server import HOUSE_METADATA_STRUCT
+
+
+class LocalSimulator:
+    """ Stand-in for a Unity simulator that connects to a python server and answers every request
+    with a random image and dummy metadata. It speaks both the framed and the legacy protocol and is
+    useful for profiling the server, the socket layer and the learners without a Unity build.
+
+    Usage:
+        simulator = LocalHouseSimulator(port, image_height, image_width, framed=True)
+        simulator.start()
+        server = HouseServer(config, action_space, port, framed_protocol=True)
+    """
+
+    BUFFER_SIZE = 1024
+
+    def __init__(self, port, image_height, image_width, framed=False, ip_address="localhost", seed=0):
+        self.port = port
+        self.ip_address = ip_address
+        self.image_height = image_height
+        self.image_width = image_width
+        self.framed = framed
+        self.image_format = ImageDecoder.FLOAT32_RGBA
+        self.rng = np.random.RandomState(seed)
+        self.connection = None
+        self.reader = None
+        self.thread = None
+        self.num_steps = 0
+
+    def start(self):
+        """ Connect and serve requests in a daemon thread """
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        self._connect()
+        try:
+            while True:
+                request = self._receive_request()
+                if request is None:
+                    break
+                if request.lower().startswith("image-format "):
+                    self.image_format = request.split()[1]
+                    continue
+                self.num_steps += 1
+                self._send(self._image_bytes())
+                self._send(self.respond(request))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.connection.close()
+
+    def respond(self, request):
+        """ Returns the metadata message (bytes) in response to the given request (str) """
+        raise NotImplementedError()
+
+    def _connect(self, num_retries=100):
+        # The python server may not be listening yet
+        for _ in range(0, num_retries):
+            try:
+                self.connection = socket.create_connection((self.ip_address, self.port))
+                self.reader = BufferedSocketReader(self.connection)
+                return
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        raise ConnectionError("Could not connect to the server at port " + str(self.port))
+
+    def _receive_request(self):
+        if self.framed:
+            data = self.reader.read_frame()
+        else:
+            data = self.reader.read_available(LocalSimulator.BUFFER_SIZE)
+        if len(data) == 0:
+            return None
+        return data.decode("utf-8")
+
+    def _send(self, payload):
+        if self.framed:
+            send_frame(self.connection, payload)
+        else:
+            self.connection.sendall(payload)
+
+    def _image_bytes(self):
+        if self.image_format == ImageDecoder.UINT8_RGB:
+            image = self.rng.randint(0, 256, (self.image_height, self.image_width, 3)).astype(np.uint8)
+        else:
+            image = self.rng.rand(self.image_height, self.image_width, 4).astype(np.float32)
+        return image.tobytes()
+
+
+class LocalHouseSimulator(LocalSimulator):
+    """ Stand-in for the house simulator """
+
+    def respond(self, request):
+        reward = float(self.rng.rand())
+        position = self.rng.rand(3).astype(np.float32)
+        angles = self.rng.rand(3).astype(np.float32)
+        goal_screen = self.rng.rand(3).astype(np.float32)
+        navigation_error, distance_to_next_goal = self.rng.rand(2) * 10.0
+        if self.framed:
+            metadata = HOUSE_METADATA_STRUCT.pack(reward, *(list(position) + list(angles) + [0, 0.0, 0.0, 0.0, 1] +
+                                                            list(goal_screen) + [navigation_error,
+                                                                                 distance_to_next_goal, 0.0]))
+            return metadata + pack_string("scene1") + pack_string("success") + pack_string("navigation")
+
+        vector = lambda v: "(%f, %f, %f)" % tuple(v)
+        message = "Unity Manager: %f#scene1#success#%s#%s#none#%s#%f#%f#navigation#0.0" % (
+            reward, vector(position), vector(angles), vector(goal_screen), navigation_error, distance_to_next_goal)
+        return message.encode("utf-8")
+
+
+class LocalBlocksSimulator(LocalSimulator):
+    """ Stand-in for the blocks simulator """
+
+    DELIMITER = "<EOF>"
+
+    def _receive_request(self):
+        request = LocalSimulator._receive_request(self)
+        if request is not None and not self.framed:
+            request = request.replace(LocalBlocksSimulator.DELIMITER, "")
+        return request
+
+    def respond(self, request):
+        reward = float(self.rng.rand())
+        if request.lower().startswith("ok-reset"):
+            message = "Ok#%f#file#move the block to the left#1,2,3," % (10.0 * self.rng.rand())
+        else:
+            message = "Ok#%f#file#none" % reward
+        if self.framed:
+            return message.encode("utf-8")
+        return ("Unity Manager: " + message).encode("utf-8")
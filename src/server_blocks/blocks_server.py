@@ -1,17 +1,17 @@
-import nltk
-
 from server.abstract_server import AbstractServer
 from server_blocks.message_protocol_util import MessageProtocolUtil
 from server_blocks.reliable_connect import ReliableConnect
+from server.image_decoder import ImageDecoder
 
 
 class BlocksServer(AbstractServer):
 
-    def __init__(self, config, action_space, vocab=None):
+    def __init__(self, config, action_space, vocab=None, framed_protocol=False,
+                 image_format=ImageDecoder.FLOAT32_RGBA, normalize_image=True):
         AbstractServer.__init__(self, config, action_space)
         self.config = config
         self.action_space = action_space
-        self.vocab = vocab
+        self.vocab = vocab  # Vocabulary used to tokenize instructions received on reset
 
         # Connect to simulator
         self.unity_ip = "0.0.0.0"
@@ -21,7 +21,9 @@ class BlocksServer(AbstractServer):
         # Size of image
         image_height = config["image_height"]
         image_width = config["image_width"]
-        self.connection = ReliableConnect(self.unity_ip, self.PORT, image_height, image_width)
+        self.connection = ReliableConnect(self.unity_ip, self.PORT, image_height, image_width,
+                                          framed=framed_protocol, image_format=image_format,
+                                          normalize_image=normalize_image)
         self.connection.connect()
 
         # Dataset specific parameters
@@ -38,26 +40,7 @@ class BlocksServer(AbstractServer):
 
     def initialize_server(self):
         self.connection.initialize_server()
-
-    @staticmethod
-    def convert_text_to_indices(text, vocab, ignore_case=True):
-
-        # Tokenize the text
-        token_seq = nltk.word_tokenize(text)
-
-        indices = []
-
-        for token in token_seq:
-            if ignore_case:
-                ltoken = token.lower()
-            else:
-                ltoken = token
-            if ltoken in vocab:
-                indices.append(vocab[ltoken])
-            else:
-                indices.append(vocab["$UNK$"])
-
-        return indices
+        self.connection.request_image_format()
 
     def reset_receive_feedback(self, next_data_point):
 
@@ -71,7 +54,7 @@ class BlocksServer(AbstractServer):
             self.message_protocol_kit.decode_reset_message(response)
 
         # TODO this preprocessing is probably not the right place to send this data
-        instruction = self.convert_text_to_indices(instruction_string, self.vocab)
+        instruction = self.vocab.tokenize(instruction_string, lower=True)
 
         metadata = {"metric": bisk_metric, "status_code": status_code,
                     "instruction": instruction, "instruction_string": instruction_string, "trajectory": trajectory}
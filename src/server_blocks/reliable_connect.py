@@ -1,25 +1,34 @@
 import socket
-import numpy as np
 import scipy.misc
 
+from server.framed_protocol import BufferedSocketReader, send_frame
+from server.image_decoder import ImageDecoder
+
 
 class ReliableConnect:
+    """ Socket connection with the blocks simulator. When framed is True every message and image is sent
+    as a length-prefixed frame (see server.framed_protocol) and the simulator must use the same protocol.
+    Otherwise the legacy <EOF> delimited protocol is used. Images are sent in the given image_format
+    (see server.image_decoder). """
+
     DELIMITER = "<EOF>"
     BUFFER_SIZE = 1024
     ip_address = None
     port = None
     socket = None
 
-    def __init__(self, ip_address, port, image_height, image_width):
+    def __init__(self, ip_address, port, image_height, image_width, framed=False,
+                 image_format=ImageDecoder.FLOAT32_RGBA, normalize_image=True):
         self.ip_address = ip_address
         self.port = port
         self.socket = None
         self.row = image_height
         self.col = image_width
-        self.channel = 4
         self.id = 0
         self.connection = None
-        self.total_bytes = self.row * self.col * self.channel * 4
+        self.reader = None
+        self.framed = framed
+        self.image_decoder = ImageDecoder(image_height, image_width, image_format, normalize=normalize_image)
 
     def connect(self):
         # create an INET, STREAMing socket
@@ -38,49 +47,56 @@ class ReliableConnect:
 
     def initialize_server(self):
         self.connection, addr = self.socket.accept()
+        self.reader = BufferedSocketReader(self.connection)
 
     def receive_image(self, save=False):
         """ Receives image over socket of size (ROW, COL, CHANNEL) """
 
-        toread = self.total_bytes
-        buf = bytearray(toread)
-        view = memoryview(buf)
-
         self.id += 1
 
-        while toread:
-            nbytes = self.connection.recv_into(view, toread)
-            view = view[nbytes:]  # slicing views is cheap
-            toread -= nbytes
-        img = np.frombuffer(buf, dtype='f4').reshape(
-            (self.row, self.col, self.channel))
+        with memoryview(self.image_decoder.buffer) as view:
+            if self.framed:
+                self.reader.read_frame_into(view)
+            else:
+                self.reader.read_exact_into(view)
+        img = self.image_decoder.decode()
 
-        # Remove alpha channel
-        img = img[:, :, :3]
         if save:
-            scipy.misc.imsave('./images/img' + str(self.id) + ".jpg", img)
-        img = img.swapaxes(1, 2).swapaxes(0, 1)  # channel should be first for pytorch
+            scipy.misc.imsave('./images/img' + str(self.id) + ".jpg", img.transpose(1, 2, 0))
 
         return img
 
+    def request_image_format(self):
+        """ Ask the simulator to send images in the format of the image decoder. Nothing is sent
+        for the default format so that older simulator builds keep working. """
+        if self.image_decoder.image_format != ImageDecoder.FLOAT32_RGBA:
+            self.send_message("Image-Format " + self.image_decoder.image_format)
+
     def send_message(self, message):
         if self.connection is None:
             raise Exception("Socket is not initialized. Please connect before use")
 
-        self.connection.send((message + ReliableConnect.DELIMITER).encode())
+        if self.framed:
+            send_frame(self.connection, message.encode())
+        else:
+            self.connection.send((message + ReliableConnect.DELIMITER).encode())
 
     def receive_message(self):
-        data = self.connection.recv(ReliableConnect.BUFFER_SIZE)
+        if self.framed:
+            return self.reader.read_frame().decode("utf-8")
+
+        data = self.reader.read_available(ReliableConnect.BUFFER_SIZE)
         data = str(data)
         data = data[len("Unity Manager: ") + 2:]
         return data
 
     def send_and_receive_message(self, message):
-        self.send_and_receive_message(message)
+        self.send_message(message)
         return self.receive_message()
 
     def close(self):
         self.connection.close()
         self.socket.close()
         self.connection = None
+        self.reader = None
         self.socket = None
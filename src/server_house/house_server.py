@@ -1,18 +1,30 @@
+import struct
 import numpy as np
 import scipy.misc
 
 from .reliable_connect import ReliableConnect
 from server.abstract_server import AbstractServer
+from server.framed_protocol import unpack_string
+from server.image_decoder import ImageDecoder
+
+# Binary metadata sent by the simulator when using the framed protocol. Layout is: reward, bot-position (3),
+# bot-angles (3), has-tracking, tracking (3), has-goal-screen, goal-screen (3), distance-to-final-goal,
+# distance-to-next-goal and manipulation accuracy. This is followed by the scene-name, action-execution
+# and goal-type strings (see server.framed_protocol.pack_string).
+HOUSE_METADATA_STRUCT = struct.Struct("<f3f3fB3fB3ffff")
 
 
 class HouseServer(AbstractServer):
 
-    def __init__(self, config, action_space, port):
+    def __init__(self, config, action_space, port, framed_protocol=False,
+                 image_format=ImageDecoder.FLOAT32_RGBA, normalize_image=True):
         # Connect to simulator
         self.unity_ip = "0.0.0.0"
+        self.framed_protocol = framed_protocol
 
         self.connection = ReliableConnect(
-            self.unity_ip, port, image_row=config["image_height"], image_col=config["image_width"])
+            self.unity_ip, port, image_row=config["image_height"], image_col=config["image_width"],
+            framed=framed_protocol, image_format=image_format, normalize_image=normalize_image)
 
         # Meta data related information
         self.sum_navigation_error = 0
@@ -23,27 +35,68 @@ class HouseServer(AbstractServer):
 
     def connect(self):
         self.connection.connect()
+        self.connection.request_image_format()
 
     def initialize_server(self):
         self.connect()
 
-    def send_action_receive_feedback(self, action):
-        action_string = self.action_space.get_action_name(action)
-        self.connection.send_message(HouseServer.to_byte_arr(action_string))
+    def _receive_feedback(self):
+        """ Receives image and metadata from the simulator. Returns the image and the list of metadata
+        values: reward, scene-name, action-execution, bot-position, bot-angles, track-position,
+        next-goal-screen, distance-to-final-goal, distance-to-next-goal, goal-type and manipulation accuracy.
+        Both protocols give the same types: vectors are lists of 3 floats (or None for a missing track-position
+        or next-goal-screen) and strings are lower case. """
+
         image = self.connection.receive_image()
-        message = self.connection.receive_message().lower()
+        message = self.connection.receive_message()
+
+        if self.framed_protocol:
+            return image, self._decode_binary_metadata(message)
+
+        message = message.lower()
         message = message.decode("utf-8")   # Python 2--> Python 3, P3 notices diff between byte string and str
         words = message[len("unity manager: "):].split("#")
+        values = [float(words[0]), words[1], words[2], self._read_vector_(words[3]), self._read_vector_(words[4]),
+                  self._read_vector_(words[5]), self._read_vector_(words[6]), float(words[7]), float(words[8]),
+                  words[9], float(words[10])]
+
+        return image, values
+
+    @staticmethod
+    def _decode_binary_metadata(message):
+
+        fields = HOUSE_METADATA_STRUCT.unpack_from(message, 0)
+        reward = fields[0]
+        bot_position, bot_angles = list(fields[1:4]), list(fields[4:7])
+        tracking = list(fields[8:11]) if fields[7] else None
+        goal_screen = list(fields[12:15]) if fields[11] else None
+        navigation_error, distance_to_next_goal, manipulation_accuracy = fields[15:18]
+
+        offset = HOUSE_METADATA_STRUCT.size
+        scene_name, offset = unpack_string(message, offset)
+        action_success, offset = unpack_string(message, offset)
+        goal_type, offset = unpack_string(message, offset)
+
+        # The legacy protocol lower cases the whole message
+        scene_name, action_success, goal_type = scene_name.lower(), action_success.lower(), goal_type.lower()
+
+        return [reward, scene_name, action_success, bot_position, bot_angles, tracking, goal_screen,
+                navigation_error, distance_to_next_goal, goal_type, manipulation_accuracy]
+
+    def send_action_receive_feedback(self, action):
+        action_string = self.action_space.get_action_name(action)
+        self.connection.send_message(HouseServer.to_byte_arr(action_string))
+        image, words = self._receive_feedback()
 
         # Message format is: reward, scene-name, action-execution, bot-position, bot-angles,
         # track-position, next-goal-screen, distance-to-final-goal, distance-to-next-goal,
         # goal-type and manipulation accuracy.
-        reward = float(words[0])
+        reward = words[0]
         meta_data = {"type": "action-" + str(action), "scene-name": words[1], "action-success": words[2],
-                     "bot-position": words[3], "bot-angles": words[4], "tracking": self._read_vector_(words[5]),
-                     "goal-screen": self._read_vector_(words[6]), "navigation-error": float(words[7]),
-                     "distance-to-next-goal": float(words[8]), "goal-type": words[9],
-                     "manipulation-accuracy": float(words[10])}
+                     "bot-position": words[3], "bot-angles": words[4], "tracking": words[5],
+                     "goal-screen": words[6], "navigation-error": words[7],
+                     "distance-to-next-goal": words[8], "goal-type": words[9],
+                     "manipulation-accuracy": words[10]}
 
         return image, reward, meta_data
 
@@ -51,17 +104,14 @@ class HouseServer(AbstractServer):
         stop_action = self.action_space.get_stop_action_index()
         action_string = self.action_space.get_action_name(stop_action)
         self.connection.send_message(HouseServer.to_byte_arr(action_string))
-        image = self.connection.receive_image()
-        message = self.connection.receive_message().lower()
-        message = message.decode("utf-8")  # Python 2--> Python 3, P3 notices diff between byte string and str
-        words = message[len("unity manager: "):].split("#")
+        image, words = self._receive_feedback()
 
         # Message format is: reward, scene-name, action-execution, bot-position, bot-angles,
         # track-position, next-goal-screen, distance-to-final-goal, distance-to-next-goal,
         # goal-type and manipulation accuracy.
-        reward = float(words[0])
-        navigation_error = float(words[7])
-        manipulation_accuracy = float(words[10]) * 100.0  # convert to percentage
+        reward = words[0]
+        navigation_error = words[7]
+        manipulation_accuracy = words[10] * 100.0  # convert to percentage
 
         self.sum_navigation_error += navigation_error
         self.sum_manipulation_accuracy += manipulation_accuracy
@@ -70,9 +120,9 @@ class HouseServer(AbstractServer):
         mean_manipulation_accuracy = self.sum_manipulation_accuracy / float(self.num_examples_seen)
 
         meta_data = {"type": "action-" + str(stop_action), "scene-name": words[1], "action-success": words[2],
-                     "bot-position": words[3], "bot-angles": words[4], "tracking": self._read_vector_(words[5]),
-                     "goal-screen": self._read_vector_(words[6]), "distance-to-final-goal": float(words[7]),
-                     "distance-to-next-goal": float(words[8]), "goal-type": words[9],
+                     "bot-position": words[3], "bot-angles": words[4], "tracking": words[5],
+                     "goal-screen": words[6], "distance-to-final-goal": words[7],
+                     "distance-to-next-goal": words[8], "goal-type": words[9],
                      "manipulation-accuracy": manipulation_accuracy, "navigation-error": navigation_error,
                      "mean-navigation-error": mean_navigation_error,
                      "mean-manipulation-accuracy": mean_manipulation_accuracy}
@@ -81,19 +131,16 @@ class HouseServer(AbstractServer):
 
     def reset_receive_feedback(self, next_datapoint):
         self.connection.send_message(HouseServer.to_byte_arr("ok-reset " + str(next_datapoint.get_id())))
-        image = self.connection.receive_image()
-        message = self.connection.receive_message().lower()
-        message = message.decode("utf-8")  # Python 2--> Python 3, P3 notices diff between byte string and str
-        words = message[len("unity manager: "):].split("#")
+        image, words = self._receive_feedback()
 
         # Message format is: reward, scene-name, action-execution, bot-position, bot-angles,
         # track-position, next-goal-screen, distance-to-final-goal, distance-to-next-goal,
         # goal-type and manipulation accuracy.
         meta_data = {"type": "reset", "scene-name": words[1], "action-success": words[2], "bot-position": words[3],
-                     "bot-angles": words[4], "tracking": self._read_vector_(words[5]),
-                     "goal-screen": self._read_vector_(words[6]), "navigation-error": float(words[7]),
-                     "distance-to-next-goal": float(words[8]), "goal-type": words[9],
-                     "manipulation-accuracy": float(words[10])}
+                     "bot-angles": words[4], "tracking": words[5],
+                     "goal-screen": words[6], "navigation-error": words[7],
+                     "distance-to-next-goal": words[8], "goal-type": words[9],
+                     "manipulation-accuracy": words[10]}
 
         return image, meta_data
 
@@ -1,11 +1,16 @@
 import socket
 import logging
-import numpy as np
 import scipy.misc
 
+from server.framed_protocol import BufferedSocketReader, send_frame
+from server.image_decoder import ImageDecoder
+
 
 class ReliableConnect:
-    """ A simple class for one to one socket communication """
+    """ A simple class for one to one socket communication. If framed is True then every message in
+    either direction is length-prefixed (see server.framed_protocol), otherwise the legacy protocol
+    of raw images and unframed text messages is used. Images are sent in the given image_format
+    (see server.image_decoder). """
 
     DELIMITER = "<EOF>"
     BUFFER_SIZE = 1024
@@ -14,16 +19,20 @@ class ReliableConnect:
     socket = None
     connection = None
 
-    def __init__(self, ip_address, port, image_row, image_col):
+    def __init__(self, ip_address, port, image_row, image_col, framed=False,
+                 image_format=ImageDecoder.FLOAT32_RGBA, normalize_image=True):
         self.ip_address = ip_address
         self.port = port
         self.socket = None
         self.connection = None
+        self.reader = None
+        self.framed = framed
         self.row = image_row
         self.col = image_col
-        self.channel = 4
         self.id = 0
-        self.total_bytes = self.row * self.col * self.channel * 4
+        # Unity renders upside down, fliplr(rot90(img, k=2)) is the same as flipping the rows
+        self.image_decoder = ImageDecoder(image_row, image_col, image_format, flip_rows=True,
+                                          normalize=normalize_image)
 
     def connect(self):
         # create an INET, STREAMing socket
@@ -41,48 +50,50 @@ class ReliableConnect:
 
         # wait to accept a connection - blocking call
         self.connection, addr = self.socket.accept()
+        self.reader = BufferedSocketReader(self.connection)
         logging.info('Connected with %r : %r', addr[0], addr[1])
 
     def send_message(self, message):
         if self.connection is None:
             raise Exception("Socket is not initialized. Please connect before use")
 
-        self.connection.send(message)
+        if self.framed:
+            send_frame(self.connection, message)
+        else:
+            self.connection.send(message)
 
     def close(self):
         self.connection.close()
         self.socket.close()
         self.connection = None
+        self.reader = None
         self.socket = None
 
     def receive_message(self):
-        data = self.connection.recv(ReliableConnect.BUFFER_SIZE)
-        return data
+        if self.framed:
+            return self.reader.read_frame()
+        return self.reader.read_available(ReliableConnect.BUFFER_SIZE)
 
     def receive_image(self):
         """ Receives image over socket of size (ROW, COL, CHANNEL) """
 
-        toread = self.total_bytes
-        buf = bytearray(toread)
-        view = memoryview(buf)
-        
         self.id += 1
 
-        while toread:
-            nbytes = self.connection.recv_into(view, toread)
-            view = view[nbytes:]  # slicing views is cheap
-            toread -= nbytes
-        img = np.frombuffer(buf, dtype='f4').reshape((self.row, self.col, self.channel))
-
-        # Remove alpha channel
-        img = img[:, :, :3]
-        img = np.fliplr(np.rot90(img, k=2))
+        with memoryview(self.image_decoder.buffer) as view:
+            if self.framed:
+                self.reader.read_frame_into(view)
+            else:
+                self.reader.read_exact_into(view)
 
         # scipy.misc.imsave('./attention_prob/received_image_' + str(self.id) + ".jpg", img)
 
-        img = img.swapaxes(1, 2).swapaxes(0, 1)
+        return self.image_decoder.decode()
 
-        return img
+    def request_image_format(self):
+        """ Ask the simulator to send images in the format of the image decoder. Nothing is sent
+        for the default format so that older simulator builds keep working. """
+        if self.image_decoder.image_format != ImageDecoder.FLOAT32_RGBA:
+            self.send_message(bytearray(("image-format " + self.image_decoder.image_format).encode()))
 
     def send_and_receive_message(self, message):
         self.send_message(message)
@@ -0,0 +1,105 @@
+import socket
+import unittest
+import numpy as np
+
+from server.image_decoder import ImageDecoder
+from server.local_simulator import LocalHouseSimulator
+from server_house.house_server import HouseServer
+
+
+class ActionSpace:
+    ACTION_NAMES = ["forward", "turnleft", "turnright", "stop"]
+
+    def get_action_name(self, action):
+        return ActionSpace.ACTION_NAMES[action]
+
+    def get_stop_action_index(self):
+        return len(ActionSpace.ACTION_NAMES) - 1
+
+
+class DataPoint:
+    def get_id(self):
+        return 0
+
+
+def get_free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("localhost", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class TestHouseServer(unittest.TestCase):
+    """ Runs a HouseServer against the LocalHouseSimulator with the framed and the legacy protocol. Both
+    protocols must give images of the same shape and metadata of the same types and values. """
+
+    CONFIG = {"image_height": 16, "image_width": 24}
+    VECTOR_KEYS = ["bot-position", "bot-angles", "goal-screen"]
+    STRING_KEYS = ["scene-name", "action-success", "goal-type"]
+
+    def run_episode(self, framed, image_format=ImageDecoder.FLOAT32_RGBA):
+        port = get_free_port()
+        simulator = LocalHouseSimulator(port, TestHouseServer.CONFIG["image_height"],
+                                        TestHouseServer.CONFIG["image_width"], framed=framed, seed=0)
+        simulator.start()
+        server = HouseServer(TestHouseServer.CONFIG, ActionSpace(), port, framed_protocol=framed,
+                             image_format=image_format)
+        server.initialize_server()
+        try:
+            feedback = [server.reset_receive_feedback(DataPoint())]
+            for action in [0, 1, 2]:
+                image, _, metadata = server.send_action_receive_feedback(action)
+                feedback.append((image, metadata))
+            image, _, metadata = server.halt_and_receive_feedback()
+            feedback.append((image, metadata))
+        finally:
+            server.kill()
+        return feedback
+
+    def check_feedback(self, feedback):
+        for image, metadata in feedback:
+            self.assertEqual(image.shape, (3, TestHouseServer.CONFIG["image_height"],
+                                           TestHouseServer.CONFIG["image_width"]))
+            for key in TestHouseServer.VECTOR_KEYS:
+                self.assertIsInstance(metadata[key], list, key)
+                self.assertEqual(len(metadata[key]), 3, key)
+                for value in metadata[key]:
+                    self.assertIsInstance(value, float, key)
+            self.assertIsNone(metadata["tracking"])
+            for key in TestHouseServer.STRING_KEYS:
+                self.assertIsInstance(metadata[key], str, key)
+                self.assertEqual(metadata[key], metadata[key].lower(), key)
+            self.assertIsInstance(metadata["navigation-error"], float)
+
+    def test_framed_protocol(self):
+        self.check_feedback(self.run_episode(framed=True))
+
+    def test_legacy_protocol(self):
+        self.check_feedback(self.run_episode(framed=False))
+
+    def test_uint8_images(self):
+        for framed in [True, False]:
+            feedback = self.run_episode(framed=framed, image_format=ImageDecoder.UINT8_RGB)
+            self.check_feedback(feedback)
+            for image, _ in feedback:
+                self.assertEqual(image.dtype, np.float32)
+                self.assertTrue(0.0 <= image.min() and image.max() <= 1.0)
+
+    def test_same_metadata(self):
+        framed_feedback = self.run_episode(framed=True)
+        legacy_feedback = self.run_episode(framed=False)
+        for (_, framed_metadata), (_, legacy_metadata) in zip(framed_feedback, legacy_feedback):
+            self.assertEqual(sorted(framed_metadata.keys()), sorted(legacy_metadata.keys()))
+            for key, framed_value in framed_metadata.items():
+                legacy_value = legacy_metadata[key]
+                self.assertEqual(type(framed_value), type(legacy_value), key)
+                if isinstance(framed_value, (float, list)):
+                    # The legacy protocol sends floats with 6 decimals
+                    np.testing.assert_allclose(framed_value, legacy_value, atol=1e-5, err_msg=key)
+                else:
+                    self.assertEqual(framed_value, legacy_value, key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import sys
+import time
+import numpy as np
+
+from server_nav_drone.nav_drone_server_py3 import process_unity_image, process_unity_image_struct
+
+
+def benchmark(decode, byte_str, height, width, num_repeats):
+    start = time.time()
+    for _ in range(0, num_repeats):
+        decode(byte_str, height, width)
+    return (time.time() - start) / float(num_repeats)
+
+
+def main(height=128, width=128, num_repeats=20):
+    """ Compares the time to decode a Screen message image with process_unity_image and with the previous
+    struct based decoder, for a single camera and for a 6 camera panorama. """
+
+    for num_cameras in [1, 6]:
+        frame = np.random.rand(num_cameras, height, width, 4).astype("<f4")
+        byte_str = frame.tobytes()
+
+        image = process_unity_image(memoryview(byte_str), height, width)
+        image_struct = process_unity_image_struct(byte_str, height, width)
+        assert image.shape == image_struct.shape == (3 * num_cameras, height, width)
+        assert np.array_equal(image, image_struct), "Decoded images differ"
+
+        time_struct = benchmark(process_unity_image_struct, byte_str, height, width, num_repeats)
+        time_view = benchmark(process_unity_image, memoryview(byte_str), height, width, num_repeats)
+        print("%d camera(s) of %dx%d: struct %.3f ms, frombuffer %.3f ms, speedup %.1fx" %
+              (num_cameras, height, width, 1000.0 * time_struct, 1000.0 * time_view, time_struct / time_view))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        main(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        main()
@@ -13,7 +13,7 @@ from dataset_agreement_nav_drone.nav_drone_datapoint import NavDroneDataPoint
 from server.abstract_server import AbstractServer
 from server_nav_drone.core_socket_server import CoreSocketServer
 from server_nav_drone.trajectory_evaluation import stop_distance, \
-    norm_edit_distance, mean_closest_distance
+    norm_edit_distance, mean_closest_distance, TrajectoryMetricTracker
 from utils.debug_nav_drone_instruction import instruction_to_string
 
 MESSAGE_TYPES = ["Init", "Request", "Screen", "StopFlag", "Feedback"]
@@ -27,6 +27,8 @@ SERVER_MOVE_RESPONSES = ["Forward", "TurnRight", "TurnLeft",
                          "MoveUp", "MoveRight", "MoveLeft", "MoveDown",
                          STOP, FORCE_GOAL_UPDATE, FLAG_ACT_HALT, EXPLORE]
 SERVER_JOB_RESPONSES = ["NewSegment", "NewConfig", "Terminate"]
+# Moves after which unity can send a StopFlag message, which reads the positions of the agent
+STOP_FLAG_MOVES = [STOP, FORCE_GOAL_UPDATE, FLAG_ACT_HALT, EXPLORE]
 
 
 class NavDroneServer(AbstractServer):
@@ -54,6 +56,9 @@ class NavDroneServer(AbstractServer):
         move = self.action_space.get_action_name(action)
         self.unity_server_controller.make_move(move)
 
+    def receive_feedback(self):
+        return self.unity_server_controller.get_feedback()
+
     def receive_feedback_nonblocking(self):
         return self.unity_server_controller.get_feedback_nonblocking()
 
@@ -73,6 +78,9 @@ class NavDroneServer(AbstractServer):
         self.unity_server_controller.reset(data_point, self.action_space,
                                            self.config)
 
+    def receive_reset_feedback(self):
+        return self.unity_server_controller.get_initial_image()
+
     def receive_reset_feedback_nonblocking(self):
         return self.unity_server_controller.receive_reset_feedback_nonblocking()
 
@@ -116,6 +124,8 @@ class UnityControllerServer(object):
         self.shared_data["dest_list"] = None
         self.shared_data["pos_list"] = None
         self.shared_data_lock = Lock()
+        self.pos_list = None
+        self.metric_tracker = None
         self.move_list = []
         self.move_queue_full = False
 
@@ -158,13 +168,15 @@ class UnityControllerServer(object):
         self.rewards_queue.get()
         x_pos, z_pos, y_angle = self.pos_queue.get()
         goal_dist = self.goal_dist_queue.get()
+        self.pos_list = [(x_pos, z_pos)]
         with self.shared_data_lock:
-            pos_list = [(x_pos, z_pos)]
-            self.shared_data["pos_list"] = pos_list
+            self.shared_data["pos_list"] = self.pos_list
             dest_list = self.shared_data["dest_list"]
-            stop_dist = stop_distance(pos_list, dest_list)
-            edit_dist = norm_edit_distance(pos_list, dest_list)
-            closest_dist = mean_closest_distance(pos_list, dest_list)
+        self.metric_tracker = TrajectoryMetricTracker(dest_list)
+        self.metric_tracker.add_position((x_pos, z_pos))
+        stop_dist = self.metric_tracker.stop_distance()
+        edit_dist = self.metric_tracker.norm_edit_distance()
+        closest_dist = self.metric_tracker.mean_closest_distance()
         metadata = {
             "x_pos": x_pos,
             "z_pos": z_pos,
@@ -198,6 +210,11 @@ class UnityControllerServer(object):
             break
         """
         # assert self.move_queue_full is False, "made second server move without obtaining feedback from first"
+        if move in STOP_FLAG_MOVES and self.pos_list is not None:
+            # Publish the positions for flag_stop, which runs in the socket server process. This is done
+            # only here, and not after every step, since a round trip of the list through the manager is O(T).
+            with self.shared_data_lock:
+                self.shared_data["pos_list"] = self.pos_list
         self.move_queue.put(move)
         self.move_list.append(move)
         self.move_queue_full = True
@@ -212,14 +229,11 @@ class UnityControllerServer(object):
         image = self.image_queue.get()
         goal_dist = self.goal_dist_queue.get()
         x_pos, z_pos, y_angle = self.pos_queue.get()
-        with self.shared_data_lock:
-            pos_list = self.shared_data["pos_list"]
-            pos_list.append((x_pos, z_pos))
-            self.shared_data["pos_list"] = pos_list
-            dest_list = self.shared_data["dest_list"]
-            stop_dist = stop_distance(pos_list, dest_list)
-            edit_dist = norm_edit_distance(pos_list, dest_list)
-            closest_dist = mean_closest_distance(pos_list, dest_list)
+        self.pos_list.append((x_pos, z_pos))
+        self.metric_tracker.add_position((x_pos, z_pos))
+        stop_dist = self.metric_tracker.stop_distance()
+        edit_dist = self.metric_tracker.norm_edit_distance()
+        closest_dist = self.metric_tracker.mean_closest_distance()
         metadata = {
             "x_pos": x_pos,
             "z_pos": z_pos,
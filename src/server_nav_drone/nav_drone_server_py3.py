@@ -1,7 +1,7 @@
 from collections import defaultdict
 import logging
 import struct
-from multiprocessing import Queue, Process, Manager, Lock
+from multiprocessing import Queue, Process
 import math
 import numpy as np
 import time
@@ -11,10 +11,12 @@ from dataset_agreement_nav_drone.action_space import ActionSpace
 
 from dataset_agreement_nav_drone.nav_drone_datapoint import NavDroneDataPoint
 from server.abstract_server import AbstractServer
+from server.image_decoder import ImageDecoder
 from server_nav_drone.core_socket_server import CoreSocketServer
 from server_nav_drone.core_socket_server import launch_server
+from server_nav_drone.step_channel import StepChannel
 from server_nav_drone.trajectory_evaluation import stop_distance, \
-    norm_edit_distance, mean_closest_distance
+    norm_edit_distance, mean_closest_distance, TrajectoryMetricTracker
 from utils.debug_nav_drone_instruction import instruction_to_string
 
 MESSAGE_TYPES = ["Init", "Request", "Screen", "StopFlag", "Feedback"]
@@ -33,9 +35,9 @@ SERVER_JOB_RESPONSES = ["NewSegment", "NewConfig", "Terminate"]
 
 
 class NavDroneServerPy3(AbstractServer):
-    def __init__(self, config, action_space, multi_client=False):
+    def __init__(self, config, action_space, multi_client=False, num_step_slots=StepChannel.DEFAULT_NUM_SLOTS):
         AbstractServer.__init__(self, config, action_space)
-        self.unity_server_controller = UnityControllerServer(config)
+        self.unity_server_controller = UnityControllerServer(config, num_step_slots)
         self.config = config
         self.action_space = action_space
         # core_server = CoreSocketServer(hostname, port,
@@ -65,6 +67,9 @@ class NavDroneServerPy3(AbstractServer):
         move = self.action_space.get_action_name(action)
         self.unity_server_controller.make_move(move)
 
+    def receive_feedback(self):
+        return self.unity_server_controller.get_feedback()
+
     def receive_feedback_nonblocking(self):
         return self.unity_server_controller.get_feedback_nonblocking()
 
@@ -84,6 +89,9 @@ class NavDroneServerPy3(AbstractServer):
         self.unity_server_controller.reset(data_point, self.action_space,
                                            self.config)
 
+    def receive_reset_feedback(self):
+        return self.unity_server_controller.get_initial_image()
+
     def receive_reset_feedback_nonblocking(self):
         return self.unity_server_controller.receive_reset_feedback_nonblocking()
 
@@ -116,13 +124,25 @@ class NavDroneServerPy3(AbstractServer):
 
 
 class UnityControllerServer(object):
-    def __init__(self, config):
+    def __init__(self, config, num_step_slots=StepChannel.DEFAULT_NUM_SLOTS):
         self.config = config
-        self.shared_data = None
-        self.shared_data_lock = None
+        self.num_step_slots = num_step_slots
         self.move_list = []
         self.move_queue_full = False
 
+        # episode data of the agent
+        self.scene_name = None
+        self.dest_list = None
+        self.pos_list = None
+        # scene name and destinations of the episode started by the last reset
+        self.next_episode = None
+        self.metric_tracker = None
+        self.dist_lists = defaultdict(list)
+
+        # episode data of the socket server
+        self.trajectory = None
+        self.stop = None
+
         # queues of data requested from unity
         self.scene_config_queue = None
         self.path_queue = None
@@ -131,26 +151,13 @@ class UnityControllerServer(object):
         self.next_dest_queue = None
         self.move_queue = None
 
-        # queues of data sent from unity
-        self.image_queue = None
-        self.rewards_queue = None
-        self.feedback_queue = None
-        self.goal_dist_queue = None
-        self.pos_queue = None
+        # steps sent from unity
+        self.step_channel = None
 
         self.is_init = False
 
     def generate_server_fields(self):
         fields = {}
-        manager = Manager()
-        fields["shared_data"] = manager.dict()
-        fields["shared_data"]["received_feedback"] = False
-        fields["shared_data"]["dist_lists"] = defaultdict(list)
-        fields["shared_data"]["end_x"] = float("NaN")
-        fields["shared_data"]["end_z"] = float("NaN")
-        fields["shared_data"]["dest_list"] = None
-        fields["shared_data"]["pos_list"] = None
-        fields["shared_data_lock"] = Lock()
 
         # queues of data requested from unity
         fields["scene_config_queue"] = Queue()
@@ -160,20 +167,15 @@ class UnityControllerServer(object):
         fields["next_dest_queue"] = Queue()
         fields["move_queue"] = Queue()
 
-        # queues of data sent from unity
-        fields["image_queue"] = Queue()
-        fields["rewards_queue"] = Queue()
-        fields["feedback_queue"] = Queue()
-        fields["goal_dist_queue"] = Queue()
-        fields["pos_queue"] = Queue()
+        # steps sent from unity
+        num_rewards = len(SERVER_MOVE_RESPONSES) - NUM_DUMMY_ACTIONS
+        fields["step_channel"] = StepChannel(self.config["image_height"], self.config["image_width"], num_rewards,
+                                             num_slots=self.num_step_slots)
 
         return fields
 
     def initialize_server(self, fields):
         if not self.is_init:
-            self.shared_data = fields["shared_data"]
-            self.shared_data_lock = fields["shared_data_lock"]
-
             # queues of data requested from unity
             self.scene_config_queue = fields["scene_config_queue"]
             self.path_queue = fields["path_queue"]
@@ -182,12 +184,8 @@ class UnityControllerServer(object):
             self.next_dest_queue = fields["next_dest_queue"]
             self.move_queue = fields["move_queue"]
 
-            # queues of data sent from unity
-            self.image_queue = fields["image_queue"]
-            self.rewards_queue = fields["rewards_queue"]
-            self.feedback_queue = fields["feedback_queue"]
-            self.goal_dist_queue = fields["goal_dist_queue"]
-            self.pos_queue = fields["pos_queue"]
+            # steps sent from unity
+            self.step_channel = fields["step_channel"]
 
             self.is_init = True
 
@@ -211,17 +209,25 @@ class UnityControllerServer(object):
             print ("invalid message type:", message_type)
 
     def get_initial_image(self):
-        # clear dummy reward from queue first
-        self.rewards_queue.get()
-        x_pos, z_pos, y_angle = self.pos_queue.get()
-        goal_dist = self.goal_dist_queue.get()
-        with self.shared_data_lock:
-            pos_list = [(x_pos, z_pos)]
-            self.shared_data["pos_list"] = pos_list
-            dest_list = self.shared_data["dest_list"]
-            stop_dist = stop_distance(pos_list, dest_list)
-            edit_dist = norm_edit_distance(pos_list, dest_list)
-            closest_dist = mean_closest_distance(pos_list, dest_list)
+        # the rewards of the first step are dummy rewards
+        image, step = self.step_channel.get()
+        x_pos, z_pos, y_angle, goal_dist = step[StepChannel.X_POS: StepChannel.GOAL_DIST + 1].tolist()
+
+        # unity can send the stop flag of the previous episode after its last step, in which case it
+        # comes with the first step of this episode and is evaluated on the previous episode
+        if step[StepChannel.STOP_FLAG] and self.pos_list is not None:
+            feedback = self.get_stop_feedback(bool(step[StepChannel.STOP_SUCCESSFUL]),
+                                              step[StepChannel.STOP_X], step[StepChannel.STOP_Z])
+        else:
+            feedback = ""
+
+        self.scene_name, self.dest_list = self.next_episode
+        self.pos_list = [(x_pos, z_pos)]
+        self.metric_tracker = TrajectoryMetricTracker(self.dest_list)
+        self.metric_tracker.add_position((x_pos, z_pos))
+        stop_dist = self.metric_tracker.stop_distance()
+        edit_dist = self.metric_tracker.norm_edit_distance()
+        closest_dist = self.metric_tracker.mean_closest_distance()
         metadata = {
             "x_pos": x_pos,
             "z_pos": z_pos,
@@ -232,10 +238,10 @@ class UnityControllerServer(object):
             "closest_dist_error": closest_dist,
             "error": edit_dist,
             "reward_dict": {move: 0.0 for move in SERVER_MOVE_RESPONSES},
-            "feedback": "",
+            "feedback": feedback,
         }
         self.move_queue_full = False
-        return self.image_queue.get(), metadata
+        return image, metadata
 
     def make_move(self, move):
         """
@@ -260,26 +266,30 @@ class UnityControllerServer(object):
         self.move_queue_full = True
 
     def get_feedback(self):
+        image, step = self.step_channel.get()
+        reward_list = self.step_channel.get_rewards(step) + [0.0, 0.0]
         if len(self.move_list) > 0:
             last_move = self.move_list[-1]
-            reward_list = self.rewards_queue.get()
             if last_move not in DUMMY_ACTIONS:
                 reward = reward_list[SERVER_MOVE_RESPONSES.index(last_move)]
             else:
                 reward = 0.0
         else:
             reward = None
-        image = self.image_queue.get()
-        goal_dist = self.goal_dist_queue.get()
-        x_pos, z_pos, y_angle = self.pos_queue.get()
-        with self.shared_data_lock:
-            pos_list = self.shared_data["pos_list"]
-            pos_list.append((x_pos, z_pos))
-            self.shared_data["pos_list"] = pos_list
-            dest_list = self.shared_data["dest_list"]
-            stop_dist = stop_distance(pos_list, dest_list)
-            edit_dist = norm_edit_distance(pos_list, dest_list)
-            closest_dist = mean_closest_distance(pos_list, dest_list)
+        x_pos, z_pos, y_angle, goal_dist = step[StepChannel.X_POS: StepChannel.GOAL_DIST + 1].tolist()
+
+        # the stop flag is evaluated on the positions before this step
+        if step[StepChannel.STOP_FLAG]:
+            feedback = self.get_stop_feedback(bool(step[StepChannel.STOP_SUCCESSFUL]),
+                                              step[StepChannel.STOP_X], step[StepChannel.STOP_Z])
+        else:
+            feedback = ""
+
+        self.pos_list.append((x_pos, z_pos))
+        self.metric_tracker.add_position((x_pos, z_pos))
+        stop_dist = self.metric_tracker.stop_distance()
+        edit_dist = self.metric_tracker.norm_edit_distance()
+        closest_dist = self.metric_tracker.mean_closest_distance()
         metadata = {
             "x_pos": x_pos,
             "z_pos": z_pos,
@@ -290,23 +300,19 @@ class UnityControllerServer(object):
             "closest_dist_error": closest_dist,
             "error": edit_dist,
             "reward_dict": make_reward_dict(reward_list),
-            "feedback": "",
+            "feedback": feedback,
         }
-        with self.shared_data_lock:
-            if self.shared_data["received_feedback"]:
-                metadata["feedback"] = self.feedback_queue.get()
-                self.shared_data["received_feedback"] = False
         self.move_queue_full = False
         return image, reward, metadata
 
     def get_feedback_nonblocking(self):
-        if self.rewards_queue.empty():
+        if not self.step_channel.poll():
             return None
         else:
             return self.get_feedback()
 
     def receive_reset_feedback_nonblocking(self):
-        if self.image_queue.empty():
+        if not self.step_channel.poll():
             return None
         else:
             return self.get_initial_image()
@@ -315,18 +321,14 @@ class UnityControllerServer(object):
         assert isinstance(data_point, NavDroneDataPoint)
         assert isinstance(action_space, ActionSpace)
         self.move_list = []
-        with self.shared_data_lock:
-            self.shared_data["scene_name"] = data_point.get_scene_name()
-            end_x, end_z = data_point.get_destination_list()[-1]
-            self.shared_data["end_x"], self.shared_data["end_z"] = end_x, end_z
-            self.shared_data["dest_list"] = data_point.get_destination_list()
-            gold_moves = []
-            for seg in data_point.get_sub_trajectory_list():
-                moves = [action_space.get_action_name(a) for a in seg]
-                gold_moves.extend(moves)
-                gold_moves.append(STOP)
-            self.shared_data["trajectory"] = [SERVER_MOVE_RESPONSES.index(m)
-                                              for m in gold_moves]
+        # the previous episode is evaluated until the first step of this one, see get_initial_image
+        self.next_episode = (data_point.get_scene_name(), data_point.get_destination_list())
+        gold_moves = []
+        for seg in data_point.get_sub_trajectory_list():
+            moves = [action_space.get_action_name(a) for a in seg]
+            gold_moves.extend(moves)
+            gold_moves.append(STOP)
+        trajectory = [SERVER_MOVE_RESPONSES.index(m) for m in gold_moves]
         instruction_segments = data_point.get_instruction_oracle_segmented()
         instruction_string = ""
         for i, instruction_seg in enumerate(instruction_segments):
@@ -337,7 +339,8 @@ class UnityControllerServer(object):
             instruction_string += "<color=%s>" % color
             instruction_string += instruction_to_string(instruction_seg, config)
             instruction_string += "</color> "
-        self.scene_config_queue.put(data_point.get_scene_config())
+        # the gold trajectory is sent with the scene config which unity requests first
+        self.scene_config_queue.put((data_point.get_scene_config(), trajectory))
         self.path_queue.put(data_point.get_scene_path())
         self.instructions_queue.put(instruction_string.strip())
         self.start_pos_queue.put(data_point.get_start_pos())
@@ -353,7 +356,8 @@ class UnityControllerServer(object):
         # print "request type:", request_type
         payload = ""
         if request_type == "JsonConfig":
-            payload = bytes(self.scene_config_queue.get(), "utf-8")
+            scene_config, self.trajectory = self.scene_config_queue.get()
+            payload = bytes(scene_config, "utf-8")
         elif request_type == "JsonPath":
             payload = bytes(self.path_queue.get(), "utf-8")
         elif request_type == "Instructions":
@@ -380,7 +384,7 @@ class UnityControllerServer(object):
             next_job = SERVER_JOB_RESPONSES.index("NewConfig")
             payload = struct.pack("<b", next_job)
         elif request_type == "GoldTrajectory":
-            trajectory = self.shared_data["trajectory"]
+            trajectory = self.trajectory
             payload = struct.pack("<" + len(trajectory) * "b", *trajectory)
 
         # send pay.oad back to response writer
@@ -388,84 +392,87 @@ class UnityControllerServer(object):
 
     def save_next_screen(self, screen_reward_array):
         num_rewards = len(SERVER_MOVE_RESPONSES) - NUM_DUMMY_ACTIONS
-        rewards = struct.unpack(
-            "<" + "f" * num_rewards, screen_reward_array[:4*num_rewards])
-        x_pos = struct.unpack(
-            "<f", screen_reward_array[4*num_rewards:4*num_rewards+4])[0]
-        z_pos = struct.unpack(
-            "<f", screen_reward_array[4*num_rewards+4:4*num_rewards+8])[0]
-        y_angle = struct.unpack(
-            "<f", screen_reward_array[4*num_rewards+8:4*num_rewards+12])[0]
-        next_dest_x = struct.unpack(
-            "<f", screen_reward_array[4*num_rewards+12:4*num_rewards+16])[0]
-        next_dest_z = struct.unpack(
-            "<f", screen_reward_array[4*num_rewards+16:4*num_rewards+20])[0]
-        self.rewards_queue.put(list(rewards) + [0.0, 0.0])
-        image = process_unity_image(
-            screen_reward_array[4*num_rewards+20:],
+        header = struct.unpack("<" + "f" * (num_rewards + 5), screen_reward_array[:4*num_rewards+20])
+        rewards = header[:num_rewards]
+        x_pos, z_pos, y_angle, next_dest_x, next_dest_z = header[num_rewards:]
+        image_bytes = memoryview(screen_reward_array)[4*num_rewards+20:]
+        num_cameras = len(image_bytes) // (self.config["image_height"] * self.config["image_width"] * 4 * 4)
+
+        # The image is decoded from a view of the message directly into the slot of the step channel
+        image, step = self.step_channel.start_put(num_cameras)
+        process_unity_image(
+            image_bytes,
             height=self.config["image_height"],
-            width=self.config["image_width"])
-        self.image_queue.put(image)
-        self.pos_queue.put((x_pos, z_pos, y_angle))
+            width=self.config["image_width"],
+            out=image)
         dist_to_goal = math.sqrt((x_pos - next_dest_x) ** 2 + (z_pos - next_dest_z) ** 2)
-        self.goal_dist_queue.put(dist_to_goal)
+        step[StepChannel.X_POS: StepChannel.GOAL_DIST + 1] = (x_pos, z_pos, y_angle, dist_to_goal)
+        if self.stop is not None:
+            step[StepChannel.STOP_FLAG: StepChannel.STOP_Z + 1] = (1.0,) + self.stop
+            self.stop = None
+        else:
+            step[StepChannel.STOP_FLAG] = 0.0
+        step[StepChannel.NUM_STATE_FIELDS:] = rewards
+        self.step_channel.end_put()
 
     def flag_stop(self, message_data):
-        stop_successful = bool(struct.unpack("<b", message_data[:1])[0])
-        stop_x = struct.unpack("<f", message_data[1:5])[0]
-        stop_z = struct.unpack("<f", message_data[5:9])[0]
-        with self.shared_data_lock:
-            pos_list = self.shared_data["pos_list"] + [(stop_x, stop_z)]
-            dest_list = self.shared_data["dest_list"]
-            dists = {
-                "stop_dist": stop_distance(pos_list, dest_list),
-                "edit_dist": norm_edit_distance(pos_list, dest_list),
-                "closest_dist": mean_closest_distance(pos_list, dest_list),
-            }
-            dist_lists = self.shared_data["dist_lists"]
-            for k, dist in dists.items():
-                dist_lists[k].append(dist)
-            self.shared_data["dist_lists"] = dist_lists
-
-            scene_name = self.shared_data["scene_name"]
-            feedback_template = "scene-name=%s --- stop-successful=%s"
-            feedback = feedback_template % (scene_name, str(stop_successful))
-            for k, dist_list in sorted(dist_lists.items()):
-                dists_template = " --- " + k + "=%f --- cum-mean-" + k + "=%f"
-                dist = dist_list[-1]
-                mean_dist = float(np.mean(dist_list))
-                feedback += dists_template % (dist, mean_dist)
-
-            self.feedback_queue.put(feedback)
-            self.shared_data["received_feedback"] = True
+        # Sent to the agent with the next step
+        stop_successful, stop_x, stop_z = struct.unpack("<bff", message_data[:9])
+        self.stop = (float(bool(stop_successful)), stop_x, stop_z)
+
+    def get_stop_feedback(self, stop_successful, stop_x, stop_z):
+        pos_list = self.pos_list + [(stop_x, stop_z)]
+        dest_list = self.dest_list
+        dists = {
+            "stop_dist": stop_distance(pos_list, dest_list),
+            "edit_dist": norm_edit_distance(pos_list, dest_list),
+            "closest_dist": mean_closest_distance(pos_list, dest_list),
+        }
+        dist_lists = self.dist_lists
+        for k, dist in dists.items():
+            dist_lists[k].append(dist)
+
+        scene_name = self.scene_name
+        feedback_template = "scene-name=%s --- stop-successful=%s"
+        feedback = feedback_template % (scene_name, str(stop_successful))
+        for k, dist_list in sorted(dist_lists.items()):
+            dists_template = " --- " + k + "=%f --- cum-mean-" + k + "=%f"
+            dist = dist_list[-1]
+            mean_dist = float(np.mean(dist_list))
+            feedback += dists_template % (dist, mean_dist)
+        return feedback
 
     def log_human_feedback(self, feedback_data):
         pass
 
     def clear_metadata(self):
-        with self.shared_data_lock:
-            self.shared_data["dist_lists"] = defaultdict(list)
+        self.dist_lists = defaultdict(list)
 
 
 num_images = [0]
 
-def process_unity_image(byte_str, height, width):
-    """
-    num_bytes = height * width * 4 * 4
-    assert len(byte_str) == num_bytes, len(byte_str)
+# Image decoders by image height and width
+image_decoders = dict()
+
+
+def process_unity_image(byte_str, height, width, out=None):
+    """ Decodes the images of all cameras in byte_str into a (3 * num_cameras, height, width) float32 array,
+    or into out if given. The bytes are viewed in place and copied once into the returned array (see
+    ImageDecoder.decode_cameras). """
+
+    image_decoder = image_decoders.get((height, width))
+    if image_decoder is None:
+        image_decoder = ImageDecoder(height, width, ImageDecoder.FLOAT32_RGBA, flip_rows=True)
+        image_decoders[(height, width)] = image_decoder
+
+    num_images[0] += 1
+    return image_decoder.decode_cameras(byte_str, out)
+
+
+def process_unity_image_struct(byte_str, height, width):
+    """ Previous implementation of process_unity_image which unpacks every value with struct. It is kept
+    as a reference for benchmarking (see server_nav_drone.benchmark_image_decoding). """
 
-    s_format = "<" + "f" * 4 * height * width
-    unity_shape = (height, width, 4)
-    x = np.array(struct.unpack(s_format, byte_str)).reshape(unity_shape)
-    # remove alpha channel
-    x = x[:, :, :3]
-    # flip so image is right-way up
-    x = np.flip(x, 0)
-    # swap axes to order expected by PyTorch
-    x = x.swapaxes(1, 2)
-    x = x.swapaxes(0, 1)
-    return x
-    """
     num_bytes_per_im = height * width * 4 * 4
     assert (len(byte_str) % num_bytes_per_im) == 0, "incorrect image bytes"
     num_cam = len(byte_str) // num_bytes_per_im
@@ -478,26 +485,11 @@ def process_unity_image(byte_str, height, width):
     x = x[:, :, :, :3]
     # flip so image is right-way up
     x = np.flip(x, 1)
-    """
-    for i, im in enumerate(x):
-        print "hello"
-        misc.imsave("multi_image_%d.png" % i, im)
-    """
-    """
-    if num_cam == 6:
-        x = x.swapaxes(0, 1)
-        final_shape = (height, num_cam * width, 3)
-    else:
-        x = x.swapaxes(0, 1)
-        x = x.swapaxes(1, 2)
-        final_shape = (height, width, num_cam * 3)
-    """
     x = x.swapaxes(0, 1)
     x = x.swapaxes(1, 2)
     final_shape = (height, width, num_cam * 3)
 
     x = x.reshape(final_shape)
-    num_images[0] += 1
     # swap axes to order expected by PyTorch
     x = x.swapaxes(1, 2)
     x = x.swapaxes(0, 1)
@@ -0,0 +1,96 @@
+import numpy as np
+from multiprocessing import RawArray, Semaphore
+
+
+class StepChannel:
+    """ Shared memory channel of the steps sent by the simulator from the socket server process to the agent.
+    Every step is written into one of num_slots fixed layout slots made of a frame buffer, which holds up to
+    max_num_cameras camera images, and a state array of the number of cameras, the position, the distance to
+    the goal, the stop flag and the rewards. A pair of semaphores counting the empty and filled slots hands
+    slots over between the single writer and the single reader, so a step costs no pickling or queue.
+
+    The channel must be passed to the socket server process when it is started.
+
+    The agent waits for the step of an action before sending the next one, so at most the step of the
+    previous action and the first step of the next episode are in the channel at once. The default of
+    DEFAULT_NUM_SLOTS slots leaves room for agents that send a few actions ahead. When all slots are full,
+    start_put blocks the socket server loop until the agent reads a step, which holds back the simulator
+    without dropping steps. """
+
+    DEFAULT_NUM_SLOTS = 4
+    NUM_CAMERAS, X_POS, Z_POS, Y_ANGLE, GOAL_DIST, STOP_FLAG, STOP_SUCCESSFUL, STOP_X, STOP_Z = range(0, 9)
+    NUM_STATE_FIELDS = 9
+
+    def __init__(self, height, width, num_rewards, max_num_cameras=6, num_slots=DEFAULT_NUM_SLOTS):
+        self.height = height
+        self.width = width
+        self.num_rewards = num_rewards
+        self.max_num_cameras = max_num_cameras
+        self.num_slots = num_slots
+
+        self.frame_size = 3 * max_num_cameras * height * width
+        self.state_size = StepChannel.NUM_STATE_FIELDS + num_rewards
+        self.frame_array = RawArray("f", num_slots * self.frame_size)
+        self.state_array = RawArray("d", num_slots * self.state_size)
+        self.empty_slots = Semaphore(num_slots)
+        self.filled_slots = Semaphore(0)
+
+        # Slots are used in order by the writer and the reader. Each process keeps its own index.
+        self.write_index = 0
+        self.read_index = 0
+        self.frames = None
+        self.states = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["frames"] = None
+        state["states"] = None
+        return state
+
+    def _get_views(self):
+        if self.frames is None:
+            self.frames = np.frombuffer(self.frame_array, dtype=np.float32).reshape((self.num_slots, -1))
+            self.states = np.frombuffer(self.state_array, dtype=np.float64).reshape((self.num_slots, -1))
+        return self.frames, self.states
+
+    def start_put(self, num_cameras):
+        """ Waits for an empty slot and returns views of its (3 * num_cameras, height, width) frame and of
+        its state, which the writer fills before calling end_put. """
+
+        assert num_cameras <= self.max_num_cameras, "Too many cameras for the step channel"
+        frames, states = self._get_views()
+        self.empty_slots.acquire()
+        slot = self.write_index
+        frame = frames[slot, :3 * num_cameras * self.height * self.width].reshape(
+            (3 * num_cameras, self.height, self.width))
+        state = states[slot]
+        state[StepChannel.NUM_CAMERAS] = num_cameras
+        return frame, state
+
+    def end_put(self):
+        self.write_index = (self.write_index + 1) % self.num_slots
+        self.filled_slots.release()
+
+    def poll(self):
+        """ Returns whether a step can be read without blocking """
+        if self.filled_slots.acquire(False):
+            self.filled_slots.release()
+            return True
+        return False
+
+    def get(self):
+        """ Waits for the next step and returns a copy of its frame and state """
+
+        frames, states = self._get_views()
+        self.filled_slots.acquire()
+        slot = self.read_index
+        num_cameras = int(states[slot, StepChannel.NUM_CAMERAS])
+        frame = frames[slot, :3 * num_cameras * self.height * self.width].reshape(
+            (3 * num_cameras, self.height, self.width)).copy()
+        state = states[slot].copy()
+        self.read_index = (self.read_index + 1) % self.num_slots
+        self.empty_slots.release()
+        return frame, state
+
+    def get_rewards(self, state):
+        return state[StepChannel.NUM_STATE_FIELDS:].tolist()
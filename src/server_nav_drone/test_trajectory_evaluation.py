@@ -0,0 +1,108 @@
+import unittest
+import numpy as np
+
+from server_nav_drone.trajectory_evaluation import mean_closest_distance, mean_closest_distance_batch, \
+    norm_edit_distance, norm_edit_distance_batch, stop_distance, stop_distance_batch, TrajectoryMetricTracker
+
+
+def reference_mean_closest_distance(trajectory, destination_list):
+    pos_array = np.array(trajectory)
+    dest_array = np.array(destination_list)
+    dists = np.array([min(((pos_array - dest) ** 2).sum(1) ** 0.5)
+                      for dest in dest_array])
+    return float(dists.mean())
+
+
+def reference_norm_edit_distance(trajectory, destination_list):
+    """ Memoized recursion which norm_edit_distance must match """
+
+    def get_edit_distance(i_, j_, cache):
+        # calculates the edit distance starting from index i_ in trajectory
+        # and index j_ in destination_list
+        key = i_, j_
+        if j_ >= len(destination_list):
+            return 0.0
+        elif key in cache:
+            return cache[key]
+        elif i_ == len(trajectory) - 1:
+            final_pos = np.array(trajectory[-1])
+            dest_array = np.array(destination_list[j_:])
+            dists_from_final = ((dest_array - final_pos) ** 2).sum(1) ** 0.5
+            total_dist = float(sum(dists_from_final))
+            cache[key] = total_dist
+            return total_dist
+        else:
+            start_pos = np.array(trajectory[i_])
+            start_goal = np.array(destination_list[j_])
+            dist_i_j = float(sum((start_goal - start_pos) ** 2)) ** 0.5
+            dist_1 = dist_i_j + get_edit_distance(i_ + 1, j_ + 1, cache)
+            dist_2 = get_edit_distance(i_ + 1, j_, cache)
+            total_dist = min(dist_1, dist_2)
+            cache[key] = total_dist
+            return total_dist
+
+    cache = {}
+    return get_edit_distance(0, 0, cache) / len(destination_list)
+
+
+def reference_stop_distance(trajectory, destination_list):
+    goal = np.array(destination_list[-1])
+    end_pos = np.array(trajectory[-1])
+    return float(sum((goal - end_pos) ** 2)) ** 0.5
+
+
+class TestTrajectoryEvaluation(unittest.TestCase):
+    """ The vectorized metrics, their batched versions and the incremental tracker must give the same
+    values as the original implementations, up to floating point rounding """
+
+    NUM_EXAMPLES = 200
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.trajectories, self.destination_lists = [], []
+        for _ in range(0, TestTrajectoryEvaluation.NUM_EXAMPLES):
+            # Include trajectories shorter than the destination list and single position trajectories
+            trajectory = rng.uniform(225.0, 275.0, size=(rng.randint(1, 30), 2))
+            destination_list = rng.uniform(225.0, 275.0, size=(rng.randint(1, 6), 2))
+            self.trajectories.append([tuple(pos) for pos in trajectory])
+            self.destination_lists.append([tuple(dest) for dest in destination_list])
+
+    def assert_same_as_reference(self, metric, metric_batch, reference_metric):
+        expected = [reference_metric(trajectory, destination_list)
+                    for trajectory, destination_list in zip(self.trajectories, self.destination_lists)]
+        values = [metric(trajectory, destination_list)
+                  for trajectory, destination_list in zip(self.trajectories, self.destination_lists)]
+        for value in values:
+            self.assertIsInstance(value, float)
+        np.testing.assert_allclose(values, expected, rtol=1e-12, atol=1e-9)
+
+        batch_values = metric_batch(self.trajectories, self.destination_lists)
+        self.assertEqual(batch_values.shape, (len(self.trajectories),))
+        np.testing.assert_allclose(batch_values, expected, rtol=1e-12, atol=1e-9)
+
+    def test_mean_closest_distance(self):
+        self.assert_same_as_reference(mean_closest_distance, mean_closest_distance_batch,
+                                      reference_mean_closest_distance)
+
+    def test_norm_edit_distance(self):
+        self.assert_same_as_reference(norm_edit_distance, norm_edit_distance_batch,
+                                      reference_norm_edit_distance)
+
+    def test_stop_distance(self):
+        self.assert_same_as_reference(stop_distance, stop_distance_batch, reference_stop_distance)
+
+    def test_metric_tracker(self):
+        for trajectory, destination_list in zip(self.trajectories, self.destination_lists):
+            tracker = TrajectoryMetricTracker(destination_list)
+            for i, position in enumerate(trajectory):
+                tracker.add_position(position)
+                prefix = trajectory[:i + 1]
+                self.assertAlmostEqual(tracker.stop_distance(), reference_stop_distance(prefix, destination_list))
+                self.assertAlmostEqual(tracker.norm_edit_distance(),
+                                       reference_norm_edit_distance(prefix, destination_list))
+                self.assertAlmostEqual(tracker.mean_closest_distance(),
+                                       reference_mean_closest_distance(prefix, destination_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,47 +1,122 @@
 import numpy as np
 
 
+def pairwise_distances(trajectory, destination_list):
+    """ Returns the len(trajectory) x len(destination_list) matrix of euclidean distances """
+    pos_array = np.array(trajectory, dtype=np.float64)
+    dest_array = np.array(destination_list, dtype=np.float64)
+    return ((pos_array[:, np.newaxis, :] - dest_array[np.newaxis, :, :]) ** 2).sum(2) ** 0.5
+
+
+def batch_pairwise_distances(trajectories, destination_lists):
+    """ Pairwise distances of a batch as a batch x max trajectory length x max destination list length
+    array. Distances to padded destinations are 0 and from padded positions are infinite. Returns the
+    distances and the trajectory and destination list lengths. """
+
+    trajectory_lengths = np.array([len(trajectory) for trajectory in trajectories])
+    destination_lengths = np.array([len(destination_list) for destination_list in destination_lists])
+    dists = np.zeros((len(trajectories), trajectory_lengths.max(), destination_lengths.max()))
+    for b, (trajectory, destination_list) in enumerate(zip(trajectories, destination_lists)):
+        dists[b, len(trajectory):, :] = np.inf
+        dists[b, :len(trajectory), :len(destination_list)] = pairwise_distances(trajectory, destination_list)
+    return dists, trajectory_lengths, destination_lengths
+
+
 def mean_closest_distance(trajectory, destination_list):
-    pos_array = np.array(trajectory)
-    dest_array = np.array(destination_list)
-    dists = np.array([min(((pos_array - dest) ** 2).sum(1) ** 0.5)
-                      for dest in dest_array])
+    dists = pairwise_distances(trajectory, destination_list).min(0)
     # logging.info(str(dists))
     return float(dists.mean())
 
 
+def mean_closest_distance_batch(trajectories, destination_lists):
+    """ mean_closest_distance of every trajectory and destination list of the batch as an array """
+    dists, _, destination_lengths = batch_pairwise_distances(trajectories, destination_lists)
+    return dists.min(1).sum(1) / destination_lengths
+
+
+def _norm_edit_distance_dp(dists, trajectory_lengths, destination_lengths):
+    """ Dynamic program of norm_edit_distance for a batch of pairwise distances (see
+    batch_pairwise_distances). E[i, j], the edit distance between trajectory[i:] and destination_list[j:],
+    is computed one row at a time from the last position of the trajectory back to the first. """
+
+    batch_size, max_trajectory_length, max_destination_length = dists.shape
+
+    # Padded destinations are at distance 0, so E is 0 for j >= len(destination_list)
+    edit_dists = np.zeros((batch_size, max_destination_length + 1))
+    for i in range(max_trajectory_length - 1, -1, -1):
+
+        # From the last position all remaining destinations are matched to it
+        last = np.cumsum(dists[:, i, ::-1], axis=1)[:, ::-1]
+
+        # Match destination j to position i or skip position i
+        step = np.minimum(dists[:, i, :] + edit_dists[:, 1:], edit_dists[:, :-1])
+
+        is_last = (trajectory_lengths - 1 == i)[:, np.newaxis]
+        is_inside = (trajectory_lengths - 1 > i)[:, np.newaxis]
+        edit_dists[:, :-1] = np.where(is_last, last, np.where(is_inside, step, edit_dists[:, :-1]))
+
+    return edit_dists[:, 0] / destination_lengths
+
+
 def norm_edit_distance(trajectory, destination_list):
-    def get_edit_distance(i_, j_, cache):
-        # calculates the edit distance starting from index i_ in trajectory
-        # and index j_ in destination_list
-        key = i_, j_
-        if j_ >= len(destination_list):
-            return 0.0
-        elif key in cache:
-            return cache[key]
-        elif i_ == len(trajectory) - 1:
-            final_pos = np.array(trajectory[-1])
-            dest_array = np.array(destination_list[j_:])
-            dists_from_final = ((dest_array - final_pos) ** 2).sum(1) ** 0.5
-            total_dist = float(sum(dists_from_final))
-            cache[key] = total_dist
-            return total_dist
-        else:
-            assert i_ < len(trajectory) - 1 and j_ < len(destination_list)
-            start_pos = np.array(trajectory[i_])
-            start_goal = np.array(destination_list[j_])
-            dist_i_j = float(sum((start_goal - start_pos) ** 2)) ** 0.5
-            dist_1 = dist_i_j + get_edit_distance(i_ + 1, j_ + 1, cache)
-            dist_2 = get_edit_distance(i_ + 1, j_, cache)
-            total_dist = min(dist_1, dist_2)
-            cache[key] = total_dist
-            return total_dist
-
-    cache = {}
-    return get_edit_distance(0, 0, cache) / len(destination_list)
+    dists = pairwise_distances(trajectory, destination_list)[np.newaxis]
+    return float(_norm_edit_distance_dp(dists, np.array([len(trajectory)]), np.array([len(destination_list)]))[0])
+
+
+def norm_edit_distance_batch(trajectories, destination_lists):
+    """ norm_edit_distance of every trajectory and destination list of the batch as an array """
+    dists, trajectory_lengths, destination_lengths = batch_pairwise_distances(trajectories, destination_lists)
+    return _norm_edit_distance_dp(np.where(np.isinf(dists), 0.0, dists), trajectory_lengths, destination_lengths)
 
 
 def stop_distance(trajectory, destination_list):
     goal = np.array(destination_list[-1])
     end_pos = np.array(trajectory[-1])
     return float(sum((goal - end_pos) ** 2)) ** 0.5
+
+
+def stop_distance_batch(trajectories, destination_lists):
+    """ stop_distance of every trajectory and destination list of the batch as an array """
+    goals = np.array([destination_list[-1] for destination_list in destination_lists], dtype=np.float64)
+    end_positions = np.array([trajectory[-1] for trajectory in trajectories], dtype=np.float64)
+    return ((goals - end_positions) ** 2).sum(1) ** 0.5
+
+
+class TrajectoryMetricTracker:
+    """ Computes stop_distance, norm_edit_distance and mean_closest_distance of a trajectory to a destination
+    list while positions are added to the trajectory, in O(len(destination_list)) per position.
+
+    In norm_edit_distance destinations are matched in order to distinct positions, except that the last
+    position is matched to all remaining destinations. G[j], the minimum distance of matching the first j
+    destinations to distinct positions before the last one, is updated with the previous last position q when
+    a position is added as G'[j] = min(G[j], G[j - 1] + d(q, j - 1)). The edit distance is then the minimum
+    over j of G[j] plus the distances of the new last position to destinations j and after. """
+
+    def __init__(self, destination_list):
+        self.dest_array = np.array(destination_list, dtype=np.float64)
+        num_destinations = len(destination_list)
+        self.matched_dists = np.full(num_destinations + 1, np.inf)
+        self.matched_dists[0] = 0.0
+        self.closest_dists = np.full(num_destinations, np.inf)
+        self.last_dists = None
+        self.edit_dist = None
+
+    def add_position(self, position):
+        dists = ((self.dest_array - np.array(position, dtype=np.float64)) ** 2).sum(1) ** 0.5
+
+        if self.last_dists is not None:
+            self.matched_dists[1:] = np.minimum(self.matched_dists[1:], self.matched_dists[:-1] + self.last_dists)
+        remaining_dists = np.concatenate([np.cumsum(dists[::-1])[::-1], [0.0]])
+        self.edit_dist = float((self.matched_dists + remaining_dists).min())
+
+        np.minimum(self.closest_dists, dists, out=self.closest_dists)
+        self.last_dists = dists
+
+    def stop_distance(self):
+        return float(self.last_dists[-1])
+
+    def norm_edit_distance(self):
+        return self.edit_dist / len(self.closest_dists)
+
+    def mean_closest_distance(self):
+        return float(self.closest_dists.mean())
@@ -1,19 +1,24 @@
 from server.abstract_server import AbstractServer
 from dataset_agreement_streetview.streetview_fsa import StreetViewFSA, StreetViewUtils
+from dataset_agreement_streetview.panorama_feature_store import PanoramaFeatureStore
 
 
 class StreetViewServer(AbstractServer):
     """ Server for StreetView dataset. Unlike servers using unity3d such as
     blocks, house, navdrone, this server is programmed on the python side. """
 
-    def __init__(self, config, action_space, forward_setting_strict=False):
+    def __init__(self, config, action_space, forward_setting_strict=False,
+                 feature_cache_bytes=PanoramaFeatureStore.DEFAULT_CACHE_BYTES, fsa=None):
 
         self.config = config
         self.action_space = action_space
 
-        # Create the Finite State Automaton
-        self.fsa = StreetViewFSA(config["node_file"], config["link_file"], config["image_feature_folder"],
-                                 forward_setting_strict=forward_setting_strict, mapping_type=config["mapping_type"])
+        # Create the Finite State Automaton unless a shared one is given (see create_shared_fsa)
+        if fsa is None:
+            self.fsa = StreetViewServer.create_fsa(config, forward_setting_strict, feature_cache_bytes)
+        else:
+            assert fsa.forward_setting_strict == forward_setting_strict, "Shared FSA has a different forward setting"
+            self.fsa = fsa
         self.streetview_fsa_utils = StreetViewUtils(self.fsa, action_space)
 
         # Information stored across dataset until metadata is cleared
@@ -32,6 +37,22 @@ class StreetViewServer(AbstractServer):
 
         AbstractServer.__init__(self, config, action_space)
 
+    @staticmethod
+    def create_fsa(config, forward_setting_strict=False,
+                   feature_cache_bytes=PanoramaFeatureStore.DEFAULT_CACHE_BYTES):
+        return StreetViewFSA(config["node_file"], config["link_file"], config["image_feature_folder"],
+                             forward_setting_strict=forward_setting_strict, mapping_type=config["mapping_type"],
+                             feature_cache_bytes=feature_cache_bytes)
+
+    @staticmethod
+    def create_shared_fsa(config, forward_setting_strict=False,
+                          feature_cache_bytes=PanoramaFeatureStore.DEFAULT_CACHE_BYTES):
+        """ Creates an FSA in shared memory. It should be created once in the main process and given to the
+        servers of all the processes, which then attach to the same graph and features. """
+        fsa = StreetViewServer.create_fsa(config, forward_setting_strict, feature_cache_bytes)
+        fsa.share_memory()
+        return fsa
+
     def initialize_server(self):
         return
 
@@ -69,8 +90,10 @@ class StreetViewServer(AbstractServer):
         self.current_state = new_state
 
         # get navigation error
-        navigation_error, path, node_error = self.streetview_fsa_utils.path_to_goal(self.current_state, self.goal_state)
-        start_nav_error, _, _ = self.streetview_fsa_utils.path_to_goal(self.start_state, self.goal_state)
+        navigation_error, _, node_error = self.streetview_fsa_utils.path_to_goal(
+            self.current_state, self.goal_state, get_path=False)
+        start_nav_error, _, _ = self.streetview_fsa_utils.path_to_goal(
+            self.start_state, self.goal_state, get_path=False)
 
         # Compute task completion accuracy
         task_completion = self.streetview_fsa_utils.get_task_completion_accuracy(
@@ -168,17 +191,5 @@ class StreetViewServer(AbstractServer):
         self.sum_edit_distance = 0
         self.num_examples = 0
 
-    def halt_nonblocking(self):
-        raise NotImplementedError()
-
-    def receive_feedback_nonblocking(self):
-        raise NotImplementedError()
-
-    def send_action_nonblocking(self, action):
-        raise NotImplementedError()
-
     def force_goal_update(self):
         raise NotImplementedError()
-
-    def reset_nonblocking(self, next_data_point):
-        raise NotImplementedError()
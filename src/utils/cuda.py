@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 from torch.autograd import Variable
 
@@ -14,3 +15,16 @@ def cuda_var(t, volatile=False):
         return Variable(cuda_tensor(t), volatile=True)
     else:
         return Variable(cuda_tensor(t), requires_grad=False)
+
+
+def cuda_image_var(images, volatile=False, normalize=False):
+    """ Converts a numpy batch of images into a float variable. With normalize, the images are uint8
+    images sent by a server with normalize_image=False: they are moved to the device as is and divided
+    by 255 there, which copies a quarter of the bytes. Otherwise the values are kept as they are. """
+    t = cuda_tensor(torch.from_numpy(images))
+    if normalize:
+        assert images.dtype == np.uint8, "only uint8 images can be normalized"
+        t = t.float().div_(255.0)
+    else:
+        t = t.float()
+    return cuda_var(t, volatile)
@@ -11,15 +11,20 @@ def levenshtein_distance(seq1, seq2):
     if n == 0 or m == 0:
         return max(n, m)
 
-    # levenstein[i, j] represents string edit distance between seq1[:i] and seq2[:j]
-    levenshtein = np.zeros((n + 1, m + 1), dtype=np.int32)
-    for i in range(0, n + 1):
-        for j in range(0, m + 1):
-            if min(i, j) == 0:
-                levenshtein[i, j] = max(i, j)
-            else:
-                levenshtein[i, j] = min(levenshtein[i - 1, j] + 1,
-                                        levenshtein[i, j - 1] + 1,
-                                        levenshtein[i - 1, j - 1] + (0 if seq1[i - 1] == seq2[j - 1] else 1))
+    # Symbols are compared as integer codes
+    codes = dict()
+    codes1 = np.array([codes.setdefault(symbol, len(codes)) for symbol in seq1], dtype=np.int64)
+    codes2 = np.array([codes.setdefault(symbol, len(codes)) for symbol in seq2], dtype=np.int64)
 
-    return levenshtein[n, m]
\ No newline at end of file
+    # levenshtein[j] represents string edit distance between seq1[:i] and seq2[:j] for the current row i.
+    # Deletion and substitution only depend on the previous row. Insertion chains along the row are
+    # resolved together since min over k <= j of (partial[k] + j - k) = j + cumulative min of (partial[k] - k).
+    offsets = np.arange(0, m + 1, dtype=np.int64)
+    levenshtein = offsets.copy()
+    partial = np.empty(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        partial[0] = i
+        np.minimum(levenshtein[1:] + 1, levenshtein[:-1] + (codes2 != codes1[i - 1]), out=partial[1:])
+        levenshtein = np.minimum.accumulate(partial - offsets) + offsets
+
+    return int(levenshtein[m])
@@ -1,33 +1,116 @@
+import os
+import json
+import time
 import atexit
 from multiprocessing import Process, Queue
+from multiprocessing.util import Finalize
 import logging
 
 
 class MultiprocessingLoggerManager(object):
-    def __init__(self, file_path, logging_level):
+    """ Logs messages of all processes to file_path using a daemon process. Each logger buffers its records
+    and sends them in a single batch when flush_size records are buffered, or on the first message after
+    flush_interval seconds, so logging does not add a queue operation per message to the training loop.
+    Besides the text log, every record is written as a JSON line to file_path + ".jsonl" with the client id,
+    the step, the wall time and the message.
+
+    The flush interval is only checked when a message is logged: there is no timer, so records logged before
+    a pause stay buffered until the next message, an explicit flush or the exit of the process. Loggers flush
+    when their process exits. At exit of the main process all records are written before the daemon stops. """
+
+    JSON_SUFFIX = ".jsonl"
+
+    def __init__(self, file_path, logging_level, flush_interval=1.0, flush_size=64):
         self.log_queue = Queue()
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.loggers = []
         self.p = Process(target=logger_daemon,
-                    args=(self.log_queue, file_path, logging_level))
+                         args=(self.log_queue, file_path, file_path + MultiprocessingLoggerManager.JSON_SUFFIX,
+                               logging_level))
         self.p.start()
         atexit.register(self.cleanup)
 
     def get_logger(self, client_id):
-        return MultiprocessingLogger(client_id, self.log_queue)
+        logger = MultiprocessingLogger(client_id, self.log_queue, self.flush_interval, self.flush_size)
+        self.loggers.append(logger)
+        return logger
 
-    def cleanup(self):
-        self.p.terminate()
+    def cleanup(self, timeout=30.0):
+        if self.p is None:
+            return
+
+        # Flush loggers used by this process and let the daemon drain the queue
+        for logger in self.loggers:
+            logger.flush()
+        self.log_queue.put(None)
+        self.p.join(timeout)
+        if self.p.is_alive():
+            self.p.terminate()
+        self.p = None
 
 
 class MultiprocessingLogger(object):
-    def __init__(self, client_id, log_queue):
+    """ Buffering logger of a client. A logger passed to a child process starts with an empty buffer: pickling
+    drops the buffer, and a process which inherits a buffer through fork discards it on its first message,
+    since the records belong to the parent which flushes them itself. """
+
+    def __init__(self, client_id, log_queue, flush_interval=1.0, flush_size=64):
         self.client_id = client_id
         self.log_queue = log_queue
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.num_messages = 0
+        self.buffer = []
+        self.last_flush_time = time.time()
+        self.flush_pid = None
+
+    def __getstate__(self):
+        # Records buffered in this process are flushed by it
+        state = self.__dict__.copy()
+        state["buffer"] = []
+        state["flush_pid"] = None
+        return state
+
+    def log(self, message, step=None):
+        """ Log the message. The step defaults to the number of messages logged by this logger. """
+
+        if self.flush_pid != os.getpid():
+            if self.flush_pid is not None:
+                # Forked from the process which buffered these records, which will send them
+                self.buffer = []
+            # Flush remaining records when the process using this logger exits. This must run before
+            # the finalizer of the queue (priority 10) which closes it.
+            self.flush_pid = os.getpid()
+            Finalize(self, self.flush, exitpriority=100)
+
+        if step is None:
+            step = self.num_messages
+        self.num_messages += 1
+
+        now = time.time()
+        self.buffer.append((self.client_id, step, now, message))
+        if len(self.buffer) >= self.flush_size or now - self.last_flush_time >= self.flush_interval:
+            self.flush()
 
-    def log(self, message):
-        self.log_queue.put("Client %r: %r" % (self.client_id, message))
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.log_queue.put(self.buffer)
+            self.buffer = []
+        self.last_flush_time = time.time()
 
 
-def logger_daemon(log_queue, file_path, logging_level):
+def logger_daemon(log_queue, file_path, json_file_path, logging_level):
     logging.basicConfig(filename=file_path, level=logging_level)
-    while True:
-        logging.info(log_queue.get())
\ No newline at end of file
+    with open(json_file_path, "a") as json_file:
+        while True:
+            records = log_queue.get()
+            if records is None:
+                break
+            for client_id, step, wall_time, message in records:
+                logging.info("Client %r: %r" % (client_id, message))
+                if not isinstance(message, str):
+                    message = repr(message)
+                json_file.write(json.dumps({"client_id": client_id, "step": step,
+                                            "time": wall_time, "message": message}) + "\n")
+            json_file.flush()
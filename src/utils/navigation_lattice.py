@@ -0,0 +1,102 @@
+import math
+import numpy as np
+
+from cachetools import LRUCache
+
+
+class NavigationLattice:
+    """ Discretization of a nav-drone scene into a lattice of (x, z, heading) states. Positions are binned
+    into square cells of the scene and headings into the 24 directions reached by turning 15 degrees.
+    Cells whose center is inside an obstacle cannot be entered. Moving forward from a cell moves to the cell
+    containing the point 1.5 units ahead of its center, which is the same cell offset for every cell.
+
+    For a goal, a breadth first search backward from all states within the goal radius gives the number
+    of actions needed to reach the goal from every state. These distance fields are cached per goal. """
+
+    MIN_POS, MAX_POS = 225.0, 275.0
+    CELL_SIZE = 0.5
+    NUM_HEADINGS = 24
+    TURN_ANGLE = 15.0
+    FORWARD_DISTANCE = 1.5
+    GOAL_RADIUS = 1.5
+    UNREACHABLE = -1
+
+    def __init__(self, obstacles, num_cached_goals=64):
+        """ obstacles is a list of (x, z, radius) of the circular obstacles of the scene """
+
+        self.num_cells = int(round((NavigationLattice.MAX_POS - NavigationLattice.MIN_POS) /
+                                   NavigationLattice.CELL_SIZE))
+        centers = NavigationLattice.MIN_POS + (np.arange(self.num_cells) + 0.5) * NavigationLattice.CELL_SIZE
+        self.center_x, self.center_z = np.meshgrid(centers, centers, indexing="ij")
+
+        self.free = np.ones((self.num_cells, self.num_cells), dtype=bool)
+        for (obstacle_x, obstacle_z, radius) in obstacles:
+            dist = ((self.center_x - obstacle_x) ** 2 + (self.center_z - obstacle_z) ** 2) ** 0.5
+            self.free &= dist >= radius
+
+        # Cell offset of moving forward with each heading and the cells from which it is possible
+        self.forward_offsets = []
+        self.can_move_forward = []
+        for heading in range(0, NavigationLattice.NUM_HEADINGS):
+            pose = heading * NavigationLattice.TURN_ANGLE
+            pose_x = np.cos((90.0 - pose) * math.pi / 180.0)
+            pose_z = np.sin((90.0 - pose) * math.pi / 180.0)
+            offset_x = int(math.floor(0.5 + NavigationLattice.FORWARD_DISTANCE * pose_x / NavigationLattice.CELL_SIZE))
+            offset_z = int(math.floor(0.5 + NavigationLattice.FORWARD_DISTANCE * pose_z / NavigationLattice.CELL_SIZE))
+            self.forward_offsets.append((offset_x, offset_z))
+            self.can_move_forward.append(NavigationLattice.shift(self.free, offset_x, offset_z))
+
+        self.distance_fields = LRUCache(maxsize=num_cached_goals)
+
+    @staticmethod
+    def shift(array, offset_x, offset_z):
+        """ Returns out with out[i, j] = array[i + offset_x, j + offset_z] and False outside the array """
+        num_x, num_z = array.shape
+        out = np.zeros(array.shape, dtype=bool)
+        out[max(0, -offset_x): num_x - max(0, offset_x), max(0, -offset_z): num_z - max(0, offset_z)] = \
+            array[max(0, offset_x): num_x - max(0, -offset_x), max(0, offset_z): num_z - max(0, -offset_z)]
+        return out
+
+    def get_state_index(self, x, z, pose):
+        """ Index of the lattice state containing the state (x, z, pose) """
+        i = min(max(int(math.floor((x - NavigationLattice.MIN_POS) / NavigationLattice.CELL_SIZE)), 0),
+                self.num_cells - 1)
+        j = min(max(int(math.floor((z - NavigationLattice.MIN_POS) / NavigationLattice.CELL_SIZE)), 0),
+                self.num_cells - 1)
+        heading = int(math.floor(pose / NavigationLattice.TURN_ANGLE + 0.5)) % NavigationLattice.NUM_HEADINGS
+        return i, j, heading
+
+    def get_distance_field(self, goal_x, goal_z):
+        """ Array of the number of actions to reach the goal from every lattice state, or UNREACHABLE """
+
+        key = (goal_x, goal_z)
+        distance_field = self.distance_fields.get(key)
+        if distance_field is None:
+            distance_field = self.compute_distance_field(goal_x, goal_z)
+            self.distance_fields[key] = distance_field
+        return distance_field
+
+    def compute_distance_field(self, goal_x, goal_z):
+
+        goal_dist = ((self.center_x - goal_x) ** 2 + (self.center_z - goal_z) ** 2) ** 0.5
+        frontier = np.repeat((goal_dist < NavigationLattice.GOAL_RADIUS)[:, :, np.newaxis],
+                             NavigationLattice.NUM_HEADINGS, axis=2)
+
+        distance_field = np.full(frontier.shape, NavigationLattice.UNREACHABLE, dtype=np.int32)
+        distance_field[frontier] = 0
+        level = 0
+
+        while frontier.any():
+
+            # Turning right from heading h reaches h + 1 and turning left reaches h - 1
+            reached = np.roll(frontier, -1, axis=2) | np.roll(frontier, 1, axis=2)
+
+            for heading, (offset_x, offset_z) in enumerate(self.forward_offsets):
+                reached[:, :, heading] |= NavigationLattice.shift(frontier[:, :, heading], offset_x, offset_z) & \
+                                          self.can_move_forward[heading]
+
+            frontier = reached & (distance_field == NavigationLattice.UNREACHABLE)
+            level += 1
+            distance_field[frontier] = level
+
+        return distance_field
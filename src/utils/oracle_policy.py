@@ -1,11 +1,18 @@
 import math
 import heapq
+import logging
 import numpy as np
+
+from cachetools import LRUCache
 from utils.nav_drone_landmarks import get_landmark_radius
+from utils.navigation_lattice import NavigationLattice
 
 MAX_SEARCH_NUM = 1500  # 100000
 CORNER_LANDMARKS = {"NECorner", "SECorner", "NWCorner", "SWCorner"}
 
+# Navigation lattice of every scene, keyed by its landmark positions
+navigation_lattice_cache = LRUCache(maxsize=256)
+
 
 def oracle_policy(metadata, goal_x, goal_z, data_point):
     trajectory = get_oracle_trajectory(metadata, goal_x, goal_z, data_point)
@@ -15,7 +22,105 @@ def oracle_policy(metadata, goal_x, goal_z, data_point):
         return "Stop"
 
 
+def get_navigation_lattice(landmark_pos_dict):
+    key = tuple(sorted([(landmark, tuple(pos)) for landmark, pos in landmark_pos_dict.items()]))
+    lattice = navigation_lattice_cache.get(key)
+    if lattice is None:
+        obstacles = [(landmark_x, landmark_z, get_landmark_radius(landmark))
+                     for landmark, (landmark_x, landmark_z) in landmark_pos_dict.items()
+                     if landmark not in CORNER_LANDMARKS]
+        lattice = NavigationLattice(obstacles)
+        navigation_lattice_cache[key] = lattice
+    return lattice
+
+
 def get_oracle_trajectory(metadata, goal_x, goal_z, data_point):
+    """ Trajectory to the goal using A* search guided by the distance field of the navigation lattice of
+    the scene, which is computed once per scene and goal. The field is the number of actions to the goal
+    up to the discretization of the lattice, so the search expands little more than the states on the
+    trajectory. Because of the discretization the field can overestimate the number of actions, so the
+    trajectory is not guaranteed to be the shortest one.
+
+    If the start state is in an unreachable cell of the lattice or the guided search does not reach the
+    goal in MAX_SEARCH_NUM expansions, the trajectory of get_oracle_trajectory_search is returned, so the
+    oracle reaches the goal whenever the unguided search does. The fallback starts from scratch: in the
+    worst case both searches expand MAX_SEARCH_NUM states, but the guided expansions are cheap (they do
+    not compute the heuristic of the unguided search) and continuing the unguided search from the guided
+    frontier reaches fewer goals than restarting it. """
+
+    landmark_pos_dict = data_point.get_landmark_pos_dict()
+    lattice = get_navigation_lattice(landmark_pos_dict)
+    distance_field = lattice.get_distance_field(goal_x, goal_z)
+    start_state = (metadata["x_pos"], metadata["z_pos"], metadata["y_angle"])
+
+    trajectory = search_distance_field(start_state, goal_x, goal_z, landmark_pos_dict, lattice, distance_field)
+    if trajectory is None:
+        return get_oracle_trajectory_search(metadata, goal_x, goal_z, data_point)
+    return trajectory
+
+
+def search_distance_field(start_state, goal_x, goal_z, landmark_pos_dict, lattice, distance_field):
+    """ A* search from start_state with the distance field as heuristic. Continuous states whose cell is
+    unreachable in the lattice are not pruned since the cell center can be inside an obstacle when the state
+    is not; they get the heuristic of the unguided search instead. Returns None if the start cell is
+    unreachable or the goal is not found in MAX_SEARCH_NUM expansions. """
+
+    start_distance = distance_field[lattice.get_state_index(*start_state)]
+    if start_distance == NavigationLattice.UNREACHABLE:
+        return None
+
+    frontier = []
+    heapq.heappush(frontier, (start_distance, start_distance, start_state))
+    came_from = {start_state: None}
+    cost_so_far = {start_state: 0}
+
+    goal_state = None
+    num_expanded = 0
+    while len(frontier) > 0:
+        _, _, current = heapq.heappop(frontier)
+        num_expanded += 1
+        if is_terminal(current, goal_x, goal_z):
+            goal_state = current
+            break
+
+        if num_expanded > MAX_SEARCH_NUM:
+            break
+
+        for action in ("Forward", "TurnRight", "TurnLeft"):
+            next_state = successor(current, action, landmark_pos_dict)
+            if next_state is None:
+                continue
+
+            if is_terminal(next_state, goal_x, goal_z):
+                next_distance = 0
+            else:
+                next_distance = distance_field[lattice.get_state_index(*next_state)]
+                if next_distance == NavigationLattice.UNREACHABLE:
+                    next_distance = heuristic(next_state, goal_x, goal_z, landmark_pos_dict)
+
+            new_cost = cost_so_far[current] + 1
+            if next_state not in cost_so_far or new_cost < cost_so_far[next_state]:
+                cost_so_far[next_state] = new_cost
+                heapq.heappush(frontier, (new_cost + next_distance, next_distance, next_state))
+                came_from[next_state] = current, action
+
+    if goal_state is None:
+        logging.warning("Guided oracle search did not reach the goal (%r, %r) from %r in %r expansions",
+                        goal_x, goal_z, start_state, MAX_SEARCH_NUM)
+        return None
+
+    actions_reverse = []
+    s = goal_state
+    while came_from[s] is not None:
+        s, action = came_from[s]
+        actions_reverse.append(action)
+
+    return actions_reverse[::-1]
+
+
+def get_oracle_trajectory_search(metadata, goal_x, goal_z, data_point):
+    """ Shortest trajectory to the goal using A* search. If the goal is not found in MAX_SEARCH_NUM
+    expansions then the trajectory to the closest state is returned. """
     drone_x, drone_z = metadata["x_pos"], metadata["z_pos"]
     drone_pose = metadata["y_angle"]
     landmark_pos_dict = data_point.get_landmark_pos_dict()
@@ -0,0 +1,146 @@
+import os
+import json
+import argparse
+import logging
+import numpy as np
+
+
+class PackedImageDataset:
+    """ Images of a dataset packed into a single contiguous file which is memory mapped on load.
+    The dataset is a list of examples where every example is a sequence of images (e.g., one image
+    per step of a trajectory) of the same shape and type. Frames of example i are stored at
+    offsets[i]: offsets[i + 1] of the packed file.
+
+    Loading takes constant time, only the frames which are touched are read from the disk, and
+    processes that load the same packed file share one copy of it through the OS page cache.
+
+    For a dataset in folder_name the frames are stored in folder_name + ".frames" and the index
+    in folder_name + ".index.json", next to the folder (a trailing slash in folder_name is ignored).
+    Use pack to create them once (see main). """
+
+    FRAMES_SUFFIX = ".frames"
+    INDEX_SUFFIX = ".index.json"
+
+    def __init__(self, frames, offsets):
+        self.frames = frames
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """ Returns a read-only array of shape num_frames x image_shape for example i """
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Example index %r out of range" % i)
+        return self.frames[self.offsets[i]: self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+
+    def get_num_frames(self, i):
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    @staticmethod
+    def get_file_name(folder_name, suffix):
+        # Normalize so that "dataset/" does not put the files inside the folder
+        return os.path.normpath(folder_name) + suffix
+
+    @staticmethod
+    def exists(folder_name):
+        return os.path.exists(PackedImageDataset.get_file_name(folder_name, PackedImageDataset.INDEX_SUFFIX))
+
+    @staticmethod
+    def load(folder_name):
+        with open(PackedImageDataset.get_file_name(folder_name, PackedImageDataset.INDEX_SUFFIX)) as f:
+            index = json.load(f)
+
+        offsets = np.array(index["offsets"], dtype=np.int64)
+        shape = (int(offsets[-1]),) + tuple(index["image_shape"])
+        if shape[0] == 0:
+            frames = np.zeros(shape, dtype=index["dtype"])
+        else:
+            frames = np.memmap(PackedImageDataset.get_file_name(folder_name, PackedImageDataset.FRAMES_SUFFIX),
+                               dtype=index["dtype"], mode="r", shape=shape)
+        return PackedImageDataset(frames, offsets)
+
+    @staticmethod
+    def load_if_exists(folder_name):
+        """ Returns the packed dataset of this folder or None if it has not been packed """
+        if PackedImageDataset.exists(folder_name):
+            logging.info("Loading packed images of %r", folder_name)
+            return PackedImageDataset.load(folder_name)
+        return None
+
+    @staticmethod
+    def pack(examples, folder_name):
+        """ Pack an iterable over examples, each a list of images, for the dataset in folder_name.
+        Examples are consumed one at a time so the dataset never needs to fit in memory. """
+
+        offsets = [0]
+        image_shape, dtype = None, None
+        frames_file_name = PackedImageDataset.get_file_name(folder_name, PackedImageDataset.FRAMES_SUFFIX)
+
+        with open(frames_file_name, "wb") as frames_file:
+            for images in examples:
+                for image in images:
+                    image = np.asarray(image)
+                    if image_shape is None:
+                        image_shape, dtype = image.shape, image.dtype
+                    elif image.shape != image_shape or image.dtype != dtype:
+                        raise AssertionError("All images must have shape %r and type %r. Found %r and %r" %
+                                             (image_shape, dtype, image.shape, image.dtype))
+                    frames_file.write(np.ascontiguousarray(image).tobytes())
+                offsets.append(offsets[-1] + len(images))
+
+        # The index is written last so that a partially packed dataset is never loaded
+        index = {"offsets": offsets, "image_shape": list(image_shape or []), "dtype": str(dtype or "uint8")}
+        with open(PackedImageDataset.get_file_name(folder_name, PackedImageDataset.INDEX_SUFFIX), "w") as f:
+            json.dump(index, f)
+
+        logging.info("Packed %r images of %r examples into %r", offsets[-1], len(offsets) - 1, frames_file_name)
+
+
+def main():
+    """ Pack the images of a dataset folder used by one of the from-disk learners """
+
+    parser = argparse.ArgumentParser(description="Pack images of a from-disk dataset into a single file")
+    parser.add_argument("folder_name", type=str, help="dataset folder containing the example_i folders")
+    parser.add_argument("--learner", type=str, default="goal_prediction",
+                        help="one of goal_prediction, unet, single_image, single_360_numpy, single_360_png, blocks")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.learner == "goal_prediction":
+        from learning.single_client.goal_prediction_supervised_from_disk import \
+            GoalPredictionSupervisedLearningFromDisk
+        examples = GoalPredictionSupervisedLearningFromDisk.read_images(args.folder_name)
+    elif args.learner == "unet":
+        from learning.single_client.unet_goal_prediction_supervised_from_disk import \
+            UnetGoalPredictionSupervisedLearningFromDisk
+        examples = UnetGoalPredictionSupervisedLearningFromDisk.read_images(args.folder_name)
+    elif args.learner == "single_image":
+        from learning.single_client.goal_prediction_single_image_supervised_from_disk import \
+            GoalPredictionSingleImageSupervisedLearningFromDisk
+        examples = GoalPredictionSingleImageSupervisedLearningFromDisk.read_images(args.folder_name)
+    elif args.learner == "single_360_numpy" or args.learner == "single_360_png":
+        from learning.single_client.goal_prediction_single_360_image_supervised_from_disk import \
+            GoalPredictionSingle360ImageSupervisedLearningFromDisk
+        format_type = args.learner[len("single_360_"):]
+        examples = GoalPredictionSingle360ImageSupervisedLearningFromDisk.read_images(args.folder_name, format_type)
+    elif args.learner == "blocks":
+        from learning.single_client.blocks_goal_prediction_supervised_from_disk import \
+            BlockGoalPredictionSupervisedLearningFromDisk
+        examples = BlockGoalPredictionSupervisedLearningFromDisk.read_images(args.folder_name)
+    else:
+        raise AssertionError("Unknown learner " + str(args.learner))
+
+    PackedImageDataset.pack(examples, args.folder_name)
+
+
+if __name__ == "__main__":
+    main()
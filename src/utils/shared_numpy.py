@@ -0,0 +1,15 @@
+import numpy as np
+import torch
+
+
+def share_numpy(array):
+    """ Copies the numpy array into a tensor in shared memory. The tensor can be sent to processes
+    started with torch.multiprocessing, which attach to the same memory instead of copying it. """
+    return torch.from_numpy(np.ascontiguousarray(array)).share_memory_()
+
+
+def numpy_view(tensor):
+    """ Read-only numpy array viewing the memory of the tensor """
+    array = tensor.numpy()
+    array.flags.writeable = False
+    return array
@@ -1,17 +1,38 @@
 import os
+import queue
+import threading
+import numpy as np
+import torch
 
+from multiprocessing.util import Finalize
 from tensorboardX import SummaryWriter
 
 
 class Tensorboard:
+    """ Writes summaries for Tensorboard. Logging only puts the summary on a queue and a background thread
+    writes all queued summaries in batches, so that logging never waits on the writer. Histograms are
+    computed by the background thread from a snapshot of at most max_histogram_samples sampled values.
 
-    def __init__(self, experiment, log_dir="tensorboard_logs"):
+    Every worker of an asynchronous learner can have its own Tensorboard. Worker 0 writes to the directory
+    of the experiment and any other worker to a worker_<id> run inside it, so that Tensorboard shows the
+    summaries of all the workers together. Queued summaries are written when the process exits. """
+
+    def __init__(self, experiment, log_dir="tensorboard_logs", worker_id=None, max_histogram_samples=10000):
         experiment_name = experiment.split("/")[-1]
         save_dir = os.path.join(log_dir, experiment_name)
+        if worker_id is not None and worker_id != 0:
+            save_dir = os.path.join(save_dir, "worker_%r" % worker_id)
         self.writer = SummaryWriter(save_dir)
         self.index_dict = dict()
+        self.max_histogram_samples = max_histogram_samples
 
-    def log_scalar(self, name, value, index=-1):
+        self.summary_queue = queue.Queue()
+        self.writer_thread = threading.Thread(target=self._write_summaries)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+        Finalize(self, self.close, exitpriority=100)
+
+    def _get_index(self, name, index):
         if index == -1:
             if name in self.index_dict:
                 self.index_dict[name] += 1
@@ -19,17 +40,52 @@ class Tensorboard:
             else:
                 self.index_dict[name] = 1
                 index = 1
-        self.writer.add_scalar(name, value, index)
+        return index
+
+    def _write_summaries(self):
+        while True:
+            summaries = [self.summary_queue.get()]
+            while not self.summary_queue.empty():
+                summaries.append(self.summary_queue.get())
+
+            for summary in summaries:
+                if summary is None:
+                    self.writer.close()
+                    return
+                summary_type, name, value, index, bins = summary
+                if summary_type == "scalar":
+                    self.writer.add_scalar(name, value, index)
+                else:
+                    self.writer.add_histogram(name, value, index, bins)
+
+    def log_scalar(self, name, value, index=-1):
+        self.summary_queue.put(("scalar", name, value, self._get_index(name, index), None))
 
     def log_histogram(self, name, value, bins, index=-1):
-        if index == -1:
-            if name in self.index_dict:
-                self.index_dict[name] += 1
-                index = self.index_dict[name]
-            else:
-                self.index_dict[name] = 1
-                index = 1
-        self.writer.add_histogram(name, value, index, bins)
+        value = np.asarray(value).reshape(-1)
+        if value.size > self.max_histogram_samples:
+            value = value[np.random.randint(0, value.size, self.max_histogram_samples)]
+        else:
+            # Snapshot since the array may be modified before it is written
+            value = value.copy()
+        self.summary_queue.put(("histogram", name, value, self._get_index(name, index), bins))
+
+    def sample_tensor(self, tensor):
+        """ Returns a numpy snapshot of at most max_histogram_samples values sampled from the tensor.
+        The sample is taken on the device of the tensor so that only the sample is copied to the CPU. """
+        values = tensor.contiguous().view(-1)
+        if values.numel() > self.max_histogram_samples:
+            indices = torch.from_numpy(np.random.randint(0, values.numel(), self.max_histogram_samples))
+            if values.is_cuda:
+                indices = indices.cuda()
+            values = values.index_select(0, indices)
+        return values.cpu().numpy()
+
+    def close(self):
+        """ Writes all the queued summaries and closes the writer """
+        if self.writer_thread.is_alive():
+            self.summary_queue.put(None)
+            self.writer_thread.join()
 
     def log(self, cross_entropy, loss, reward):
         self.log_scalar("cross_entropy", cross_entropy)
@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+
+from utils.edit_distance import levenshtein_distance
+
+
+def reference_levenshtein_distance(seq1, seq2):
+    """ Full table implementation which levenshtein_distance must match exactly """
+
+    n = len(seq1)
+    m = len(seq2)
+
+    if n == 0 or m == 0:
+        return max(n, m)
+
+    levenshtein = np.zeros((n + 1, m + 1), dtype=np.int32)
+    for i in range(0, n + 1):
+        for j in range(0, m + 1):
+            if min(i, j) == 0:
+                levenshtein[i, j] = max(i, j)
+            else:
+                levenshtein[i, j] = min(levenshtein[i - 1, j] + 1,
+                                        levenshtein[i, j - 1] + 1,
+                                        levenshtein[i - 1, j - 1] + (0 if seq1[i - 1] == seq2[j - 1] else 1))
+
+    return levenshtein[n, m]
+
+
+class TestLevenshteinDistance(unittest.TestCase):
+
+    def test_examples(self):
+        self.assertEqual(levenshtein_distance("kitten", "sitting"), 3)
+        self.assertEqual(levenshtein_distance("", "abc"), 3)
+        self.assertEqual(levenshtein_distance("abc", ""), 3)
+        self.assertEqual(levenshtein_distance("abc", "abc"), 0)
+        self.assertEqual(levenshtein_distance(["go", "left"], ["go", "right", "left"]), 1)
+
+    def test_same_as_reference(self):
+        rng = np.random.RandomState(0)
+        for _ in range(0, 500):
+            alphabet_size = rng.randint(1, 6)
+            seq1 = [str(symbol) for symbol in rng.randint(0, alphabet_size, size=rng.randint(0, 15))]
+            seq2 = [str(symbol) for symbol in rng.randint(0, alphabet_size, size=rng.randint(0, 15))]
+            distance = levenshtein_distance(seq1, seq2)
+            self.assertIsInstance(distance, int)
+            self.assertEqual(distance, reference_levenshtein_distance(seq1, seq2))
+
+
+if __name__ == "__main__":
+    unittest.main()
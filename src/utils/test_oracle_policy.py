@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+
+from utils.nav_drone_landmarks import get_all_landmark_names, get_landmark_radius
+from utils.oracle_policy import CORNER_LANDMARKS, get_oracle_trajectory, get_oracle_trajectory_search, \
+    is_terminal, successor
+
+
+class SceneDataPoint:
+    def __init__(self, landmark_pos_dict):
+        self.landmark_pos_dict = landmark_pos_dict
+
+    def get_landmark_pos_dict(self):
+        return self.landmark_pos_dict
+
+
+class TestOracleTrajectory(unittest.TestCase):
+    """ The oracle guided by the navigation lattice must reach the goal whenever the unguided A* search
+    of get_oracle_trajectory_search does """
+
+    NUM_SCENES = 100
+    NUM_LANDMARKS = 6
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.landmark_names = [landmark for landmark in get_all_landmark_names()
+                               if landmark not in CORNER_LANDMARKS]
+
+    def random_free_position(self, landmark_pos_dict):
+        while True:
+            x, z = self.rng.uniform(226.0, 274.0, size=2)
+            if all(((x - l_x) ** 2 + (z - l_z) ** 2) ** 0.5 >= get_landmark_radius(landmark)
+                   for landmark, (l_x, l_z) in landmark_pos_dict.items()):
+                return x, z
+
+    def random_scene(self):
+        landmarks = self.rng.choice(self.landmark_names, size=TestOracleTrajectory.NUM_LANDMARKS, replace=False)
+        landmark_pos_dict = {landmark: tuple(self.rng.uniform(225.0, 275.0, size=2)) for landmark in landmarks}
+        x, z = self.random_free_position(landmark_pos_dict)
+        metadata = {"x_pos": x, "z_pos": z, "y_angle": 15.0 * self.rng.randint(0, 24)}
+        goal_x, goal_z = self.random_free_position(landmark_pos_dict)
+        return metadata, goal_x, goal_z, SceneDataPoint(landmark_pos_dict)
+
+    @staticmethod
+    def reaches_goal(trajectory, metadata, goal_x, goal_z, data_point):
+        state = (metadata["x_pos"], metadata["z_pos"], metadata["y_angle"])
+        for action in trajectory:
+            state = successor(state, action, data_point.get_landmark_pos_dict())
+            if state is None:
+                return False
+        return is_terminal(state, goal_x, goal_z)
+
+    def test_success_parity_with_search(self):
+        num_search_successes, num_successes = 0, 0
+        for _ in range(0, TestOracleTrajectory.NUM_SCENES):
+            scene = self.random_scene()
+            search_success = self.reaches_goal(get_oracle_trajectory_search(*scene), *scene)
+            success = self.reaches_goal(get_oracle_trajectory(*scene), *scene)
+            if search_success:
+                self.assertTrue(success, "Oracle did not reach the goal reached by the search in %r" % (scene,))
+            num_search_successes += int(search_success)
+            num_successes += int(success)
+        self.assertGreaterEqual(num_successes, num_search_successes)
+
+
+if __name__ == "__main__":
+    unittest.main()
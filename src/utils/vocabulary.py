@@ -0,0 +1,99 @@
+import os
+import nltk
+import logging
+
+from collections import Counter
+
+
+class Vocabulary:
+    """ Maps tokens to ids. A vocabulary file is loaded once per process and shared by everything that
+    loads it. Tokenized texts are cached, so recurring instructions such as the instruction received on
+    every reset of the blocks simulator are tokenized once.
+
+    Tokens not in the vocabulary are mapped to the unknown token if the vocabulary has one and dropped
+    otherwise. They are counted and each is logged the first time it is seen. """
+
+    UNK_TOKEN = "$UNK$"
+    NLTK, SPLIT = "nltk", "split"
+
+    # Vocabularies loaded in this process by vocab file name and settings
+    loaded_vocabularies = dict()
+
+    def __init__(self, tokens, unk_token=None):
+        self.token_to_id = dict()
+        self.id_to_token = dict()
+        for i, token in enumerate(tokens):
+            self.token_to_id[token] = i
+            self.id_to_token[i] = token
+        if unk_token is not None:
+            self.unk_id = len(tokens)
+            self.token_to_id[unk_token] = self.unk_id
+            self.id_to_token[self.unk_id] = unk_token
+        else:
+            self.unk_id = None
+        self.num_ids = len(self.id_to_token)
+
+        self.tokenized_texts = dict()
+        self.unknown_token_counts = Counter()
+
+    @staticmethod
+    def load(vocab_file, lower=False, unk_token=None):
+        """ Vocabulary with one token per line of the vocab file followed by the unknown token, if any """
+
+        key = (os.path.abspath(vocab_file), lower, unk_token)
+        vocabulary = Vocabulary.loaded_vocabularies.get(key)
+        if vocabulary is None:
+            with open(vocab_file) as f:
+                tokens = [line.strip() for line in f.readlines()]
+            if lower:
+                tokens = [token.lower() for token in tokens]
+            vocabulary = Vocabulary(tokens, unk_token)
+            Vocabulary.loaded_vocabularies[key] = vocabulary
+        return vocabulary
+
+    def size(self):
+        return self.num_ids
+
+    def get_id(self, token):
+        """ Id of the token, or of the unknown token (None if there is none) """
+        token_id = self.token_to_id.get(token)
+        if token_id is None:
+            if token not in self.unknown_token_counts:
+                logging.warning("Out of vocabulary word %r", token)
+            self.unknown_token_counts[token] += 1
+            return self.unk_id
+        return token_id
+
+    def convert_to_ids(self, tokens):
+        token_ids = [self.get_id(token) for token in tokens]
+        if self.unk_id is None:
+            token_ids = [token_id for token_id in token_ids if token_id is not None]
+        return token_ids
+
+    def tokenize(self, text, tokenizer=NLTK, lower=False):
+        """ List of the token ids of the text, split into tokens with nltk or on whitespace """
+
+        key = (text, tokenizer, lower)
+        token_ids = self.tokenized_texts.get(key)
+        if token_ids is None:
+            if tokenizer == Vocabulary.NLTK:
+                tokens = nltk.word_tokenize(text)
+            elif tokenizer == Vocabulary.SPLIT:
+                tokens = text.split()
+            else:
+                raise AssertionError("Unknown tokenizer " + str(tokenizer))
+            if lower:
+                tokens = [token.lower() for token in tokens]
+            token_ids = tuple(self.convert_to_ids(tokens))
+            self.tokenized_texts[key] = token_ids
+        return list(token_ids)
+
+    def tokenize_all(self, texts, tokenizer=NLTK, lower=False):
+        """ Tokenizes a dataset of texts and logs how many tokens were unknown """
+
+        num_unknown = sum(self.unknown_token_counts.values())
+        token_ids_list = [self.tokenize(text, tokenizer, lower) for text in texts]
+        num_tokens = sum([len(token_ids) for token_ids in token_ids_list])
+        logging.info("Tokenized %r texts with %r tokens of which %r are out of vocabulary",
+                     len(texts), num_tokens, sum(self.unknown_token_counts.values()) - num_unknown)
+        return token_ids_list